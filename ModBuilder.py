@@ -1,32 +1,76 @@
 import os
+import io
+import sys
 import json
+import argparse
+import contextlib
+import functools
+import tempfile
+import concurrent.futures
 import pathlib
-import re
-import subprocess
-import shutil
 import pythonfiles.mapper as mapper
 import pythonfiles.readAnimAsset as ream
+import pythonfiles.buildManifest as manifests
+import pythonfiles.pakFile as pakFile
+import pythonfiles.fileCopier as fileCopier
+import pythonfiles.watcher as watcher
+import pythonfiles.buildTrace as buildTrace
+import pythonfiles.buildPipeline as buildPipeline
+import pythonfiles.packerRunner as packerRunner
+import pythonfiles.mappingRegistry as mappingRegistry
+import pythonfiles.skeletonLibrary as skeletonLibrary
+import pythonfiles.modCatalog as modCatalog
+import pythonfiles.patchPlan as patchPlan
+import pythonfiles.skeletalMesh as skeletalMesh
+import pythonfiles.animSequence as animSequence
 import traceback
 
 # requires python 3.4+
 
 CONFIG_PATH = "config.json"
 MOD_CONFIG_NAME = "modconfig.json"
+MOD_MANIFEST_NAME = "buildmanifest.json"
+MOD_CATALOG_NAME = "modcatalog.json"
+MOD_PATCH_PLAN_NAME = "patchplan.json"
+MOD_ANIM_LAYOUT_NAME = "animlayout.json"
+MOD_FIX_JOURNAL_NAME = "fixjournal.json"
+# files the builder writes to a mod's mapping folder, changing them doesn't change the mod
+MOD_BUILD_FILES = (MOD_MANIFEST_NAME, MOD_CATALOG_NAME, MOD_PATCH_PLAN_NAME, MOD_ANIM_LAYOUT_NAME, MOD_FIX_JOURNAL_NAME)
 MOD_DIR = "mods"
 MAPPING_DIR = "mapping"
+MAPPING_REGISTRY_DIR = "mapping-registry"
+# build status of a mod, shown in the build summary
+BUILD_SUCCEEDED = "built"
+BUILD_UP_TO_DATE = "up to date"
+BUILD_FAILED = "FAILED"
+BUILD_DRY_RUN = "dry run"
+# status of a mod after --revert/--reapply
+FIX_REVERTED = "reverted"
+FIX_REAPPLIED = "reapplied"
+FIX_NOT_RECORDED = "no fixes"
+# which program packs the mods, "unrealpak" runs UnrealPak.exe from packer_path, "builtin" uses pythonfiles/pakFile.py
+PAK_WRITER_UNREALPAK = "unrealpak"
+PAK_WRITER_BUILTIN = "builtin"
+# result of fixing the bones of a single animation
+ANIM_FIXED = "fixed"
+ANIM_NOT_FOUND = "not found"
+ANIM_ERROR = "error"
+# build stages, as shown in the --trace output
+STAGE_PREPARE = "prepare"
+STAGE_PULL = "pull"
+STAGE_UP_TO_DATE_CHECK = "up to date check"
+STAGE_BONE_FIX = "bone fix"
+STAGE_PACK = "pack"
+STAGE_MANIFEST = "manifest"
+STAGE_DEPLOY = "deploy"
 
 
-def create_mapping(skel_name, mapping_file_path, working_dir):
-    files = [name for name in os.listdir(working_dir) if os.path.splitext(name)[0] == skel_name]
+def create_mapping(skel_name, mapping_file_path, working_dir, catalog=None):
     # f ind .uasset and .uexp files in dir
-    uasset_file = ''
-    uexp_file = ''
-    for fname in files:
-        if fname.endswith('.uasset'):
-            uasset_file = f"{working_dir}/{fname}"
-        if fname.endswith('.uexp'):
-            uexp_file = f"{working_dir}/{fname}"
-    if uexp_file is None or uasset_file is None:
+    if catalog is None:
+        catalog = modCatalog.ModCatalog.scan(working_dir)
+    (uasset_file, uexp_file) = catalog.pair(f"{working_dir}/{skel_name}")
+    if not uexp_file or not uasset_file:
         print(
             f"WARNING: Unable to find original files in directory {working_dir} to create mappings from for skeleton: {skel_name}")
         return False
@@ -36,78 +80,356 @@ def create_mapping(skel_name, mapping_file_path, working_dir):
     # create and save mapping structure
     mapper.create_mapping_file(mapping_file_path, bone_order, name_mappings)
     # now that the mapping file is created, return the mapping data to be used to update the skeletons
-    return mapper.read_mapping_file(mapping_file_path)
+    return mapper.load_mapping(mapping_file_path)
 
 
-def bone_realignment(mod_name, mod_files, config):
+def bone_realignment(mod_name, catalog, config, manifest=None, dry_run=False):
+    """Fixes the bone order of every skeleton in a mod and the animations that use them.
+    Every edit is planned first and only written once the whole plan is known (with dry_run it's printed instead)"""
     # first, find all the Skel files in the mod
-    skel_files = [file for file in mod_files if file.name.endswith("Skeleton.uasset")]
+    skel_files = catalog.with_role(modCatalog.ROLE_SKELETON)
     mapping_path = f"{MAPPING_DIR}/{mod_name}"
-    anim_regex = config["anim_search_pattern"]
-    anim_files = [file for file in mod_files if re.match(anim_regex, file.name) and file.name.endswith('.uexp')]
+    mapping_catalog = modCatalog.ModCatalog.scan(mapping_path)
+    mod_folder = f"{os.getcwd()}/{MOD_DIR}/{mod_name}"
+    anim_jobs = config.get("anim_fix_jobs", 0)
+    anim_files = catalog.animations(config["anim_search_pattern"])
+    plan = patchPlan.PatchPlan()
+    plan_file = f"{mapping_path}/{MOD_PATCH_PLAN_NAME}" if config.get("cache_patch_plan", True) else None
+    plan_cache = patchPlan.PlanCache.load(plan_file) if plan_file is not None else None
+    layout_file = f"{mapping_path}/{MOD_ANIM_LAYOUT_NAME}" if config.get("cache_anim_layouts", True) else None
+    layout_cache = animSequence.AnimLayoutCache.load(layout_file) if layout_file is not None else None
+    # a dry run writes nothing: mappings it needs are made in a temporary folder and the caches aren't saved
+    scratch = tempfile.TemporaryDirectory() if dry_run else None
+    # original skeleton mappings shared by every mod, see mappingRegistry.py
+    registry_folder = config.get("mapping_registry", MAPPING_REGISTRY_DIR)
+    registry = None
+    if registry_folder:
+        registry = mappingRegistry.shared_registry(registry_folder) if not dry_run \
+            else mappingRegistry.MappingRegistry.load(registry_folder, scratch.name)
+    # index of the game's original skeletons, used when the mod has no copy of the original. See skeletonLibrary.py
+    library_file = config.get("skeleton_library", skeletonLibrary.DEFAULT_LIBRARY_FILE)
+    if library_file and not os.path.isfile(library_file):
+        library_file = None
+    # animations fixed by a previous (incremental) build are already in the right order, never remap them twice
+    already_fixed = [file for file in anim_files if manifests.is_bone_fixed(manifest, file, mod_folder)]
+    anim_files = [file for file in anim_files if file not in already_fixed]
+    if len(already_fixed) > 0:
+        print(f"Skipping {len(already_fixed)} animations that were already fixed")
+    # skeletal meshes have their own copy of their skeleton's bones, they're fixed with the same mapping as the skeleton
+    mesh_files = [file.with_suffix(".uexp") for file in catalog.with_role(modCatalog.ROLE_MESH)] \
+        if config.get("fix_meshes", True) else []
+    mesh_files = [file for file in mesh_files
+                  if file in catalog and not manifests.is_bone_fixed(manifest, file, mod_folder)]
+    fixed_files = []
+    deleted_skeletons = []
+    remapped_skeletons = set()
+    # every animation is only remapped by the skeleton it was made for
+    anim_index = skeleton_animation_index(anim_files)
+    mesh_index = skeleton_animation_index(mesh_files)
+    previous_remaps = manifest["remaps"] if manifest is not None else {}
+    skeleton_count = len(skel_files) + sum(1 for name in previous_remaps
+                                           if name not in (os.path.splitext(file.name)[0] for file in skel_files))
+    for index in (anim_index, mesh_index):
+        if None in index and skeleton_count == 1:
+            # only one skeleton to choose from, that one must be it
+            index.setdefault("", []).extend(index.pop(None))
 
-    if len(skel_files) == 0:
+    if len(skel_files) == 0 and not previous_remaps:
         print("Could not find any skeletons to fix bones for")
     # next, check that we have a mapping file set up, or the files needed to create a mapping file
     # this runs for each unique skeleton found in the mod's subdirectories (usually 1 but can be more)
-    if len(skel_files) > 1:
-        print(
-            "This tool currently does not correctly support fixing the animations for mods with multiple skeleton files. if this becomes an issue, let me know")
     for skel_file in skel_files:
         file_name = skel_file.name
         name = os.path.splitext(file_name)[0]
         mapping_file_name = f"{name}-map.json"
-        # check if mapping file exists
+        remapped_skeletons.add(name)
+        # now that we have the mapping data, time to get the .uasset and .uexp files for the skeleton that we want to edit
+        (uasset, uexp) = catalog.pair(skel_file)
+        package_path = ream.read_package_path(uasset)
+        skeleton_anims = take_skeleton_animations(anim_index, package_path, name, skeleton_count)
+        skeleton_meshes = take_skeleton_animations(mesh_index, package_path, name, skeleton_count)
         mapping_file_path = pathlib.Path(f"{mapping_path}/{mapping_file_name}")
-        if not mapping_file_path.parent.exists():
-            mapping_file_path.parent.mkdir(exist_ok=True, parents=True)
-        mapping_data = {}
-        if mapping_file_path.exists():
-            mapping_data = mapper.read_mapping_file(mapping_file_path)
-        elif file_name in os.listdir(mapping_path):
-            mapping_data = create_mapping(name, mapping_file_path, mapping_path)
+        if not mapping_file_path.exists() and registry is not None:
+            # a mapping file in the mod's mapping folder comes first, otherwise the mapping of the original skeleton is
+            # shared with every other mod through the registry
+            (original_uasset, original_uexp) = mapping_catalog.pair(f"{mapping_path}/{file_name}")
+            registry_mapping = registry.resolve(package_path, original_uasset, original_uexp)
+            if registry_mapping is not None:
+                mapping_file_path = pathlib.Path(registry_mapping)
+                print(f"Using mapping {mapping_file_path.name} from the mapping registry for Skeleton: {name}")
+
+        if manifest is not None and manifests.is_bone_fixed(manifest, uexp, mod_folder) and name in manifest["remaps"]:
+            # skeleton was fixed in a previous build, reuse the remap it was fixed with for any new animations
+            print(f"Skeleton {name} is already fixed")
+            bone_index_remap = ream.dense_bone_index_remap(manifest["remaps"][name])
+            fixed_files += plan_animations(skeleton_anims, bone_index_remap, plan, anim_jobs, plan_cache,
+                                           layout_cache)
+            fixed_files += plan_meshes(skeleton_meshes, mapping_file_path, plan, plan_cache, not dry_run)
         else:
-            print(
-                f"WARNING: Unable to find/create mapping file for skeleton file asset: {skel_file}\nmake sure you have a copy of the original skeleton.uasset &.uexp in the mapping folder for this mod")
-            continue
-        if not mapping_data:
-            print(
-                f"unable to read mapping file data: {mapping_file_path}\nmake sure you have a copy of the original skeleton.uasset &.uexp in the mapping folder for this mod")
-            continue
-        # now that we have the mapping data, time to get the .uasset and .uexp files for the skeleton that we want to edit
-        skel_file_dir = os.path.dirname(skel_file)
+            # check if mapping file exists
+            if not mapping_file_path.exists() and dry_run:
+                mapping_file_path = pathlib.Path(f"{scratch.name}/{mapping_file_name}")
+            if not mapping_file_path.parent.exists():
+                mapping_file_path.parent.mkdir(exist_ok=True, parents=True)
+            if not mapping_file_path.exists():
+                if f"{mapping_path}/{file_name}" in mapping_catalog:
+                    create_mapping(name, mapping_file_path, mapping_path, mapping_catalog)
+                else:
+                    library_mapping = mapping_from_library(library_file, name, uasset, uexp, package_path,
+                                                           mapping_file_path, registry) if library_file else None
+                    if library_mapping is None:
+                        print(
+                            f"WARNING: Unable to find/create mapping file for skeleton file asset: {skel_file}\nmake sure you have a copy of the original skeleton.uasset &.uexp in the mapping folder for this mod, or index the original skeletons with pythonfiles/skeletonLibrary.py")
+                        continue
+                    mapping_file_path = library_mapping
+            skeleton_plan = plan_skeleton(uasset, uexp, mapping_file_path, plan_cache, not dry_run) \
+                if mapping_file_path.exists() else None
+            if skeleton_plan is None:
+                print(
+                    f"unable to read mapping file data: {mapping_file_path}\nmake sure you have a copy of the original skeleton.uasset &.uexp in the mapping folder for this mod")
+                continue
 
-        (uasset, uexp) = ream.read_skel_assets_from_dir(skel_file_dir, name)
-        name_mappings = ream.read_uasset(uasset)
-        bone_order = ream.read_skel_uexp(uexp)
+            (skeleton_patches, bone_index_remap, fits) = skeleton_plan
+            if bone_index_remap is not None:
 
-        # sometimes you just need $100 for a new set of bones
-        (new_bones, bone_index_remap) = mapper.bone_order_from_mapping(mapping_data, bone_order, name_mappings)
-        if new_bones is not None:
+                if not fits:
+                    print("WARNING: fixed bone list is larger than original bone list. Skeleton .uasset/.uexp cannot be fixed and needs to be remove before building mod. Animations should still work though.")
+                else:
+                    if config["keep_skeleton"]:  # no point writing a skeleton that gets deleted
+                        plan.add_patches(uexp, skeleton_patches)
+                    fixed_files.append(pathlib.Path(uexp))
+                    print(f"Rebuilt bones for Skeleton: {name}")
+                if manifest is not None:
+                    manifest["remaps"][name] = list(bone_index_remap)
+                # now find and update all animations that use this skeleton
+                fixed_files += plan_animations(skeleton_anims, bone_index_remap, plan, anim_jobs, plan_cache,
+                                           layout_cache)
+                fixed_files += plan_meshes(skeleton_meshes, mapping_file_path, plan, plan_cache, not dry_run)
+            else:
+                print(f"WARNING: Could not rebuild bones for Skeleton: {name}")
+        if not config["keep_skeleton"]:
+            deleted_skeletons.append(os.path.splitext(skel_file)[0])
 
-            if len(new_bones) > len(bone_index_remap):
-                print("WARNING: fixed bone list is larger than original bone list. Skeleton .uasset/.uexp cannot be fixed and needs to be remove before building mod. Animations should still work though.")
+    # skeletons deleted by a previous build (keep_skeleton = false) still need their remap applied to new animations
+    for name, remap in previous_remaps.items():
+        if name not in remapped_skeletons:
+            skeleton_anims = take_skeleton_animations(anim_index, None, name, skeleton_count)
+            skeleton_meshes = take_skeleton_animations(mesh_index, None, name, skeleton_count)
+            if len(skeleton_anims) > 0 or len(skeleton_meshes) > 0:
+                print(f"Using remap of previously fixed Skeleton: {name}")
+                fixed_files += plan_animations(skeleton_anims, ream.dense_bone_index_remap(remap), plan, anim_jobs,
+                                               plan_cache, layout_cache)
+                mapping_file_path = pathlib.Path(f"{mapping_path}/{name}-map.json")
+                if not mapping_file_path.exists() and registry is not None:
+                    mapping_file_path = pathlib.Path(registry.lookup_name(name) or mapping_file_path)
+                fixed_files += plan_meshes(skeleton_meshes, mapping_file_path, plan, plan_cache, not dry_run)
+    for (index, kind) in ((anim_index, "animations"), (mesh_index, "meshes")):
+        for skeleton_path, files in index.items():
+            if skeleton_path is None:
+                print(f"WARNING: Unable to find which skeleton {len(files)} {kind} use, leaving them unchanged: "
+                      f"{', '.join(file.name for file in files)}")
             else:
-                ream.write_skel_uexp_bone_order(uexp, new_bones)
-                print(f"Rebuilt bones for Skeleton: {name}")
-            # now find and update all animations that use this skeleton
+                print(f"{len(files)} {kind} use skeleton {skeleton_path}, which isn't part of this mod. Leaving them unchanged")
+
+    if dry_run:
+        print(f"\nPatch plan for {mod_name}:\n{plan.describe(mod_folder)}")
+        for skeleton in deleted_skeletons:
+            print(f"Would delete Skeleton {skeleton}")
+        scratch.cleanup()
+        return
+    pathlib.Path(mapping_path).mkdir(exist_ok=True, parents=True)
+    if plan_cache is not None:
+        plan_cache.save(plan_file)
+    if layout_cache is not None:
+        layout_cache.save(layout_file)
+    if registry is not None:
+        registry.save()
+
+    # the whole plan is known, now write it. The journal keeps the bytes it overwrites, for --revert
+    journal_file = f"{mapping_path}/{MOD_FIX_JOURNAL_NAME}"
+    journal = patchPlan.PatchJournal.load(journal_file, mod_folder) if config.get("fix_journal", True) else None
+    plan.apply(journal)
+    print(f"Wrote {plan.patched_bytes()} bytes to {len(plan.files)} files")
+    for skeleton in deleted_skeletons:
+        os.remove(f"{skeleton}.uexp")
+        os.remove(f"{skeleton}.uasset")
+        catalog.remove(f"{skeleton}.uexp")
+        catalog.remove(f"{skeleton}.uasset")
+        print(f"Deleted Skeleton {skeleton}")
+
+    # only mark as fixed once every skeleton has been handled, that way each skeleton still sees every animation
+    for file in fixed_files:
+        if file.exists():
+            manifests.mark_bone_fixed(manifest, file, mod_folder)
 
-            for anim_file in anim_files:
-                ream.write_anim_uexp_bone_index_order(anim_file, bone_index_remap)
-                print(f"Bones for animation {anim_file.name} have been fixed")
+
+def mapping_from_library(library_file, name, uasset, uexp, package_path, mapping_file_path, registry=None):
+    """Finds the original of a modded skeleton in the skeleton library by the bone names they share, and creates its
+    mapping: in the registry if the original's exported files are still there, otherwise at mapping_file_path from the
+    bones stored in the library. Returns the mapping file, or None if no original matches"""
+    bone_names = ream.read_skel_uexp(uexp).bone_names(ream.read_uasset(uasset))
+    with skeletonLibrary.SkeletonLibrary.open(library_file, read_only=True) as library:
+        match = library.best_match(bone_names, package_path)
+        if match is None:
+            return None
+        print(f"Skeleton library: {name} matches {match.asset_path} ({match.shared} of its {match.bone_count} bones)")
+        if registry is not None and os.path.isfile(match.uasset) and os.path.isfile(match.uexp):
+            registry_mapping = registry.register(match.uasset, match.uexp)
+            if registry_mapping is not None:
+                return pathlib.Path(registry_mapping)
+        library.write_mapping(match.skeleton_id, mapping_file_path)
+    return mapping_file_path
+
+
+def plan_skeleton(uasset, uexp, mapping_file_path, plan_cache=None, save_compiled=True):
+    """Works out the bone order fix of a skeleton with its mapping file.
+    Returns (skeleton patches, bone index remap, whether the fixed bones fit in the skeleton), with a None remap if the
+    bones couldn't be rebuilt, or None if the mapping file can't be read"""
+    key = None
+    if plan_cache is not None:
+        # the fix only depends on the skeleton's files (checked by the cache) and the mapping
+        key = patchPlan.patch_key("skeleton", manifests.hash_file(uasset), manifests.hash_file(mapping_file_path))
+        cached = plan_cache.lookup(uexp, key)
+        if cached is not None:
+            (patches, extra) = cached
+            remap = ream.dense_bone_index_remap(extra["remap"]) if extra["remap"] is not None else None
+            return patches, remap, extra["fits"]
+
+    mapping_data = mapper.load_mapping(mapping_file_path, save_compiled)
+    if not mapping_data:
+        return None
+    name_mappings = ream.read_uasset(uasset)
+    bone_order = ream.read_skel_uexp(uexp)
+    # sometimes you just need $100 for a new set of bones
+    (new_bones, bone_index_remap) = mapper.bone_order_from_mapping(mapping_data, bone_order, name_mappings)
+    fits = new_bones is not None and len(new_bones) <= len(bone_index_remap)
+    patches = ream.plan_skel_uexp_bone_order(uexp, new_bones) if fits else []
+    if new_bones is None:
+        bone_index_remap = None
+    if plan_cache is not None:
+        plan_cache.store(uexp, key, patches, {
+            "remap": list(bone_index_remap) if bone_index_remap is not None else None, "fits": fits})
+    return patches, bone_index_remap, fits
+
+
+def skeleton_animation_index(anim_files):
+    """Maps the package path of each skeleton to the animations (or meshes) that use it, read from the Skeleton import in
+    every file's .uasset. Files whose skeleton can't be found are listed under None"""
+    index = {}
+    for anim_file in anim_files:
+        uasset = anim_file.with_suffix(".uasset")
+        skeleton_path = ream.read_skeleton_reference(uasset) if uasset.exists() else None
+        index.setdefault(skeleton_path, []).append(anim_file)
+    return index
+
+
+def take_skeleton_animations(anim_index, skeleton_path, skeleton_name, skeleton_count):
+    """Removes and returns the animations (or meshes) of a skeleton from the index, so none are ever remapped by two skeletons.
+    Skeletons are matched by package path, or by name if the path isn't known (e.g. the skeleton was deleted).
+    "" holds the animations of the only skeleton (see bone_realignment)"""
+    anims = anim_index.pop("", []) if skeleton_count == 1 else []
+    for path in list(anim_index):
+        if path is None:
+            continue
+        if path == skeleton_path or (skeleton_path is None and path.rsplit("/", 1)[-1] == skeleton_name):
+            anims += anim_index.pop(path)
+    return anims
+
+
+def plan_meshes(mesh_files, mapping_file_path, plan, plan_cache=None, save_compiled=True):
+    """Works out the bone order fix of the skeletal meshes of a skeleton and adds it to the patch plan, returning the
+    files that will be fixed. Meshes that can't be read are left unchanged"""
+    if len(mesh_files) == 0:
+        return []
+    if not mapping_file_path.exists():
+        print(f"WARNING: Unable to find mapping file {mapping_file_path}, leaving {len(mesh_files)} meshes unchanged")
+        return []
+    mapping_key = manifests.hash_file(mapping_file_path)
+    mapping_data = None
+    fixed_files = []
+    for mesh_file in mesh_files:
+        uasset = mesh_file.with_suffix(".uasset")
+        # the fix depends on the mesh's names and the mapping, the .uexp itself is checked by the cache
+        key = patchPlan.patch_key("mesh", manifests.hash_file(uasset), mapping_key) if plan_cache is not None else None
+        cached = plan_cache.lookup(mesh_file, key) if plan_cache is not None else None
+        if cached is not None:
+            (patches, extra) = cached
+            error = extra["error"]
         else:
-            print(f"WARNING: Could not rebuild bones for Skeleton: {name}")
-        if not config["keep_skeleton"]:
-            skel_file_noext = os.path.splitext(skel_file)[0]
-            os.remove(f"{skel_file_noext}.uexp")
-            os.remove(f"{skel_file_noext}.uasset")
-            print(f"Deleted Skeleton {skel_file_noext}")
+            try:
+                if mapping_data is None:
+                    mapping_data = mapper.load_mapping(mapping_file_path, save_compiled)
+                patches = skeletalMesh.plan_mesh_bone_order(mesh_file, ream.read_uasset(uasset), mapping_data)
+                error = None
+            except skeletalMesh.MeshFormatError as ex:
+                (patches, error) = ([], str(ex))
+            if plan_cache is not None:
+                plan_cache.store(mesh_file, key, patches, {"error": error})
+        if error is None:
+            plan.add_patches(mesh_file, patches)
+            fixed_files.append(mesh_file)
+            print(f"Bones for mesh {mesh_file.name} have been fixed")
+        else:
+            print(f"WARNING: Unable to fix bones for mesh {mesh_file}, leaving it unchanged\n{error}")
+    return fixed_files
 
 
-def copy_cooked_files_to_mod(mod_config, cook_content_folder, mod_name):
-    """Uses the mod config data to copy over the cooked files into the mod"""
-    files_to_copy = mod_config["mod_files"]
+def plan_animation(anim_file, bone_index_remap, remap_key=None, plan_cache=None, layout_cache=None):
+    """Works out the fix of a single animation, returning its ANIM_* result, its patches and the error message if it failed"""
+    try:
+        if plan_cache is not None:
+            cached = plan_cache.lookup(anim_file, remap_key)
+            if cached is not None:
+                (patches, extra) = cached
+                return (ANIM_FIXED if extra["found"] else ANIM_NOT_FOUND), patches, None
+        patch = ream.plan_anim_uexp_bone_index_order(anim_file, bone_index_remap, layout_cache)
+        patches = [patch] if patch is not None else []
+        if plan_cache is not None:
+            plan_cache.store(anim_file, remap_key, patches, {"found": patch is not None})
+        return (ANIM_FIXED if patch is not None else ANIM_NOT_FOUND), patches, None
+    except Exception as ex:
+        return ANIM_ERROR, [], f"{type(ex).__name__}: {ex}"
+
+
+def plan_animations(anim_files, bone_index_remap, plan, jobs=0, plan_cache=None, layout_cache=None):
+    """Works out the bone index order fix of every animation file on a pool of threads and adds it to the patch plan,
+    returning the files that will be fixed. A failure in one animation doesn't stop the others, results are reported in
+    the same order as anim_files"""
+    if len(anim_files) == 0:
+        return []
+    bone_index_remap = ream.dense_bone_index_remap(bone_index_remap)  # convert once, not once per animation
+    remap_key = patchPlan.patch_key("animation", ream.int_array_to_bytes(bone_index_remap))
+    if jobs <= 0:
+        jobs = min(32, (os.cpu_count() or 1) + 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(jobs, len(anim_files))) as pool:
+        results = list(pool.map(buildTrace.wrap(lambda anim_file: plan_animation(anim_file, bone_index_remap, remap_key,
+                                                                                 plan_cache, layout_cache)), anim_files))
+
+    fixed_files = []
+    for anim_file, (result, patches, error) in zip(anim_files, results):
+        if result == ANIM_FIXED:
+            plan.add_patches(anim_file, patches)
+            fixed_files.append(anim_file)
+            print(f"Bones for animation {anim_file.name} have been fixed")
+        elif result == ANIM_NOT_FOUND:
+            print(f"WARNING: Unable to find the bone track table of animation {anim_file}, leaving it unchanged\n"
+                  f"Please let the creator of this tool know.")
+        else:
+            print(f"ERROR: Unable to fix bones for animation {anim_file}\n{error}")
+    counts = dict((result, sum(1 for r, _, _ in results if r == result)) for result in (ANIM_FIXED, ANIM_NOT_FOUND, ANIM_ERROR))
+    print(f"Animations: {counts[ANIM_FIXED]} fixed, {counts[ANIM_NOT_FOUND]} bone order not found, {counts[ANIM_ERROR]} errors")
+    return fixed_files
+
+
+def copy_cooked_files_to_mod(mod_config, cook_content_folder, mod_name, files_to_copy=None, jobs=0, catalog=None):
+    """Uses the mod config data to copy over the cooked files into the mod.
+    Only the files in files_to_copy are copied if given, otherwise every file in the mod config is.
+    Files that already have the same contents in the mod are skipped, copied files are added to the mod's catalog.
+    Returns the CopyStats of the copy"""
+    if files_to_copy is None:
+        files_to_copy = mod_config["mod_files"]
     abs_mod_content_path = mod_config["mod_content_path"]
+    file_pairs = []
     for copy_file in files_to_copy:
         abs_cook_path = pathlib.Path(f"{cook_content_folder}/{copy_file}")
         abs_mod_path = pathlib.Path(f"{abs_mod_content_path}/{copy_file}")
@@ -117,7 +439,12 @@ def copy_cooked_files_to_mod(mod_config, cook_content_folder, mod_name):
         elif not abs_mod_path.parent.exists():
             print(f"Unable to find output path to put cook file in: \n{abs_mod_path}")
         else:
-            shutil.copyfile(abs_cook_path, abs_mod_path)
+            file_pairs.append((abs_cook_path, abs_mod_path))
+    stats = fileCopier.copy_files(file_pairs, jobs)
+    if catalog is not None:
+        for (abs_cook_path, abs_mod_path) in file_pairs:
+            catalog.add(abs_mod_path)
+    return stats
 
 
 # run build steps for each mod
@@ -168,82 +495,512 @@ def read_mod_config(mod_name):
         return json.load(f)
 
 
-def build_mods(mod_folders, config):
-    temp_file = f"{os.getcwd()}/temp.txt"
-    for folder in mod_folders:
-        abs_folder = f"{os.getcwd()}/{MOD_DIR}/{folder}"
-        mod_name = os.path.basename(folder)
-
-        if not config["build_all_mods"] and mod_name not in config["build_mod_list"]:
-            # do not build mod, skip!
+def changed_cook_files(mod_config, cook_content_folder, mod_folder, manifest, prev_manifest, force=False):
+    """Fingerprints the cooked files listed in the mod config and returns the ones that need to be copied into the
+    mod again, because they changed in the cook folder or the mod's copy was changed outside of a build"""
+    prev_inputs = prev_manifest["inputs"] if prev_manifest else {}
+    prev_outputs = prev_manifest["outputs"] if prev_manifest else {}
+    changed_files = []
+    for copy_file in mod_config["mod_files"]:
+        abs_cook_path = f"{cook_content_folder}/{copy_file}"
+        abs_mod_path = f"{mod_config['mod_content_path']}/{copy_file}"
+        if not os.path.isfile(abs_cook_path):
+            print(f"Unable to find cook file: \n{abs_cook_path}")
             continue
+        prev_fingerprint = prev_inputs.get(copy_file)
+        fingerprint = manifests.file_fingerprint(abs_cook_path, prev_fingerprint)
+        manifest["inputs"][copy_file] = fingerprint
+        output_key = manifests.relative_key(abs_mod_path, mod_folder)
+        if force or prev_fingerprint is None or prev_fingerprint["hash"] != fingerprint["hash"]:
+            changed_files.append(copy_file)
+        elif output_key in prev_outputs:
+            if not manifests.fingerprint_matches(abs_mod_path, prev_outputs[output_key]):
+                changed_files.append(copy_file)
+        elif os.path.exists(abs_mod_path):
+            # not part of the last build's output, but also not removed by it (e.g. skeletons when keep_skeleton is off)
+            changed_files.append(copy_file)
+    return changed_files
 
-        print(
-            f"""------------------------------------------
+
+class ModBuild:
+    """Everything the build stages of a mod share. status is set once the mod's build is over"""
+
+    def __init__(self, folder, config, log=None):
+        self.folder = folder
+        self.config = config
+        self.mod_name = os.path.basename(folder)
+        self.abs_folder = f"{os.getcwd()}/{MOD_DIR}/{folder}"
+        self.mapping_dir = f"{MAPPING_DIR}/{self.mod_name}"
+        self.pak_name = f"{os.getcwd()}/{MOD_DIR}/{self.mod_name}.pak"
+        # every mod gets its own packer response file, so mods being built at the same time don't overwrite each other's
+        self.temp_file = f"{os.getcwd()}/temp-{self.mod_name}.txt"
+        # where the build prints to, None for stdout
+        self.log = log
+        self.status = None
+        self.catalog = None
+        self.catalog_file = None
+        self.manifest = None
+        self.manifest_file = None
+        self.incremental = False
+        # concurrent.futures.Future of the packer's PackResult while UnrealPak is running
+        self.pack_future = None
+
+
+def prepare_mod(build):
+    """First build stage: pulls the mod's files from the cook folder, checks if it's up to date and fixes its bones"""
+    config = build.config
+    mod_name = build.mod_name
+    abs_folder = build.abs_folder
+    mapping_dir = build.mapping_dir
+    print(
+        f"""------------------------------------------
         Building {mod_name}
 ----------------------------------------------""")
-        mod_files = []
-        # get all mod files
-        for file in pathlib.Path(abs_folder).rglob('*'):
-            if file.exists() and file.is_file():
-                mod_files.append(file)
-        # import files from cook folder
-        # update mod config using existing files in mod folder
-        cook_folder = config["cook_content_folder"]
-        if config["pull_mod_files_from_cook_folder"]:
-            print("\nUpdating mod files by pulling copies from cook folder.\n----------------------------")
-            if os.path.exists(cook_folder):
+    with buildTrace.stage_span(STAGE_PREPARE):
+        # every stage shares one list of the mod's files, saved between builds if "cache_mod_catalog" is on
+        catalog_file = f"{mapping_dir}/{MOD_CATALOG_NAME}" if config.get("cache_mod_catalog", False) else None
+        catalog = modCatalog.ModCatalog.load_or_scan(abs_folder, catalog_file)
+        mod_files = catalog.files()
+        # the build manifest keeps track of what was built last time, so unchanged mods/files can be skipped
+        incremental = config.get("incremental_build", True)
+        manifest_file = pathlib.Path(f"{mapping_dir}/{MOD_MANIFEST_NAME}")
+        prev_manifest = manifests.read_manifest(manifest_file) if incremental else None
+        mapping_fingerprints = manifests.fingerprint_dir(mapping_dir,
+                                                         prev_manifest["mapping"] if prev_manifest else None,
+                                                         exclude=(MOD_CONFIG_NAME,) + MOD_BUILD_FILES,
+                                                         exclude_extensions=(mapper.COMPILED_MAPPING_EXTENSION,))
+        settings_changed = manifests.settings_changed(config, mapping_fingerprints, prev_manifest)
+    # a dry run only prints what the bone fix would change, nothing in the mod is pulled, written, packed or copied
+    dry_run = config.get("dry_run", False)
+    pull_files = config["pull_mod_files_from_cook_folder"] and not dry_run
+    # files that are re-pulled from the cook folder are no longer fixed, otherwise keep the records so nothing
+    # gets remapped twice
+    manifest = manifests.new_manifest(config, mapping_fingerprints, prev_manifest,
+                                      keep_fixed=not (settings_changed and pull_files))
+    (build.catalog, build.catalog_file, build.manifest, build.manifest_file, build.incremental) = \
+        (catalog, catalog_file, manifest, manifest_file, incremental)
+    changed_files = []
+    # import files from cook folder
+    # update mod config using existing files in mod folder
+    cook_folder = config["cook_content_folder"]
+    if pull_files:
+        print("\nUpdating mod files by pulling copies from cook folder.\n----------------------------")
+        if os.path.exists(cook_folder):
+            with buildTrace.stage_span(STAGE_PULL):
                 mod_config = read_mod_config(mod_name)
                 mod_config = update_mod_config(mod_config, mod_name, mod_files)
                 # read mod config
-                copy_cooked_files_to_mod(mod_config, cook_folder, mod_name)
+                changed_files = changed_cook_files(mod_config, cook_folder, abs_folder, manifest, prev_manifest,
+                                                   force=settings_changed)
+                copy_stats = copy_cooked_files_to_mod(mod_config, cook_folder, mod_name, changed_files,
+                                                      config.get("copy_jobs", 0), catalog)
+                print(f"Cook files: {copy_stats}")
                 # print(f"Copied matching cook folder files into mod {mod_name}")
-                num_pull_files = len(mod_config["mod_files"])
-                mod_files = []  # re-init mod_files list
-                # get all mod files
-                for file in pathlib.Path(abs_folder).rglob('*'):
-                    if file.exists() and file.is_file():
-                        mod_files.append(file)
-                print(f"Updated {num_pull_files} files")
-            else:
-                print(f"WARNING: Cannot find cook content folder with path {cook_folder}")
-        # now copy the cooked files and move them over!
-
-        # perform skeleton mesh update functions...
-        bone_fix = config["bone_fix"]
-        if bone_fix:
-            print("\nFixing bones order for skeleton, mesh, and animation files\n----------------------------")
-            bone_realignment(mod_name, mod_files, config)
-
-        # build mods
-        packer_exe = config["packer_path"]
-        pak_name = f"{os.getcwd()}/{MOD_DIR}/{mod_name}.pak"
-        if config["autopack_mods"]:
-            print("\nBuilding .pak file for mod\n----------------------------")
-            if os.path.exists(packer_exe):
-                build_command = f"\"{packer_exe}\" \"{pak_name}\" -create={temp_file} -compress"
-                pak_search_paths = f"\"{abs_folder}/*.*\" \"..\\..\\..\\*.*\""  # just search inside the mod folder. thats it
-                with open(temp_file, "w") as f:
-                    f.write(pak_search_paths)
-                subprocess.call(build_command)
-            else:
-                print(f"ERROR: Cannot find packer executable at location: {packer_exe}.\nPlease check your config.json "
-                      f"file and make sure the packer_path value is correct. \nExiting...")
-                return
-        # move built mods into mod directory
-        mod_dir = config["mods_p_path"]
-        auto_move = config["move_all_mods"] or mod_name in config["moveover_mod_list"]
-        if auto_move:
-            print(f"\nCopying {mod_name}.pak into mods folder\n----------------------------")
-            if os.path.exists(mod_dir):
-                shutil.copyfile(pak_name, f"{mod_dir}/{mod_name}.pak")
-            else:
-                print(
-                    f"ERROR: Cannot find the mods export directory at location: {mod_dir}.\nPlease check your config.json "
-                    f"file and make sure the mods_p_path value is correct. \nExiting...")
+                num_pull_files = len(changed_files)
+                mod_files = catalog.files()  # re-init mod_files list
+                print(f"Updated {num_pull_files} files ({len(mod_config['mod_files']) - num_pull_files} unchanged)")
+        else:
+            print(f"WARNING: Cannot find cook content folder with path {cook_folder}")
+
+    if prev_manifest is not None and not settings_changed and len(changed_files) == 0:
+        with buildTrace.stage_span(STAGE_UP_TO_DATE_CHECK):
+            current_outputs = manifests.fingerprint_files(mod_files, abs_folder, prev_manifest["outputs"])
+            pak_up_to_date = not config["autopack_mods"] or manifests.fingerprint_matches(build.pak_name,
+                                                                                          prev_manifest["pak"])
+            up_to_date = manifests.same_contents(current_outputs, prev_manifest["outputs"]) and pak_up_to_date
+        if up_to_date:
+            print(f"\n{mod_name} is up to date, skipping build")
+            if catalog_file is not None and not dry_run:
+                catalog.save(catalog_file)
+            build.status = BUILD_UP_TO_DATE
+            return
+    # now copy the cooked files and move them over!
+
+    # perform skeleton mesh update functions...
+    bone_fix = config["bone_fix"]
+    if bone_fix:
+        print("\nFixing bones order for skeleton, mesh, and animation files\n----------------------------")
+        with buildTrace.stage_span(STAGE_BONE_FIX):
+            bone_realignment(mod_name, catalog, config, manifest if incremental else None, dry_run)
+    if dry_run:
+        build.status = BUILD_DRY_RUN
+
+
+def pack_mod(build):
+    """Second build stage: packs the mod folder into its .pak"""
+    config = build.config
+    pak_name = build.pak_name
+    packer_exe = config["packer_path"]
+    if config["autopack_mods"]:
+        print("\nBuilding .pak file for mod\n----------------------------")
+        if config.get("pak_writer", PAK_WRITER_UNREALPAK) == PAK_WRITER_BUILTIN:
+            compression = config.get("pak_compression", pakFile.COMPRESSION_ZLIB)
+            with buildTrace.stage_span(STAGE_PACK):
+                packed_files = pakFile.write_pak(pak_name, build.abs_folder, compression=compression,
+                                                 jobs=config.get("pak_jobs", 0))
+            print(f"Packed {len(packed_files)} files into {pak_name} ({compression})")
+        elif os.path.exists(packer_exe):
+            pak_search_paths = f"\"{build.abs_folder}/*.*\" \"..\\..\\..\\*.*\""  # just search inside the mod folder. thats it
+            with open(build.temp_file, "w") as f:
+                f.write(pak_search_paths)
+            # the packer runs in the background and the deploy stage waits for it, so on the build pipeline the next
+            # mod can already be packed at the same time
+            runner = packerRunner.shared_runner(config.get("packer_jobs", 2))
+            command = packerRunner.packer_command(packer_exe, pak_name, build.temp_file)
+            # the packer's output goes into the mod's log (if it has one), so it's printed with the rest of the mod's log
+            build.pack_future = runner.submit(packerRunner.PackJob(build.mod_name, command, build.log),
+                                              config.get("packer_timeout", 0))
+        else:
+            print(f"ERROR: Cannot find packer executable at location: {packer_exe}.\nPlease check your config.json "
+                  f"file and make sure the packer_path value is correct. \nExiting...")
+            build.status = BUILD_FAILED
+
 
-    if os.path.exists(temp_file):
-        os.remove(temp_file)
+def wait_for_packer(build):
+    """Waits for the mod's packer to finish. Returns False if it failed, timed out or couldn't be started"""
+    try:
+        with buildTrace.stage_span(STAGE_PACK):
+            result = build.pack_future.result()
+    finally:
+        build.pack_future = None
+        os.remove(build.temp_file)
+    print(f"{build.mod_name}: {result.describe()}")
+    if not result.succeeded:
+        print(f"ERROR: Packing {build.mod_name} failed, its .pak was not copied. See the packer output above.")
+    return result.succeeded
+
+
+def deploy_mod(build):
+    """Last build stage: records the build in the manifest and copies the .pak into the game's mods folder"""
+    config = build.config
+    mod_name = build.mod_name
+    pak_name = build.pak_name
+    catalog = build.catalog
+    packed = build.pack_future is None or wait_for_packer(build)
+    # record what was built so the next build can skip anything that hasn't changed. Also when packing failed, the bone
+    # fix records must be kept so the files aren't fixed twice, but without the .pak the mod is rebuilt next time
+    if build.incremental:
+        with buildTrace.stage_span(STAGE_MANIFEST):
+            build.manifest["outputs"] = manifests.fingerprint_files(catalog.files(), build.abs_folder)
+            if packed and config["autopack_mods"] and os.path.exists(pak_name):
+                build.manifest["pak"] = manifests.file_fingerprint(pak_name)
+            build.manifest_file.parent.mkdir(exist_ok=True, parents=True)
+            manifests.write_manifest(build.manifest_file, build.manifest)
+    if build.catalog_file is not None:
+        pathlib.Path(build.mapping_dir).mkdir(exist_ok=True, parents=True)
+        catalog.save(build.catalog_file)
+    if not packed:
+        build.status = BUILD_FAILED
+        return
+    # move built mods into mod directory
+    mod_dir = config["mods_p_path"]
+    auto_move = config["move_all_mods"] or mod_name in config["moveover_mod_list"]
+    if auto_move:
+        print(f"\nCopying {mod_name}.pak into mods folder\n----------------------------")
+        if os.path.exists(mod_dir):
+            with buildTrace.stage_span(STAGE_DEPLOY):
+                deploy_stats = fileCopier.deploy_file(pak_name, f"{mod_dir}/{mod_name}.pak",
+                                                      config.get("deploy_with_hardlinks", False))
+            print(f"{mod_name}.pak: {deploy_stats}")
+        else:
+            print(
+                f"ERROR: Cannot find the mods export directory at location: {mod_dir}.\nPlease check your config.json "
+                f"file and make sure the mods_p_path value is correct. \nExiting...")
+            build.status = BUILD_FAILED
+            return
+    build.status = BUILD_SUCCEEDED
+
+
+# the stages of a mod's build, in order. A stage sets the build's status when the build is over (failed, up to date...)
+BUILD_STAGES = (prepare_mod, pack_mod, deploy_mod)
+
+
+def build_mod(folder, config):
+    """Runs every build step (pull, bone fix, pack, move) for a single mod folder and returns its build status"""
+    build = ModBuild(folder, config)
+    for stage in BUILD_STAGES:
+        stage(build)
+        if build.status is not None:
+            break
+    return build.status
+
+
+def run_build_mod(folder, config):
+    """Builds a mod, turning any exception into a failed build so the other mods still get built"""
+    with buildTrace.mod_span(os.path.basename(folder)):
+        try:
+            status = build_mod(folder, config)
+        except Exception:
+            print(f"Failed to build {os.path.basename(folder)} correctly.")
+            print(traceback.format_exc())
+            status = BUILD_FAILED
+    buildTrace.set_mod_status(os.path.basename(folder), status)
+    return status
+
+
+def run_build_mod_logged(folder, config, trace=False):
+    """Worker process entry point. Everything the build prints is captured and returned with the status,
+    so each mod's log can be printed in one piece instead of interleaving with the other workers.
+    With trace, the worker's build trace is returned as well so it can be merged into the main process' trace"""
+    if trace:
+        buildTrace.enable()
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        status = run_build_mod(folder, config)
+    return status, log.getvalue(), buildTrace.collect()
+
+
+def run_build_stage(build, stage, output):
+    """Runs one stage of a mod's build on the build pipeline, printing into the mod's log.
+    Returns True if the mod goes on to the next stage"""
+    with output.capture(build.log), buildTrace.mod_span(build.mod_name):
+        try:
+            stage(build)
+        except Exception:
+            print(f"Failed to build {build.mod_name} correctly.")
+            print(traceback.format_exc())
+            build.status = BUILD_FAILED
+    return build.status is None
+
+
+def pipeline_build_mods(build_folders, config):
+    """Builds the mods on a pipeline: each build stage runs on its own thread, so one mod is pulled and bone fixed while
+    the one before it is packed and the one before that is copied. Each mod's log is printed once it's done.
+    Returns a dictionary of mod name to build status"""
+    depth = config.get("pipeline_depth", 1)
+    print(f"Building {len(build_folders)} mods on a pipeline (pull and bone fix, pack, deploy)")
+    output = buildPipeline.ThreadOutput(sys.stdout)
+    pipeline = buildPipeline.Pipeline([functools.partial(run_build_stage, stage=stage, output=output)
+                                       for stage in BUILD_STAGES], depth)
+    results = {}
+    # a mod's ModBuild is only made when the pipeline takes it, so only the mods in the pipeline are kept in memory
+    builds = (ModBuild(folder, config, io.StringIO()) for folder in build_folders)
+    with contextlib.redirect_stdout(output):
+        for build, error in pipeline.run(builds):
+            print(build.log.getvalue(), end='')
+            if error is not None:
+                print(f"Failed to build {build.mod_name} correctly.\n{error!r}")
+                build.status = BUILD_FAILED
+            buildTrace.set_mod_status(build.mod_name, build.status)
+            results[build.mod_name] = build.status
+    return results
+
+
+def build_jobs_count(config, jobs=None):
+    """Number of mods to build at the same time. 0 means one per cpu core"""
+    if jobs is None:
+        jobs = config.get("build_jobs", 1)
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    return jobs
+
+
+def enabled_mod_folders(mod_folders, config):
+    return [folder for folder in mod_folders
+            if config["build_all_mods"] or os.path.basename(folder) in config["build_mod_list"]]
+
+
+def build_mods(mod_folders, config, jobs=None, pool=None):
+    """Builds every mod folder that is enabled in the config, up to 'jobs' mods at the same time.
+    An existing process pool can be passed in to reuse its (already warmed up) workers.
+    Returns a dictionary of mod name to build status"""
+    build_folders = enabled_mod_folders(mod_folders, config)
+    jobs = min(build_jobs_count(config, jobs), max(len(build_folders), 1))
+    results = {}
+    if jobs == 1 and config.get("pipeline_builds", True) and len(build_folders) > 1:
+        results = pipeline_build_mods(build_folders, config)
+    elif jobs == 1:
+        for folder in build_folders:
+            results[os.path.basename(folder)] = run_build_mod(folder, config)
+    else:
+        print(f"Building {len(build_folders)} mods with {jobs} workers")
+        with contextlib.ExitStack() as stack:
+            if pool is None:
+                pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(max_workers=jobs))
+            trace = buildTrace.is_enabled()
+            futures = dict((pool.submit(run_build_mod_logged, folder, config, trace), folder)
+                           for folder in build_folders)
+            for future in concurrent.futures.as_completed(futures):
+                mod_name = os.path.basename(futures[future])
+                try:
+                    status, log, trace_data = future.result()
+                    print(log, end='')
+                    buildTrace.merge(trace_data)
+                except Exception as ex:  # the worker process itself died
+                    status = BUILD_FAILED
+                    print(f"Failed to build {mod_name} correctly.\n{ex!r}")
+                results[mod_name] = status
+    # keep the summary in the same order as the mod folders, no matter which finished first
+    results = dict((os.path.basename(folder), results[os.path.basename(folder)]) for folder in build_folders)
+    print_build_summary(results)
+    return results
+
+
+def traced_build_mods(mod_folders, config, jobs=None, pool=None, trace_file=None):
+    """Runs build_mods, recording a Chrome trace of every build stage into trace_file (if given),
+    and a summary of each mod's stage times and I/O next to it"""
+    if trace_file is None:
+        return build_mods(mod_folders, config, jobs, pool)
+    buildTrace.enable()
+    try:
+        return build_mods(mod_folders, config, jobs, pool)
+    finally:
+        buildTrace.write_trace(trace_file)
+        buildTrace.disable()
+        print(f"Saved build trace to {trace_file} and {buildTrace.summary_path(trace_file)}")
+
+
+def rewrite_bone_fixes(mod_folders, config, reapply=False):
+    """Reverts the bone fixes of every mod folder that is enabled in the config (or with reapply, redoes them) by
+    rewriting only the byte ranges recorded in the mod's fix journal. Returns a dictionary of mod name to status"""
+    results = {}
+    for folder in enabled_mod_folders(mod_folders, config):
+        mod_name = os.path.basename(folder)
+        journal_file = f"{MAPPING_DIR}/{mod_name}/{MOD_FIX_JOURNAL_NAME}"
+        if not os.path.exists(journal_file):
+            print(f"{mod_name}: no bone fixes recorded in {journal_file}")
+            results[mod_name] = FIX_NOT_RECORDED
+            continue
+        journal = patchPlan.PatchJournal.load(journal_file, f"{os.getcwd()}/{MOD_DIR}/{folder}")
+        (files, size, errors) = journal.rewrite(reapply)
+        for (file, error) in errors:
+            print(f"WARNING: {mod_name}/{file} {error}, leaving it unchanged")
+        print(f"{mod_name}: {'reapplied' if reapply else 'reverted'} the bone fix of {files} files ({size} bytes written)")
+        results[mod_name] = BUILD_FAILED if errors else FIX_REAPPLIED if reapply else FIX_REVERTED
+    print_build_summary(results)
+    return results
+
+
+def print_build_summary(results):
+    print("\n------------------------------------------\nBuild Summary\n------------------------------------------")
+    for mod_name, status in results.items():
+        print(f"{status:>10} : {mod_name}")
+    failed = [mod_name for mod_name, status in results.items() if status == BUILD_FAILED]
+    print(f"{len(results) - len(failed)} succeeded, {len(failed)} failed")
+
+
+def list_mod_folders():
+    mods_dir = f"{os.getcwd()}/{MOD_DIR}"
+    return [name for name in os.listdir(mods_dir) if os.path.isdir(f"{MOD_DIR}/{name}") and not name.startswith('.')]
+
+
+def cook_path_key(path):
+    """Normalizes a path relative to the cook content folder, so paths from the mod configs and the watcher can be compared"""
+    return os.path.normcase(os.path.normpath(path))
+
+
+class ModWatchIndex:
+    """Finds which mods a changed file belongs to. Keeps every mod config in memory, mapping the cook files they pull
+    to the mods that use them, and only re-reads a mod config when it changes"""
+
+    def __init__(self, cook_content_folder):
+        self.cook_folder = os.path.abspath(cook_content_folder) if cook_content_folder else ""
+        self.mods_dir = os.path.abspath(MOD_DIR)
+        self.mapping_dir = os.path.abspath(MAPPING_DIR)
+        self.mod_cook_files = {}
+        self.cook_file_mods = {}
+
+    def refresh(self, mod_names):
+        """Loads the mod configs of mods that aren't known yet, and forgets mods that were removed"""
+        for mod_name in list(self.mod_cook_files):
+            if mod_name not in mod_names:
+                self.update_mod(mod_name, None)
+        for mod_name in mod_names:
+            if mod_name not in self.mod_cook_files:
+                self.update_mod(mod_name, read_mod_config(mod_name))
+
+    def update_mod(self, mod_name, mod_config):
+        for key in self.mod_cook_files.pop(mod_name, ()):
+            self.cook_file_mods[key].discard(mod_name)
+        if mod_config is None:
+            return
+        keys = set(cook_path_key(copy_file) for copy_file in mod_config["mod_files"])
+        self.mod_cook_files[mod_name] = keys
+        for key in keys:
+            self.cook_file_mods.setdefault(key, set()).add(mod_name)
+
+    @staticmethod
+    def relative_parts(path, folder):
+        """Path of a file relative to a folder, split into its parts. None if the file isn't inside the folder"""
+        if not folder:
+            return None
+        relative = os.path.relpath(path, folder)
+        if relative.startswith(os.pardir) or os.path.isabs(relative):
+            return None
+        return pathlib.PurePath(relative).parts
+
+    def affected_mods(self, changed_paths):
+        """Returns the names of the mods that need to be rebuilt because of the changed files"""
+        mods = set()
+        for path in changed_paths:
+            path = os.path.abspath(path)
+            parts = self.relative_parts(path, self.mods_dir)
+            if parts is not None:
+                if len(parts) > 1:  # files directly in mods/ are the built .paks
+                    mods.add(parts[0])
+                continue
+            parts = self.relative_parts(path, self.mapping_dir)
+            if parts is not None:
+                if len(parts) > 1 and parts[-1] not in MOD_BUILD_FILES \
+                        and not parts[-1].endswith(mapper.COMPILED_MAPPING_EXTENSION):
+                    mods.add(parts[0])
+                    if parts[-1] == MOD_CONFIG_NAME:
+                        self.update_mod(parts[0], read_mod_config(parts[0]))
+                continue
+            parts = self.relative_parts(path, self.cook_folder)
+            if parts is not None:
+                mods.update(self.cook_file_mods.get(cook_path_key(os.path.join(*parts)), ()))
+        return mods
+
+    def is_build_output(self, path, built_mods):
+        """True if the file is in the mod or mapping folder of a mod that was just built, those changes come from the build"""
+        for folder in (self.mods_dir, self.mapping_dir):
+            parts = self.relative_parts(os.path.abspath(path), folder)
+            if parts is not None:
+                return len(parts) <= 1 or parts[0] in built_mods
+        return False
+
+
+def watch_mods(config, jobs=None, trace_file=None):
+    """Builds every mod, then keeps rebuilding the mods affected by changes to the cook, mods and mapping folders
+    until interrupted. Mapping data and mod configs stay loaded in between builds.
+    With trace_file, the trace of the latest build is saved to it"""
+    interval = config.get("watch_interval", 1.0)
+    debounce = config.get("watch_debounce", 2.0)
+    index = ModWatchIndex(config["cook_content_folder"] if config["pull_mod_files_from_cook_folder"] else "")
+    roots = [MOD_DIR, MAPPING_DIR]
+    if index.cook_folder and os.path.isdir(index.cook_folder):
+        roots.append(index.cook_folder)
+    mod_watcher = watcher.create_watcher([os.path.abspath(root) for root in roots], interval)
+    jobs = build_jobs_count(config, jobs)
+    # keep the same worker processes for every build, so their mapping caches stay warm
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        mod_folders = list_mod_folders()
+        built_mods = set(traced_build_mods(mod_folders, config, jobs, pool, trace_file))
+        pending = set()
+        while True:
+            # the build itself writes to the mod and mapping folders, ignore those changes so mods don't rebuild forever
+            pending.update(path for path in mod_watcher.poll(0) if not index.is_build_output(path, built_mods))
+            index.refresh(mod_folders)
+            print(f"\nWatching for changes in {', '.join(roots)} (Ctrl+C to stop)")
+            while True:
+                changed = pending | watcher.wait_for_changes(mod_watcher, debounce, None if not pending else 0)
+                pending = set()
+                mod_folders = list_mod_folders()
+                index.refresh(mod_folders)
+                affected = index.affected_mods(changed)
+                if affected:
+                    break
+            print(f"\n{len(changed)} files changed, rebuilding: {', '.join(sorted(affected))}")
+            built_mods = set(traced_build_mods([folder for folder in mod_folders if folder in affected], config, jobs,
+                                               pool, trace_file))
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        mod_watcher.close()
+        if pool is not None:
+            pool.shutdown()
 
 
 def read_mapping_config():
@@ -261,12 +1018,37 @@ def write_mapping_config(packer_path):
 
 # run starts here
 if __name__ == "__main__":
-    mods_dir = f"{os.getcwd()}/{MOD_DIR}"
-    dir_folders = [name for name in os.listdir(mods_dir) if os.path.isdir(f"mods/{name}") and not name.startswith('.')]
+    parser = argparse.ArgumentParser(description="Pulls, bone fixes, packs and moves every mod in the mods folder")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="number of mods to build at the same time (0 = one per cpu core). "
+                             "Overrides \"build_jobs\" in config.json")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and rebuild mods whenever their files in the cook, mods or mapping folder change")
+    parser.add_argument("--trace", metavar="TRACE_FILE", default=None,
+                        help="save a Chrome/Perfetto trace of the build to TRACE_FILE (e.g. out.json), with a summary of "
+                             "each mod's stage times and I/O in out.summary.json")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the bone fix edits each mod would get, without pulling, writing, packing or copying anything")
+    fix_journal = parser.add_mutually_exclusive_group()
+    fix_journal.add_argument("--revert", action="store_true",
+                             help="undo the bone fixes of each mod by restoring the bytes recorded in its fix journal, "
+                                  "without building anything")
+    fix_journal.add_argument("--reapply", action="store_true",
+                             help="redo the bone fixes undone by --revert, without building anything")
+    args = parser.parse_args()
+    dir_folders = list_mod_folders()
     config = read_mapping_config()
+    config["dry_run"] = args.dry_run
+    if args.watch:
+        watch_mods(config, args.jobs, args.trace)
+        quit()
     success = True
     try:
-        build_mods(dir_folders, config)  # where all the work is actually done
+        if args.revert or args.reapply:
+            results = rewrite_bone_fixes(dir_folders, config, args.reapply)
+        else:
+            results = traced_build_mods(dir_folders, config, args.jobs, trace_file=args.trace)  # where all the work is actually done
+        success = BUILD_FAILED not in results.values()
     except Exception as ex:
         success = False
         print("Failed to build correctly.")
@@ -0,0 +1,165 @@
+"""Micro-benchmark for the skeleton and animation bone index writers in pythonfiles/readAnimAsset.py.
+Compares the batched array writers against the original per-bone writers on synthetic .uexp files,
+and checks that both produce byte identical files.
+
+usage: python benchmarks/bench_bone_remap.py [--bones 50 250 1000] [--anims 1000] [--repeat 5]
+"""
+import os
+import sys
+import mmap
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pythonfiles.readAnimAsset as ream
+from pythonfiles.readAnimAsset import BoneData, ENDIAN
+
+
+# the writers as they were before the batched remap, kept here to compare against
+def legacy_write_anim_uexp_bone_index_order(file_name, bone_index_remap):
+    with open(file_name, "r+b") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
+            bone_map_start = mm.find(b'\x00\x00\x00\x00\x01\x00\x00\x00\x02\x00\x00\x00')
+            if bone_map_start == -1:
+                return False
+            anim_bone_count = int.from_bytes(mm[bone_map_start - 4:bone_map_start], ENDIAN)
+            data_offset = bone_map_start
+            for index in range(anim_bone_count):
+                new_index = bone_index_remap[index]
+                mm[data_offset:data_offset + 4] = int.to_bytes(new_index, 4, ENDIAN)
+                data_offset += 4
+    return True
+
+
+def legacy_write_skel_uexp_bone_order(file_name, bone_order):
+    with open(file_name, "r+b") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
+            bone_count = len(bone_order)
+            root_bone_index = mm.find(b'\xff\xff\xff\xff')
+            start_index = root_bone_index - 8
+            data_start_index = root_bone_index - 12
+            for bone in bone_order:
+                mm[start_index:start_index + 4] = int.to_bytes(bone.bone_name_index, 4, ENDIAN)
+                mm[start_index + 8:start_index + 12] = int.to_bytes(bone.parent_index, 4, ENDIAN, signed=True)
+                start_index += 12
+            start_index = bone_count * (12 + 80) + data_start_index + 8 + 4
+            for (index, bone) in enumerate(bone_order):
+                mm[start_index:start_index + 4] = int.to_bytes(bone.bone_name_index, 4, ENDIAN)
+                mm[start_index + 8: start_index + 12] = int.to_bytes(index, 4, ENDIAN)
+                start_index += 12
+
+
+def int32(value):
+    return int.to_bytes(value, 4, ENDIAN, signed=True)
+
+
+def skeleton_uexp_bytes(bone_count):
+    """Minimal skeleton .uexp layout the writers understand: bone count, bone table, 80 bytes per bone of
+    other data, then the name to index table"""
+    data = bytearray(16)
+    data += int32(bone_count)
+    for i in range(bone_count):
+        data += int32(i + 1) + int32(0) + int32(i - 1 if i > 0 else -1)
+    data += bytes(80 * bone_count + 8)
+    for i in range(bone_count):
+        data += int32(i + 1) + int32(0) + int32(i)
+    return bytes(data + bytes(16))
+
+
+def anim_uexp_bytes(bone_count):
+    """Minimal animation .uexp layout: track count followed by the track to bone index table"""
+    data = bytearray(b'\x01' * 32)
+    data += int32(bone_count)
+    for i in range(bone_count):
+        data += int32(i)
+    return bytes(data + b'\x01' * 64)
+
+
+def write_files(folder, prefix, data, count):
+    files = []
+    for i in range(count):
+        file_name = f"{folder}/{prefix}_{i}.uexp"
+        with open(file_name, "wb") as f:
+            f.write(data)
+        files.append(file_name)
+    return files
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def read_all(files):
+    result = []
+    for file_name in files:
+        with open(file_name, "rb") as f:
+            result.append(f.read())
+    return result
+
+
+def bench_skeleton(folder, bone_count, repeat):
+    rng = random.Random(bone_count)
+    # root bone first, it's the only one with a -1 parent (that's what the writers search for)
+    bone_order = [BoneData(rng.randrange(1, 10000), rng.randrange(0, i) if i > 0 else -1) for i in range(bone_count)]
+    (legacy_file,) = write_files(folder, f"legacy_skel{bone_count}", skeleton_uexp_bytes(bone_count), 1)
+    (batched_file,) = write_files(folder, f"batched_skel{bone_count}", skeleton_uexp_bytes(bone_count), 1)
+    legacy = best_time(lambda: legacy_write_skel_uexp_bone_order(legacy_file, bone_order), repeat)
+    batched = best_time(lambda: ream.write_skel_uexp_bone_order(batched_file, bone_order), repeat)
+    identical = read_all([legacy_file]) == read_all([batched_file])
+    return legacy, batched, identical
+
+
+def bench_anims(folder, bone_count, anim_count, repeat):
+    # the first 3 bones keep their index so the table is still found when the same files are rewritten on every repeat
+    remap = list(range(3, bone_count))
+    random.Random(anim_count).shuffle(remap)
+    remap = dict(enumerate([0, 1, 2] + remap))
+    data = anim_uexp_bytes(bone_count)
+    legacy_files = write_files(folder, f"legacy_anim{bone_count}", data, anim_count)
+    batched_files = write_files(folder, f"batched_anim{bone_count}", data, anim_count)
+
+    def run_legacy():
+        for file_name in legacy_files:
+            legacy_write_anim_uexp_bone_index_order(file_name, remap)
+
+    def run_batched():
+        dense_remap = ream.dense_bone_index_remap(remap)
+        for file_name in batched_files:
+            ream.write_anim_uexp_bone_index_order(file_name, dense_remap)
+
+    legacy = best_time(run_legacy, repeat)
+    batched = best_time(run_batched, repeat)
+    identical = read_all(legacy_files) == read_all(batched_files)
+    return legacy, batched, identical
+
+
+def report(label, legacy, batched, identical):
+    print(f"{label:<36} legacy {legacy * 1000:9.2f} ms   batched {batched * 1000:9.2f} ms   "
+          f"speedup {legacy / batched:6.2f}x   identical: {identical}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the batched bone index writers")
+    parser.add_argument("--bones", type=int, nargs="+", default=[50, 250, 1000])
+    parser.add_argument("--anims", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    all_identical = True
+    with tempfile.TemporaryDirectory() as folder:
+        for bone_count in args.bones:
+            result = bench_skeleton(folder, bone_count, args.repeat)
+            report(f"skeleton, {bone_count} bones", *result)
+            all_identical &= result[2]
+        for bone_count in args.bones:
+            result = bench_anims(folder, bone_count, args.anims, args.repeat)
+            report(f"{args.anims} animations, {bone_count} bones", *result)
+            all_identical &= result[2]
+    sys.exit(0 if all_identical else 1)
@@ -0,0 +1,79 @@
+"""Runs the stub packer (stub_packer.py) through pythonfiles/packerRunner.py to check and time running several packers at
+the same time, without UnrealPak. Works on any OS.
+
+For every --jobs value, --paks slow packers (each waiting --delay seconds) are run on a runner with that many slots.
+The wall time should be about ceil(paks / jobs) * delay. Then a failing and a timed out packer are run to check their
+exit codes and errors are reported.
+
+usage: python benchmarks/bench_packer.py [--paks 8] [--jobs 1 2 4 8] [--delay 0.5]
+"""
+import os
+import sys
+import math
+import time
+import argparse
+import tempfile
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+import pythonfiles.packerRunner as packerRunner
+
+STUB_PACKER = os.path.join(BENCHMARK_DIR, "stub_packer.py")
+
+
+def make_jobs(folder, count):
+    """A small mod folder and the PackJobs that pack it into 'count' .paks"""
+    mod_folder = os.path.join(folder, "StubMod_P")
+    os.makedirs(mod_folder, exist_ok=True)
+    with open(os.path.join(mod_folder, "file.uasset"), "wb") as f:
+        f.write(os.urandom(64 * 1024))
+    response_file = os.path.join(folder, "response.txt")
+    with open(response_file, "w") as f:
+        f.write(f"\"{mod_folder}/*.*\"")
+    return [packerRunner.PackJob(f"Pak{index}", packerRunner.packer_command(
+        STUB_PACKER, os.path.join(folder, f"Pak{index}.pak"), response_file)) for index in range(count)]
+
+
+def bench_concurrency(folder, paks, jobs_counts, delay):
+    os.environ["STUB_PACKER_DELAY"] = str(delay)
+    jobs = make_jobs(folder, paks)
+    print(f"{'jobs':>6} {'seconds':>9} {'expected':>9}")
+    for jobs_count in jobs_counts:
+        runner = packerRunner.PackerRunner(jobs_count, stream=None)
+        start = time.perf_counter()
+        results = runner.run_all(jobs)
+        seconds = time.perf_counter() - start
+        runner.close()
+        failed = [result for result in results if not result.succeeded]
+        print(f"{jobs_count:>6} {seconds:>9.2f} {math.ceil(paks / jobs_count) * delay:>9.2f}"
+              + (f"  {len(failed)} FAILED: {failed[0].describe()}" if failed else ""))
+    del os.environ["STUB_PACKER_DELAY"]
+
+
+def check_failures(folder):
+    """A packer that exits with an error and one that runs too long both have to be reported, with the output streamed"""
+    runner = packerRunner.PackerRunner(2)
+    (failing, slow) = make_jobs(folder, 2)
+    os.environ["STUB_PACKER_EXIT_CODE"] = "3"
+    failing_result = runner.submit(failing).result()
+    del os.environ["STUB_PACKER_EXIT_CODE"]
+    os.environ["STUB_PACKER_DELAY"] = "30"
+    slow_result = runner.submit(slow, timeout=1).result()
+    del os.environ["STUB_PACKER_DELAY"]
+    runner.close()
+    print(f"{failing.name}: {failing_result.describe()}")
+    print(f"{slow.name}: {slow_result.describe()}")
+    ok = failing_result.exit_code == 3 and slow_result.error is not None and slow_result.seconds < 10
+    print("failures reported correctly" if ok else "FAILED: packer failures were not reported correctly")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the stub packer through the packer runner")
+    parser.add_argument("--paks", type=int, default=8)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--delay", type=float, default=0.5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bench_concurrency(temp_dir, args.paks, args.jobs, args.delay)
+        sys.exit(0 if check_failures(temp_dir) else 1)
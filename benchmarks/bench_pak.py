@@ -0,0 +1,93 @@
+"""Round trip check and timing for the builtin pak writer in pythonfiles/pakFile.py.
+Packs a folder of test files with write_pak for every supported compression method, reads every file back with
+PakReader.read_file and checks that it's byte identical to the original. The folder has an empty file, small files,
+files of several compression blocks (compressible and random, which is stored uncompressed) and nested folders.
+
+usage: python benchmarks/bench_pak.py [--size-mb 8] [--block-size 65536] [--repeat 3]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pythonfiles.pakFile as pakFile
+
+
+def make_files(folder, size, block_size, rng):
+    """Writes the test files into folder, returns {path inside the pak: contents}"""
+    text = b"".join(b"bone_%d parent_%d " % (i, i // 2) for i in range(block_size // 8))
+    files = {
+        "empty.uasset": b"",
+        "one_byte.uexp": b"\x01",
+        "small.uasset": text[:1000],
+        # exactly one block, and one byte over it
+        "Pal/Content/one_block.uexp": text[:block_size],
+        "Pal/Content/one_block_plus_one.uexp": text[:block_size] + b"x",
+        # several blocks, with a short last block
+        "Pal/Content/Model/multi_block.uexp": (text * (size // len(text) + 1))[:size - 123],
+        # doesn't get smaller when compressed, so it's stored as is
+        "Pal/Content/Model/random.ubulk": rng.randbytes(3 * block_size + 17) if hasattr(rng, "randbytes")
+        else os.urandom(3 * block_size + 17),
+    }
+    for path, data in files.items():
+        file_name = os.path.join(folder, *path.split("/"))
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, "wb") as f:
+            f.write(data)
+    return files
+
+
+def check_round_trip(pak_file, files):
+    """Returns a list of the differences between the pak's files and the originals, empty if they're identical"""
+    reader = pakFile.PakReader(pak_file)
+    errors = []
+    if reader.mount_point != pakFile.DEFAULT_MOUNT_POINT:
+        errors.append(f"mount point is {reader.mount_point!r}")
+    if reader.files() != sorted(files):
+        errors.append(f"files in the pak: {reader.files()}, expected {sorted(files)}")
+    for path, data in sorted(files.items()):
+        if path not in reader.entries:
+            continue
+        read = reader.read_file(path)
+        if read != data:
+            errors.append(f"{path}: read {len(read)} bytes, expected {len(data)} bytes"
+                          + ("" if len(read) != len(data) else " (contents differ)"))
+    return errors
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that paks written by the builtin pak writer read back the same")
+    parser.add_argument("--size-mb", type=float, default=8, help="size of the largest (multi block) test file")
+    parser.add_argument("--block-size", type=int, default=pakFile.DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    all_identical = True
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, "RoundTrip_P")
+        files = make_files(source, int(args.size_mb * 1024 * 1024), args.block_size, random.Random(0))
+        total = sum(len(data) for data in files.values())
+        for compression in pakFile.SUPPORTED_COMPRESSION:
+            pak_file = os.path.join(folder, f"RoundTrip_{compression}.pak")
+            seconds = best_time(lambda: pakFile.write_pak(pak_file, source, compression=compression,
+                                                          block_size=args.block_size), args.repeat)
+            errors = check_round_trip(pak_file, files)
+            print(f"{compression:<6} {len(files)} files, {total / 1024 / 1024:7.2f} MB -> "
+                  f"{os.path.getsize(pak_file) / 1024 / 1024:7.2f} MB   write {seconds * 1000:9.2f} ms   "
+                  f"identical: {not errors}")
+            for error in errors:
+                print(f"    {error}")
+            all_identical &= not errors
+    sys.exit(0 if all_identical else 1)
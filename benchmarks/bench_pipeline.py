@@ -0,0 +1,220 @@
+"""Benchmarks every stage of the bone fix, and full builds, on synthetic mods made by synthetic_assets.py.
+Results are printed and saved as JSON, so runs from different commits can be compared with --compare.
+
+Stages: read_uasset, read_skel_uexp, bone_order_from_mapping, write_anim_uexp_bone_index_order and build_mods.
+
+usage: python benchmarks/bench_pipeline.py [--bones 50 250 1000] [--custom-bones 10] [--anims 10 1000]
+                                           [--mods 1 10] [--build-anims 50] [--repeat 3]
+                                           [--output results.json] [--compare old_results.json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+import ModBuilder
+import pythonfiles.mapper as mapper
+import pythonfiles.readAnimAsset as ream
+import synthetic_assets
+
+RESULTS_VERSION = 1
+# number of times the single file stages run per measurement, so they take long enough to time
+SINGLE_FILE_LOOPS = 100
+
+
+def best_time(function, repeat, setup=None):
+    """Runs function 'repeat' times and returns the fastest time. setup runs before every run and isn't timed"""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def result(stage, seconds, items, **params):
+    return dict(stage=stage, **params, items=items, seconds=seconds, per_item_ms=seconds * 1000 / max(items, 1))
+
+
+def bench_stages(folder, bone_count, custom_bone_count, anim_count, repeat):
+    """Times each bone fix stage on one synthetic mod"""
+    mod = synthetic_assets.generate_mod(folder, "BenchMod_P", bone_count, custom_bone_count, anim_count)
+    params = dict(bones=bone_count, custom_bones=custom_bone_count, anims=anim_count, mods=1)
+    skeleton = mod["skeleton"]
+    anim_uassets = [f"{anim}.uasset" for anim in mod["animations"]]
+    anim_uexps = [f"{anim}.uexp" for anim in mod["animations"]]
+    mapping_file = f"{folder}/mapping/BenchMod_P/bench-map.json"
+    mapper.create_mapping_file(mapping_file, ream.read_skel_uexp(f"{mod['mapping_skeleton']}.uexp"),
+                               ream.read_uasset(f"{mod['mapping_skeleton']}.uasset"))
+    mapping = mapper.load_mapping(mapping_file)
+    names = ream.read_uasset(f"{skeleton}.uasset")
+    bones = ream.read_skel_uexp(f"{skeleton}.uexp")
+    (_, remap) = mapper.bone_order_from_mapping(mapping, bones, names)
+    anim_data = [open(file_name, "rb").read() for file_name in anim_uexps]
+
+    def restore_anims():
+        for file_name, data in zip(anim_uexps, anim_data):
+            with open(file_name, "wb") as f:
+                f.write(data)
+
+    def read_uassets():
+        for file_name in anim_uassets:
+            ream.read_uasset(file_name)
+
+    def read_skeleton():
+        for _ in range(SINGLE_FILE_LOOPS):
+            ream.read_skel_uexp(f"{skeleton}.uexp")
+
+    def remap_bones():
+        for _ in range(SINGLE_FILE_LOOPS):
+            mapper.bone_order_from_mapping(mapping, bones, names)
+
+    def write_anims():
+        for file_name in anim_uexps:
+            if not ream.write_anim_uexp_bone_index_order(file_name, remap):
+                raise RuntimeError(f"bone order not found in {file_name}")
+
+    results = [
+        result("read_uasset", best_time(read_uassets, repeat), len(anim_uassets), **params),
+        result("read_skel_uexp", best_time(read_skeleton, repeat), SINGLE_FILE_LOOPS, **params),
+        result("bone_order_from_mapping", best_time(remap_bones, repeat), SINGLE_FILE_LOOPS, **params),
+        result("write_anim_uexp_bone_index_order", best_time(write_anims, repeat, restore_anims), len(anim_uexps),
+               **params),
+    ]
+    shutil.rmtree(f"{folder}/mods", ignore_errors=True)
+    shutil.rmtree(f"{folder}/mapping", ignore_errors=True)
+    return results
+
+
+def build_config(jobs):
+    return {
+        "pull_mod_files_from_cook_folder": False,
+        "cook_content_folder": "",
+        "autopack_mods": True,
+        "packer_path": "",
+        "pak_writer": ModBuilder.PAK_WRITER_BUILTIN,
+        "pak_compression": "Zlib",
+        "pak_jobs": 0,
+        "bone_fix": True,
+        "keep_skeleton": True,
+        "anim_search_pattern": "AS_*",
+        "mods_p_path": "",
+        "build_all_mods": True,
+        "build_mod_list": [],
+        "move_all_mods": False,
+        "moveover_mod_list": [],
+        "incremental_build": True,
+        "build_jobs": jobs,
+        "anim_fix_jobs": 0,
+        "copy_jobs": 0,
+    }
+
+
+def bench_build(folder, bone_count, custom_bone_count, anim_count, mod_count, jobs, repeat):
+    """Times a full build_mods run (bone fix + builtin pak writer) of mod_count freshly generated synthetic mods"""
+    config = build_config(jobs)
+    mod_names = []
+
+    def generate():
+        shutil.rmtree(f"{folder}/mods", ignore_errors=True)
+        shutil.rmtree(f"{folder}/mapping", ignore_errors=True)
+        mod_names[:] = synthetic_assets.generate_mods(folder, mod_count, bone_count, custom_bone_count, anim_count)
+
+    def build():
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = ModBuilder.build_mods(mod_names, config, jobs)
+        if ModBuilder.BUILD_FAILED in results.values():
+            raise RuntimeError("benchmark build failed")
+
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        seconds = best_time(build, repeat, generate)
+    finally:
+        os.chdir(cwd)
+    return result("build_mods", seconds, mod_count, bones=bone_count, custom_bones=custom_bone_count,
+                  anims=anim_count, mods=mod_count, jobs=jobs)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def result_key(item):
+    return tuple((key, item.get(key)) for key in ("stage", "bones", "custom_bones", "anims", "mods", "jobs"))
+
+
+def report(item, previous=None):
+    label = f"{item['stage']:<34} {item['bones']:>5} bones {item['anims']:>5} anims {item['mods']:>3} mods"
+    line = f"{label}   {item['seconds'] * 1000:10.2f} ms   {item['per_item_ms']:9.4f} ms/item"
+    if previous is not None:
+        line += f"   {previous['seconds'] / item['seconds']:6.2f}x vs {previous['seconds'] * 1000:.2f} ms"
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the bone fix stages and full builds on synthetic mods")
+    parser.add_argument("--bones", type=int, nargs="+", default=[50, 250, 1000])
+    parser.add_argument("--custom-bones", type=int, default=10)
+    parser.add_argument("--anims", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--mods", type=int, nargs="+", default=[1, 10], help="mod counts for the build_mods benchmark")
+    parser.add_argument("--build-anims", type=int, default=50, help="animations per mod in the build_mods benchmark")
+    parser.add_argument("--jobs", type=int, default=1, help="build_jobs used in the build_mods benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="JSON file to save the results to "
+                                                       "(default: benchmarks/results/COMMIT.json)")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = dict((result_key(item), item) for item in json.load(f)["results"])
+
+    commit = git_commit()
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for bone_count in args.bones:
+            for anim_count in args.anims:
+                for item in bench_stages(folder, bone_count, args.custom_bones, anim_count, args.repeat):
+                    report(item, previous.get(result_key(item)))
+                    results.append(item)
+        for bone_count in args.bones:
+            for mod_count in args.mods:
+                item = bench_build(folder, bone_count, args.custom_bones, args.build_anims, mod_count, args.jobs,
+                                   args.repeat)
+                report(item, previous.get(result_key(item)))
+                results.append(item)
+
+    output = args.output or f"{BENCHMARK_DIR}/results/{commit or 'results'}.json"
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "version": RESULTS_VERSION,
+            "commit": commit,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+            "results": results,
+        }, f, indent=2)
+    print(f"Saved results to {output}")
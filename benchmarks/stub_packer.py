@@ -0,0 +1,56 @@
+"""Stand-in for UnrealPak.exe, so packing (and the packer runner running several packers at the same time) can be tried
+without Unreal, e.g. on Linux. Point "packer_path" in config.json at this script to build mods with it.
+
+Takes the arguments the builder passes to UnrealPak and packs the mod folder listed in the response file with the
+builtin pak writer, printing a few log lines along the way like UnrealPak does.
+Environment variables make it act like a slow or broken packer:
+  STUB_PACKER_DELAY      seconds to wait before packing (default 0)
+  STUB_PACKER_EXIT_CODE  exit with this code without packing anything
+
+usage: python benchmarks/stub_packer.py PAK_FILE -create=RESPONSE_FILE [-compress]
+"""
+import os
+import re
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+import pythonfiles.pakFile as pakFile
+
+LOG_PREFIX = "LogPakFile: Display:"
+
+
+def mod_folder(response_file):
+    """The first path listed in the response file, which the builder sets to "MOD_FOLDER/*.*" """
+    with open(response_file, "r") as f:
+        paths = re.findall(r'"([^"]*)"', f.read())
+    if not paths:
+        raise ValueError(f"no paths in the response file {response_file}")
+    return os.path.dirname(paths[0])
+
+
+def main(argv):
+    args = [arg for arg in argv if not arg.startswith("-")]
+    create = [arg[len("-create="):] for arg in argv if arg.startswith("-create=")]
+    if len(args) != 1 or len(create) != 1:
+        print(__doc__)
+        return 1
+    pak_file = args[0]
+    print(f"{LOG_PREFIX} Loading response file {create[0]}", flush=True)
+    time.sleep(float(os.environ.get("STUB_PACKER_DELAY", 0)))
+    exit_code = int(os.environ.get("STUB_PACKER_EXIT_CODE", 0))
+    if exit_code != 0:
+        print(f"LogPakFile: Error: Stub packer failing on purpose with exit code {exit_code}", flush=True)
+        return exit_code
+    folder = mod_folder(create[0])
+    compression = pakFile.COMPRESSION_ZLIB if "-compress" in argv else pakFile.COMPRESSION_NONE
+    packed = pakFile.write_pak(pak_file, folder, compression=compression)
+    for path in packed:
+        print(f"{LOG_PREFIX} Added file {path}")
+    print(f"{LOG_PREFIX} Added {len(packed)} files to {pak_file}", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,235 @@
+"""Generates synthetic cooked skeleton and animation assets (.uasset + .uexp pairs) for benchmarks.
+The files have a real package summary, name map, import and export table, so they can be read with
+pythonfiles/packageSummary.py, and .uexp data laid out the way pythonfiles/readAnimAsset.py expects it.
+
+A generated mod is a modded skeleton (the original bones in a different order plus custom bones), animations using it,
+and a copy of the original skeleton in the mapping folder, just like a real mod made with this tool.
+
+usage: python benchmarks/synthetic_assets.py OUTPUT_FOLDER [--bones 250] [--custom-bones 10] [--anims 100] [--mods 1]
+"""
+import os
+import sys
+import random
+import struct
+import argparse
+
+PACKAGE_FILE_TAG = 0x9E2A83C1
+# unversioned cooked UE5 package, the same flags as the packages this tool is used on
+PACKAGE_FLAGS = 0x80000000 | 0x00002000
+LEGACY_FILE_VERSION = -8
+IMPORT_SIZE = 32
+EXPORT_SIZE = 96
+SCRIPT_ENGINE = "/Script/Engine"
+SCRIPT_CORE = "/Script/CoreUObject"
+SKELETON_FOLDER = "Pal/Model/Character/Skeleton"
+ANIMATION_FOLDER = "Pal/Animation/Character/Monster"
+
+
+def int32(value):
+    return struct.pack("<i", value)
+
+
+def fstring(value):
+    encoded = value.encode("utf-8") + b"\x00"
+    return int32(len(encoded)) + encoded
+
+
+class SyntheticPackage:
+    """Builds the .uasset of a package with a single export. Imports are (class package, class name, outer, name)
+    tuples where outer is a package index, the same as in the cooked files"""
+
+    def __init__(self, package_path, object_name):
+        self.package_path = package_path
+        self.object_name = object_name
+        self.names = {package_path, object_name, "None"}
+        self.imports = []
+
+    def add_name(self, name):
+        self.names.add(name)
+
+    def add_import(self, class_package, class_name, outer_index, object_name):
+        self.names.update((class_package, class_name, object_name))
+        self.imports.append((class_package, class_name, outer_index, object_name))
+        return -len(self.imports)
+
+    def uasset_bytes(self, class_index, template_index, uexp_size):
+        names = sorted(self.names, key=str.lower)
+        name_index = dict((name, index) for index, name in enumerate(names))
+
+        def fname(name):
+            return int32(name_index[name]) + int32(0)
+
+        name_map = b"".join(fstring(name) + bytes(4) for name in names)
+        import_map = b"".join(fname(class_package) + fname(class_name) + int32(outer) + fname(name) + int32(0)
+                              for (class_package, class_name, outer, name) in self.imports)
+        # summary fields up to depends offset, then padding for the fields after it that this tool never reads
+        summary_size = 4 * 7 + 4 + len(fstring(self.package_path)) + 4 * 3 + 4 * 2 + 4 * 2 + 4 * 5 + 64
+        name_offset = summary_size
+        import_offset = name_offset + len(name_map)
+        export_offset = import_offset + len(import_map)
+        depends_offset = export_offset + EXPORT_SIZE
+        total_header_size = depends_offset + 4
+        export_map = (int32(class_index) + int32(0) + int32(template_index) + int32(0) + fname(self.object_name)
+                      + struct.pack("<Iqq", 3, uexp_size - 4, total_header_size))
+        export_map += bytes(EXPORT_SIZE - len(export_map))
+
+        summary = struct.pack("<Iiiiiii", PACKAGE_FILE_TAG, LEGACY_FILE_VERSION, 0, 0, 0, 0, 0)
+        summary += int32(total_header_size) + fstring(self.package_path)
+        summary += struct.pack("<Iii", PACKAGE_FLAGS, len(names), name_offset)
+        summary += struct.pack("<ii", 0, import_offset)  # soft object paths
+        summary += struct.pack("<ii", 0, 0)  # gatherable text data
+        summary += struct.pack("<iiiii", 1, export_offset, len(self.imports), import_offset, depends_offset)
+        summary += bytes(summary_size - len(summary))
+        data = summary + name_map + import_map + export_map + int32(0)
+        assert len(data) == total_header_size
+        return data, name_index
+
+
+class SyntheticSkeleton:
+    """A skeleton: bone names and parents, parents always come before their children"""
+
+    def __init__(self, bone_names, parents):
+        self.bone_names = bone_names
+        self.parents = parents
+
+    def __len__(self):
+        return len(self.bone_names)
+
+    @classmethod
+    def generate(cls, bone_count, rng, prefix="bone"):
+        names = ["root"] + [f"{prefix}_{i:04d}" for i in range(1, bone_count)]
+        # mostly chains with some branching, like a real skeleton
+        parents = [-1] + [rng.choice((i - 1, i - 1, rng.randrange(0, i))) for i in range(1, bone_count)]
+        return cls(names, parents)
+
+    def modded(self, custom_bone_count, rng):
+        """The same skeleton re-imported with custom bones: every bone keeps its parent, but the bones are stored in a
+        different (depth first, shuffled children) order and custom bones are added to random bones"""
+        names = list(self.bone_names)
+        parents = list(self.parents)
+        for i in range(custom_bone_count):
+            names.append(f"custom_{i:04d}")
+            parents.append(rng.randrange(0, len(parents)))
+        children = [[] for _ in names]
+        for index, parent in enumerate(parents):
+            if parent >= 0:
+                children[parent].append(index)
+        order = []
+        stack = [0]
+        while stack:
+            index = stack.pop()
+            order.append(index)
+            rng.shuffle(children[index])
+            stack.extend(children[index])
+        new_index = dict((old, new) for new, old in enumerate(order))
+        return SyntheticSkeleton([names[old] for old in order],
+                                 [new_index[parents[old]] if parents[old] >= 0 else -1 for old in order])
+
+    def package_path(self, name):
+        return f"/Game/{SKELETON_FOLDER}/{name}/SK_{name}_Skeleton"
+
+    def write(self, folder, name):
+        """Writes SK_{name}_Skeleton.uasset/.uexp into folder, returns the path without extension"""
+        object_name = f"SK_{name}_Skeleton"
+        package = SyntheticPackage(self.package_path(name), object_name)
+        package_engine = package.add_import(SCRIPT_CORE, "Package", 0, SCRIPT_ENGINE)
+        class_skeleton = package.add_import(SCRIPT_CORE, "Class", package_engine, "Skeleton")
+        default_skeleton = package.add_import(SCRIPT_ENGINE, "Skeleton", package_engine, "Default__Skeleton")
+        for bone_name in self.bone_names:
+            package.add_name(bone_name)
+        (_, name_index) = package.uasset_bytes(class_skeleton, default_skeleton, 0)
+
+        # some tagged property data, the bone count, the bone info table, the reference pose and the name to index map
+        uexp = bytearray(b"\x00\x03\x30\x00\x00\x00" + b"\x82\x03\x01" * 6 + b"\x00" * 2)
+        uexp += int32(len(self))
+        for bone_name, parent in zip(self.bone_names, self.parents):
+            uexp += int32(name_index[bone_name]) + int32(0) + int32(parent)
+        uexp += int32(len(self))
+        for i in range(len(self)):
+            # rotation, translation and scale as doubles, 80 bytes per bone
+            uexp += struct.pack("<10d", 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, float(i), 1.0, 1.0, 1.0)
+        uexp += int32(len(self))
+        for index, bone_name in enumerate(self.bone_names):
+            uexp += int32(name_index[bone_name]) + int32(0) + int32(index)
+        uexp += bytes(32) + struct.pack("<I", PACKAGE_FILE_TAG)
+        (uasset, _) = package.uasset_bytes(class_skeleton, default_skeleton, len(uexp))
+        return write_pair(f"{folder}/{object_name}", uasset, uexp)
+
+
+def write_animation(folder, anim_name, skeleton, skeleton_name, rng, track_count=None):
+    """Writes an animation of the skeleton into folder, returns the path without extension.
+    The track table maps every animated track to a bone index of the (modded) skeleton"""
+    if track_count is None:
+        track_count = len(skeleton)
+    package = SyntheticPackage(f"/Game/{ANIMATION_FOLDER}/{skeleton_name}/{anim_name}", anim_name)
+    package_engine = package.add_import(SCRIPT_CORE, "Package", 0, SCRIPT_ENGINE)
+    class_anim = package.add_import(SCRIPT_CORE, "Class", package_engine, "AnimSequence")
+    default_anim = package.add_import(SCRIPT_ENGINE, "AnimSequence", package_engine, "Default__AnimSequence")
+    skeleton_package = package.add_import(SCRIPT_CORE, "Package", 0, skeleton.package_path(skeleton_name))
+    package.add_import(SCRIPT_ENGINE, "Skeleton", skeleton_package, f"SK_{skeleton_name}_Skeleton")
+
+    # the first tracks are always the root bones, the rest are a sorted random subset of the bones
+    tracks = [0, 1, 2] + sorted(rng.sample(range(3, len(skeleton)), track_count - 3))
+    uexp = bytearray(b"\x00\x04\x0d\x02\x02\x02\x03\x03" + b"\xfe\xff\xff\xff" * 2)
+    # compressed data header: strip flags, has compressed data, raw data size, then the track table
+    uexp += b"\x01\x00" + int32(1) + int32(track_count * 48 * 4)
+    uexp += int32(track_count)
+    for track in tracks:
+        uexp += int32(track)
+    # compressed track data, a few bytes per track per frame
+    uexp += rng.randbytes(track_count * 48) if hasattr(rng, "randbytes") else os.urandom(track_count * 48)
+    uexp += struct.pack("<I", PACKAGE_FILE_TAG)
+    (uasset, _) = package.uasset_bytes(class_anim, default_anim, len(uexp))
+    return write_pair(f"{folder}/{anim_name}", uasset, uexp)
+
+
+def write_pair(path, uasset, uexp):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.uasset", "wb") as f:
+        f.write(uasset)
+    with open(f"{path}.uexp", "wb") as f:
+        f.write(uexp)
+    return path
+
+
+def generate_mod(root, mod_name, bone_count=250, custom_bone_count=10, anim_count=100, seed=0):
+    """Creates root/mods/{mod_name} with a modded skeleton and its animations, and root/mapping/{mod_name} with the
+    original skeleton. Returns a dictionary with the paths of the generated files (without extensions)"""
+    bone_count = max(bone_count, 4)
+    rng = random.Random(seed)
+    creature = f"{mod_name.replace('_', '')}Creature"
+    original = SyntheticSkeleton.generate(bone_count, rng)
+    modded = original.modded(custom_bone_count, rng)
+    content = f"{root}/mods/{mod_name}/Pal/Content"
+    skeleton = modded.write(f"{content}/{SKELETON_FOLDER}/{creature}", creature)
+    mapping_skeleton = original.write(f"{root}/mapping/{mod_name}", creature)
+    anim_folder = f"{content}/{ANIMATION_FOLDER}/{creature}"
+    anims = [write_animation(anim_folder, f"AS_{creature}_{i:04d}", modded, creature, rng) for i in range(anim_count)]
+    return {
+        "skeleton": skeleton,
+        "mapping_skeleton": mapping_skeleton,
+        "animations": anims,
+        "bone_count": len(modded),
+    }
+
+
+def generate_mods(root, mod_count=1, bone_count=250, custom_bone_count=10, anim_count=100, seed=0):
+    """Generates mod_count mods named SyntheticMod{i}_P, returns {mod name: generate_mod result}"""
+    return dict((f"SyntheticMod{i}_P", generate_mod(root, f"SyntheticMod{i}_P", bone_count, custom_bone_count,
+                                                    anim_count, seed + i))
+                for i in range(mod_count))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates synthetic skeleton/animation mods for benchmarking")
+    parser.add_argument("output", help="folder to create the mods and mapping folders in")
+    parser.add_argument("--bones", type=int, default=250, help="number of bones in the original skeleton")
+    parser.add_argument("--custom-bones", type=int, default=10, help="number of bones added by the mod")
+    parser.add_argument("--anims", type=int, default=100, help="number of animations per mod")
+    parser.add_argument("--mods", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    mods = generate_mods(args.output, args.mods, args.bones, args.custom_bones, args.anims, args.seed)
+    print(f"Generated {len(mods)} mods with {args.bones} + {args.custom_bones} bones and {args.anims} animations each in "
+          f"{args.output}")
+    sys.exit(0)
@@ -0,0 +1,4 @@
+:: CREATES A MAPPING FOR EVERY ORIGINAL SKELETON .uasset AND .uexp IN THE FILES/FOLDERS GIVEN, EXPORT THEM USING FModel
+:: THE MAPPINGS ARE WRITTEN TO THE mappings FOLDER NEXT TO THIS FILE
+python "%~dp0skeletonBatch.py" map %* --output "%~dp0mappings"
+pause
\ No newline at end of file
@@ -1 +1 @@
-python mapper.py %*
\ No newline at end of file
+python skeletonReplacer.py %*
\ No newline at end of file
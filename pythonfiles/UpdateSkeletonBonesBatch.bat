@@ -0,0 +1,3 @@
+:: FIXES THE BONE ORDER OF EVERY SKELETON IN THE FILES/FOLDERS GIVEN, IN PLACE, WITH THE MAPPINGS IN THE mappings FOLDER NEXT TO THIS FILE
+python "%~dp0skeletonBatch.py" fix %* --mapping-dir "%~dp0mappings" --in-place
+pause
\ No newline at end of file
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import struct
+import hashlib
+from array import array
+from collections import namedtuple
+
+try:
+    from .packageSummary import read_package_summary
+except ImportError:  # run as a script from inside pythonfiles
+    from packageSummary import read_package_summary
+
+# Finds the compressed track to bone table of a cooked animation sequence (.uexp of an AS_ asset).
+# After its properties, a cooked anim sequence stores its compressed data as:
+#   strip flags (uint16), has compressed data (bool as uint32, always 1 in cooked files), raw data size (int32),
+#   track count (int32), then one int32 bone index per track
+# Only the AnimSequence export's data is searched (its range comes from the export table of the .uasset). The table is
+# first looked for by its first tracks 0,1,2, then by that whole header, and where it was found is cached per file
+# contents, so the next build can read the table straight away without searching the file.
+# Every match is checked to have a distinct valid bone index per track. Header matches are tried front to back, so a run
+# of bone indexes inside a real table that looks like a header (1, 2, 3 followed by three more indexes) is never reached.
+
+ANIM_LAYOUT_CACHE_VERSION = 2
+# int32s in the header before the track table: has compressed data, raw data size, track count
+TRACK_TABLE_HEADER_SIZE = 3 * 4
+MAX_TRACKS = 0xffff
+# shorter tables are too easy to find by accident (1,0,1,0 would be a 1 track table), the 0,1,2 search needs 3 as well
+MIN_TRACKS = 3
+# what the original search looked for: the first three tracks being bones 0, 1 and 2
+FIRST_TRACKS_PATTERN = b'\x00\x00\x00\x00\x01\x00\x00\x00\x02\x00\x00\x00'
+
+# offset of the first track's bone index, and the number of tracks
+TrackTable = namedtuple('TrackTable', 'offset count')
+
+
+def read_int32(data, offset):
+    return int.from_bytes(data[offset:offset + 4], "little", signed=True)
+
+
+def has_track_bones(data, table, bone_count):
+    """Checks that table.offset holds one distinct bone index per track, each smaller than bone_count"""
+    if table.offset < 0 or table.offset + table.count * 4 > len(data):
+        return False
+    if not MIN_TRACKS <= table.count <= min(bone_count, MAX_TRACKS):
+        return False
+    raw = data[table.offset:table.offset + table.count * 4]
+    # bone indexes are 16 bit in unreal, so the two high bytes of each int32 are 0 (which also rules out negatives)
+    if raw[2::4].count(0) != table.count or raw[3::4].count(0) != table.count:
+        return False
+    bones = array('i', raw)
+    if sys.byteorder != "little":
+        bones.byteswap()
+    return max(bones) < bone_count and len(set(bones)) == table.count
+
+
+def is_track_table(data, table, bone_count):
+    """Checks that a track table is really at table.offset: a header with has compressed data set and a valid raw size,
+    followed by one distinct bone index per track, each smaller than bone_count"""
+    header = table.offset - TRACK_TABLE_HEADER_SIZE
+    if header < 0 or read_int32(data, header) != 1 or read_int32(data, header + 4) < 0:
+        return False
+    return read_int32(data, header + 8) == table.count and has_track_bones(data, table, bone_count)
+
+
+def find_track_table(data, bone_count, start=0, end=None):
+    """Returns the TrackTable of an anim sequence .uexp between start and end, or None if it has no valid track table.
+    The table starting with tracks 0,1,2 is tried first, then every offset where the header starts with has compressed
+    data = 1, returning the first valid table"""
+    end = len(data) if end is None else end
+    table = find_track_table_by_pattern(data, start, end)
+    if table is not None and has_track_bones(data, table, bone_count):
+        return table
+    header = data.find(b'\x01\x00\x00\x00', start, end)
+    while header != -1:
+        table = TrackTable(header + TRACK_TABLE_HEADER_SIZE, read_int32(data, header + 8))
+        if is_track_table(data, table, bone_count):
+            return table
+        header = data.find(b'\x01\x00\x00\x00', header + 1, end)
+    return None
+
+
+def find_track_table_by_pattern(data, start=0, end=None):
+    """The original search: finds the first tracks 0,1,2"""
+    offset = data.find(FIRST_TRACKS_PATTERN, start, len(data) if end is None else end)
+    if offset < 4:
+        return None
+    return TrackTable(offset, read_int32(data, offset - 4))
+
+
+def anim_export_range(uexp_file):
+    """(start, end) of the AnimSequence export's data in an animation .uexp, from the export table of its .uasset.
+    None if the .uasset is missing or can't be read"""
+    uasset_file = os.path.splitext(str(uexp_file))[0] + ".uasset"
+    if not os.path.isfile(uasset_file):
+        return None
+    try:
+        summary = read_package_summary(uasset_file)
+        for export in summary.exports:
+            export_class = summary.resolve(export.class_index)
+            if export_class is not None and export_class.object_name == "AnimSequence":
+                start = summary.export_data_offset(export)
+                return (start, start + export.serial_size) if start >= 0 and export.serial_size > 0 else None
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+    return None
+
+
+class AnimLayoutCache:
+    """Remembers where the track table of each animation is, by the sha1 of the file's contents.
+    The fingerprint (size, mtime, hash) of every file is kept too, so an unchanged file isn't hashed again"""
+
+    def __init__(self, files=None, layouts=None):
+        # file -> fingerprint, and content hash -> [table offset, track count]
+        self.files = files or {}
+        self.layouts = layouts or {}
+        self.used_files = {}
+
+    @classmethod
+    def load(cls, cache_file):
+        try:
+            with open(cache_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if data.get("version") != ANIM_LAYOUT_CACHE_VERSION:
+            return cls()
+        return cls(data["files"], data["layouts"])
+
+    def save(self, cache_file):
+        """Saves the layouts of every file that still exists, files that left the mod are dropped"""
+        files = dict((file, fingerprint) for file, fingerprint in self.files.items() if os.path.exists(file))
+        files.update(self.used_files)
+        hashes = set(fingerprint["hash"] for fingerprint in files.values())
+        data = {
+            "version": ANIM_LAYOUT_CACHE_VERSION,
+            "files": files,
+            "layouts": dict((sha, layout) for sha, layout in self.layouts.items() if sha in hashes),
+        }
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_file, cache_file)
+
+    def fingerprint(self, file_name, data):
+        """Fingerprint of the file, hashing the already mapped data if its size or mtime changed"""
+        stat = os.stat(file_name)
+        previous = self.files.get(str(file_name))
+        if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime_ns:
+            fingerprint = dict(previous)
+        else:
+            fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": hashlib.sha1(data).hexdigest()}
+        self.used_files[str(file_name)] = fingerprint
+        return fingerprint
+
+    def lookup(self, file_name, data):
+        """Returns the cached TrackTable of the file's contents, or None"""
+        layout = self.layouts.get(self.fingerprint(file_name, data)["hash"])
+        return TrackTable(*layout) if layout is not None else None
+
+    def store(self, file_name, table):
+        fingerprint = self.used_files.get(str(file_name))
+        if fingerprint is not None:
+            self.layouts[fingerprint["hash"]] = list(table)
+
+
+def read_track_table(data, bone_count, layout_cache=None, file_name=None):
+    """Returns the TrackTable of an anim sequence .uexp (mapped as data), from the cache if it has this file's contents.
+    Returns None if the table can't be found"""
+    table = layout_cache.lookup(file_name, data) if layout_cache is not None else None
+    if table is not None and has_track_bones(data, table, bone_count):
+        return table
+    export_range = anim_export_range(file_name) if file_name is not None else None
+    table = find_track_table(data, bone_count, *(export_range or ()))
+    if table is not None and layout_cache is not None:
+        layout_cache.store(file_name, table)
+    return table
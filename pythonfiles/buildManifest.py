@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+
+try:
+    from . import buildTrace
+except ImportError:  # run as a script from inside pythonfiles
+    import buildTrace
+
+# bump this whenever the layout of the manifest changes, older manifests are then ignored (full rebuild)
+MANIFEST_VERSION = 1
+# config values that change the output of a build. pathing values are covered by the input/output hashes instead
+BUILD_CONFIG_KEYS = ("bone_fix", "keep_skeleton", "fix_meshes", "anim_search_pattern", "pak_writer", "pak_compression")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_name):
+    """Returns the sha1 hex digest of a file's contents"""
+    sha = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+            buildTrace.count(bytes_read=len(chunk))
+    return sha.hexdigest()
+
+
+def file_fingerprint(file_name, previous=None):
+    """Returns a {size, mtime, hash} record for a file.
+    If the previous record has the same size and mtime, its hash is reused instead of re-reading the file"""
+    stat = os.stat(file_name)
+    if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime_ns:
+        return dict(previous)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": hash_file(file_name)
+    }
+
+
+def fingerprint_matches(file_name, fingerprint):
+    """Checks if a file on disk still has the contents recorded in the fingerprint"""
+    if fingerprint is None or not os.path.isfile(file_name):
+        return False
+    return file_fingerprint(file_name, fingerprint)["hash"] == fingerprint["hash"]
+
+
+def config_fingerprint(config):
+    """Hash of the config values that affect how a mod is built"""
+    values = dict((key, config.get(key)) for key in BUILD_CONFIG_KEYS)
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def relative_key(file_name, root):
+    """Manifest entries are keyed by forward-slash paths relative to the mod (or mapping) folder"""
+    return os.path.relpath(file_name, root).replace(os.sep, "/")
+
+
+def fingerprint_dir(working_dir, previous=None, exclude=(), exclude_extensions=()):
+    """Fingerprints every file directly inside working_dir (not recursive), skipping names in exclude and
+    files ending with any of exclude_extensions (generated files such as compiled mappings)"""
+    previous = previous or {}
+    fingerprints = {}
+    if not os.path.isdir(working_dir):
+        return fingerprints
+    for name in sorted(os.listdir(working_dir)):
+        file_name = f"{working_dir}/{name}"
+        if name in exclude or name.endswith(tuple(exclude_extensions)) or not os.path.isfile(file_name):
+            continue
+        fingerprints[name] = file_fingerprint(file_name, previous.get(name))
+    return fingerprints
+
+
+def fingerprint_files(files, root, previous=None):
+    """Fingerprints a list of files, keyed by their path relative to root"""
+    previous = previous or {}
+    fingerprints = {}
+    for file in files:
+        key = relative_key(file, root)
+        fingerprints[key] = file_fingerprint(file, previous.get(key))
+    return fingerprints
+
+
+def same_contents(fingerprints, other_fingerprints):
+    """Compares two sets of fingerprints by file name and hash only, mtimes are allowed to differ"""
+    if other_fingerprints is None or fingerprints.keys() != other_fingerprints.keys():
+        return False
+    return all(fp["hash"] == other_fingerprints[key]["hash"] for key, fp in fingerprints.items())
+
+
+def new_manifest(config, mapping_fingerprints, previous=None, keep_fixed=True):
+    """Creates the manifest for the current build.
+    Bone fix records (which files are already fixed, and the remap used) carry over from the previous manifest
+    unless keep_fixed is False, since those files are fixed in place and must never be remapped twice"""
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "config": config_fingerprint(config),
+        "mapping": mapping_fingerprints,
+        "inputs": {},
+        "outputs": {},
+        "fixed": {},
+        "remaps": {},
+        "pak": None
+    }
+    if previous is not None and keep_fixed:
+        manifest["fixed"] = dict(previous.get("fixed", {}))
+        manifest["remaps"] = dict(previous.get("remaps", {}))
+    return manifest
+
+
+def settings_changed(config, mapping_fingerprints, previous):
+    """True if the config or mapping files are different from the previous build"""
+    if previous is None:
+        return True
+    return previous["config"] != config_fingerprint(config) or not same_contents(mapping_fingerprints,
+                                                                                  previous["mapping"])
+
+
+def is_bone_fixed(manifest, file_name, root):
+    """True if the file on disk is byte for byte the file that was written by a previous bone fix.
+    Files with the recorded size and mtime aren't read again, for others the record is updated if the hash still matches"""
+    if manifest is None:
+        return False
+    key = relative_key(file_name, root)
+    fixed = manifest["fixed"].get(key)
+    if fixed is None or not os.path.isfile(file_name):
+        return False
+    if isinstance(fixed, str):  # manifests written before the fixed files had fingerprints only kept the hash
+        fixed = {"size": None, "mtime": None, "hash": fixed}
+    fingerprint = file_fingerprint(file_name, fixed)
+    if fingerprint["hash"] != fixed["hash"]:
+        return False
+    manifest["fixed"][key] = fingerprint
+    return True
+
+
+def mark_bone_fixed(manifest, file_name, root):
+    """Records the post-fix fingerprint of a file so later builds know not to remap it again"""
+    if manifest is None:
+        return
+    manifest["fixed"][relative_key(file_name, root)] = file_fingerprint(file_name)
+
+
+def read_manifest(file_name):
+    """Returns the manifest stored at file_name, or None if there isn't a usable one"""
+    if not os.path.exists(file_name):
+        return None
+    try:
+        with open(file_name, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        print(f"WARNING: Unable to read build manifest {file_name}, doing a full rebuild")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(file_name, manifest):
+    with open(file_name, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
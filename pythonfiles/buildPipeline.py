@@ -0,0 +1,96 @@
+import queue
+import threading
+import contextlib
+
+# Runs a list of items (mods) through a list of stages like a production line: every stage has its own thread and
+# passes each item on to the next stage through a queue, so while one item is in a later stage (packing, copying)
+# the next one is already in an earlier stage (pulling, fixing).
+# The queues between the stages only hold a few items ('depth'), when a stage falls behind the stages before it
+# wait for it, so no matter how many items there are, only a few of them are in memory at the same time.
+
+# put in a queue after the last item
+_END = object()
+
+
+class ThreadOutput:
+    """Stand-in for sys.stdout that sends what a thread prints to that thread's log (see capture), so stages working
+    on different items at the same time each print into their own item's log. Other threads print to the stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def target(self):
+        log = getattr(self.local, "log", None)
+        return self.stream if log is None else log
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @contextlib.contextmanager
+    def capture(self, log):
+        """Sends everything the calling thread prints to log (a file like object, None for the stream)"""
+        previous = getattr(self.local, "log", None)
+        self.local.log = log
+        try:
+            yield log
+        finally:
+            self.local.log = previous
+
+
+class Pipeline:
+    """Runs items through stages, each stage on its own thread. stage(item) returns True to pass the item on to the next
+    stage, or False when the item is finished (e.g. a mod that's up to date doesn't need to be packed).
+    At most 'depth' items wait between two stages"""
+
+    def __init__(self, stages, depth=1):
+        self.stages = list(stages)
+        self.depth = max(depth, 1)
+
+    def run(self, items):
+        """Yields (item, error) for every item as soon as it's finished, error being the exception a stage raised or
+        None. Items go through each stage in the order they are given"""
+        inputs = [queue.Queue(maxsize=self.depth) for _ in self.stages]
+        finished = queue.Queue()
+
+        def feed():
+            for item in items:
+                inputs[0].put(item)
+            inputs[0].put(_END)
+
+        def work(index):
+            stage = self.stages[index]
+            last = index == len(self.stages) - 1
+            while True:
+                item = inputs[index].get()
+                if item is _END:
+                    (finished if last else inputs[index + 1]).put(_END)
+                    return
+                error = None
+                try:
+                    passed_on = stage(item) and not last
+                except Exception as ex:
+                    (passed_on, error) = (False, ex)
+                if passed_on:
+                    inputs[index + 1].put(item)
+                else:
+                    finished.put((item, error))
+
+        threads = [threading.Thread(target=feed, name="pipeline feed", daemon=True)]
+        threads += [threading.Thread(target=work, args=(index,), name=f"pipeline stage {index}", daemon=True)
+                    for index in range(len(self.stages))]
+        for thread in threads:
+            thread.start()
+        while True:
+            result = finished.get()
+            if result is _END:
+                break
+            yield result
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import threading
+import contextlib
+
+# Records how long each build stage and file operation takes and how much I/O it does, and saves it as a
+# Chrome/Perfetto trace (open it in chrome://tracing or https://ui.perfetto.dev) plus a per mod summary.
+# Tracing is off unless enable() is called, and then span()/count() return right away, so it costs next to nothing.
+
+CATEGORY_MOD = "mod"
+CATEGORY_STAGE = "stage"
+CATEGORY_FILE = "file"
+# I/O counters, added to the innermost span of the calling thread and to the totals of the current mod stage
+COUNTER_BYTES_READ = "bytes_read"
+COUNTER_BYTES_WRITTEN = "bytes_written"
+COUNTER_MMAPS = "mmaps"
+COUNTER_FILES_SKIPPED = "files_skipped"
+COUNTERS = (COUNTER_BYTES_READ, COUNTER_BYTES_WRITTEN, COUNTER_MMAPS, COUNTER_FILES_SKIPPED)
+
+_NO_SPAN = contextlib.nullcontext()
+_tracer = None
+
+
+class Span:
+    """A timed block of code, saved as a complete ("X") trace event when it ends"""
+    __slots__ = ("tracer", "name", "category", "args", "counters", "start", "previous")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.counters = {}
+
+    def __enter__(self):
+        self.tracer.push(self)
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        duration = time.time_ns() - self.start
+        self.tracer.pop(self, duration, exc_type)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pid = os.getpid()
+        self.events = []
+        # mod name -> stage name -> {"wall_time", "calls", counters...}
+        self.stages = {}
+        self.statuses = {}
+
+    def stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def context(self):
+        """(mod, stage) the calling thread is building. Each thread has its own, since the build pipeline runs stages
+        of different mods at the same time. Helper threads get the context of the thread that started them (see wrap)"""
+        return getattr(self.local, "context", (None, None))
+
+    def push(self, span):
+        self.stack().append(span)
+        span.previous = self.context()
+        if span.category == CATEGORY_MOD:
+            self.local.context = (span.name, None)
+        elif span.category == CATEGORY_STAGE:
+            self.local.context = (span.previous[0], span.name)
+
+    def pop(self, span, duration, exc_type):
+        stack = self.stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        args = dict(span.args)
+        args.update(span.counters)
+        if exc_type is not None:
+            args["error"] = exc_type.__name__
+        event = {"name": span.name, "cat": span.category, "ph": "X", "ts": span.start / 1000, "dur": duration / 1000,
+                 "pid": self.pid, "tid": threading.get_ident(), "args": args}
+        with self.lock:
+            self.events.append(event)
+            if span.category in (CATEGORY_MOD, CATEGORY_STAGE):
+                stage = self.stage_totals(self.context()[0], span.name if span.category == CATEGORY_STAGE else "total")
+                stage["wall_time"] += duration / 1e9
+                stage["calls"] += 1
+        if span.category in (CATEGORY_MOD, CATEGORY_STAGE):
+            self.local.context = span.previous
+
+    def stage_totals(self, mod, stage):
+        stages = self.stages.setdefault(mod or "", {})
+        if stage not in stages:
+            stages[stage] = dict(wall_time=0.0, calls=0, **dict((counter, 0) for counter in COUNTERS))
+        return stages[stage]
+
+    def count(self, counters):
+        stack = self.stack()
+        if stack:
+            span_counters = stack[-1].counters
+            for counter, value in counters.items():
+                span_counters[counter] = span_counters.get(counter, 0) + value
+        (mod, stage) = self.context()
+        with self.lock:
+            totals = self.stage_totals(mod, stage or "other")
+            for counter, value in counters.items():
+                totals[counter] = totals.get(counter, 0) + value
+
+    def data(self):
+        """Everything recorded so far, in a form that can be sent between processes and merged"""
+        with self.lock:
+            return {"events": list(self.events), "stages": self.stages, "statuses": dict(self.statuses)}
+
+    def merge(self, data):
+        with self.lock:
+            self.events.extend(data["events"])
+            self.statuses.update(data["statuses"])
+            for mod, stages in data["stages"].items():
+                for stage, totals in stages.items():
+                    merged = self.stage_totals(mod, stage)
+                    for key, value in totals.items():
+                        merged[key] = merged.get(key, 0) + value
+
+
+def enable():
+    """Starts recording, throwing away anything recorded before"""
+    global _tracer
+    _tracer = Tracer()
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def span(name, category=CATEGORY_FILE, **args):
+    """Context manager that times a block of code. Mod and stage spans also set the mod/stage that I/O is counted for"""
+    if _tracer is None:
+        return _NO_SPAN
+    return Span(_tracer, name, category, args)
+
+
+def mod_span(mod_name):
+    return span(mod_name, CATEGORY_MOD)
+
+
+def stage_span(stage_name):
+    return span(stage_name, CATEGORY_STAGE)
+
+
+def count(**counters):
+    """Adds to the I/O counters, e.g. count(bytes_read=size, mmaps=1)"""
+    if _tracer is None:
+        return
+    _tracer.count(counters)
+
+
+def wrap(function):
+    """Returns function, made to count its I/O towards the calling thread's mod and stage wherever it runs.
+    Used for work handed to a thread pool, whose threads don't know which mod they're working for"""
+    if _tracer is None:
+        return function
+    tracer = _tracer
+    context = tracer.context()
+
+    def run_in_context(*args, **kwargs):
+        previous = tracer.context()
+        tracer.local.context = context
+        try:
+            return function(*args, **kwargs)
+        finally:
+            tracer.local.context = previous
+    return run_in_context
+
+
+def set_mod_status(mod_name, status):
+    if _tracer is None:
+        return
+    with _tracer.lock:
+        _tracer.statuses[mod_name] = status
+
+
+def collect():
+    """Returns everything recorded so far and stops recording. Used by worker processes to send their trace back"""
+    global _tracer
+    if _tracer is None:
+        return None
+    data = _tracer.data()
+    _tracer = None
+    return data
+
+
+def merge(data):
+    """Adds the trace recorded by another process (see collect)"""
+    if _tracer is None or data is None:
+        return
+    _tracer.merge(data)
+
+
+def summary():
+    """Per mod build status, total time and the wall time and I/O of every stage"""
+    if _tracer is None:
+        return {}
+    data = _tracer.data()
+    mods = {}
+    for mod, stages in sorted(data["stages"].items()):
+        total = stages.get("total", {})
+        mods[mod or "(no mod)"] = {
+            "status": data["statuses"].get(mod),
+            "wall_time": total.get("wall_time", 0.0),
+            "stages": dict((stage, totals) for stage, totals in stages.items() if stage != "total"),
+        }
+    return {"mods": mods}
+
+
+def summary_path(trace_file):
+    return f"{os.path.splitext(trace_file)[0]}.summary.json"
+
+
+def write_trace(trace_file):
+    """Saves the trace as Chrome trace event JSON, and the summary next to it as TRACE.summary.json"""
+    if _tracer is None:
+        return
+    data = _tracer.data()
+    events = list(data["events"])
+    for pid in sorted(set(event["pid"] for event in events)):
+        name = "ModBuilder" if pid == _tracer.pid else f"build worker {pid}"
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": name}})
+    events.sort(key=lambda event: event.get("ts", 0))
+    with open(trace_file, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    with open(summary_path(trace_file), "w") as f:
+        json.dump(summary(), f, indent=2)
@@ -0,0 +1,175 @@
+import os
+import shutil
+import threading
+import concurrent.futures
+
+try:
+    from . import buildManifest
+    from . import buildTrace
+except ImportError:  # run as a script from inside pythonfiles
+    import buildManifest
+    import buildTrace
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+# ioctl that makes a copy-on-write clone of a file on filesystems that support it (btrfs, xfs)
+FICLONE = 0x40049409
+
+COPY_REFLINK = "reflink"
+COPY_HARDLINK = "hardlink"
+COPY_FILE_RANGE = "copy_file_range"
+COPY_FULL = "copy"
+
+
+class CopyStats:
+    """Counts what a batch of copies actually did. Safe to update from multiple threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files_copied = 0
+        self.files_skipped = 0
+        self.bytes_copied = 0
+        self.methods = {}
+
+    def add_copied(self, size, method):
+        with self.lock:
+            self.files_copied += 1
+            # reflinks and hardlinks share the data instead of copying it
+            if method not in (COPY_REFLINK, COPY_HARDLINK):
+                self.bytes_copied += size
+            self.methods[method] = self.methods.get(method, 0) + 1
+
+    def add_skipped(self):
+        with self.lock:
+            self.files_skipped += 1
+
+    def __str__(self):
+        methods = ", ".join(f"{count} {method}" for method, count in sorted(self.methods.items()))
+        return (f"{self.files_copied} copied ({format_size(self.bytes_copied)} written"
+                f"{', ' + methods if methods else ''}), {self.files_skipped} unchanged")
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def files_match(src, dst):
+    """True if dst already has the same contents as src. Same size and mtime is trusted, otherwise same size
+    files are compared by hash"""
+    if not os.path.isfile(dst):
+        return False
+    src_stat = os.stat(src)
+    dst_stat = os.stat(dst)
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+        return True
+    return buildManifest.hash_file(src) == buildManifest.hash_file(dst)
+
+
+def try_reflink(src, dst):
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def try_copy_file_range(src, dst):
+    if not hasattr(os, "copy_file_range"):
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+            return remaining == 0
+    except OSError:
+        return False
+
+
+def try_hardlink(src, dst):
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+        return True
+    except OSError:
+        return False
+
+
+def copy_data(src, dst, allow_hardlink=False):
+    """Copies the contents of src to dst using the cheapest method the filesystem supports. Returns the method used.
+    Hardlinks are only used if allowed, since editing a hardlinked file in place (like the bone fix does) also edits the source"""
+    if allow_hardlink and try_hardlink(src, dst):
+        return COPY_HARDLINK
+    if try_reflink(src, dst):
+        return COPY_REFLINK
+    if try_copy_file_range(src, dst):
+        return COPY_FILE_RANGE
+    shutil.copyfile(src, dst)
+    return COPY_FULL
+
+
+def copy_file(src, dst, stats=None, allow_hardlink=False, atomic=False):
+    """Copies src to dst unless dst already has the same contents. Returns True if the file was copied.
+    With atomic, the file is copied to a temp file next to dst and renamed over it, so dst is never half written"""
+    if files_match(src, dst):
+        if stats is not None:
+            stats.add_skipped()
+        buildTrace.count(files_skipped=1)
+        return False
+    target = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp" if atomic else dst
+    try:
+        with buildTrace.span("copy_file", file=os.path.basename(dst)):
+            method = copy_data(src, target, allow_hardlink)
+            if method not in (COPY_REFLINK, COPY_HARDLINK):
+                size = os.path.getsize(target)
+                buildTrace.count(bytes_read=size, bytes_written=size)
+        if method != COPY_HARDLINK:
+            # keep the source mtime, so the next build can tell the files match without hashing them
+            src_stat = os.stat(src)
+            os.utime(target, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        if atomic:
+            os.replace(target, dst)
+    finally:
+        if atomic and os.path.exists(target):
+            os.remove(target)
+    if stats is not None:
+        stats.add_copied(os.path.getsize(dst), method)
+    return True
+
+
+def copy_files(file_pairs, jobs=0, allow_hardlink=False) -> CopyStats:
+    """Copies a list of (src, dst) pairs on a pool of threads, skipping files that are already up to date"""
+    stats = CopyStats()
+    if jobs <= 0:
+        jobs = min(32, (os.cpu_count() or 1) + 4)
+    if len(file_pairs) <= 1 or jobs == 1:
+        for (src, dst) in file_pairs:
+            copy_file(src, dst, stats, allow_hardlink)
+        return stats
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(jobs, len(file_pairs))) as pool:
+        # list() so exceptions from the copies are raised here
+        list(pool.map(buildTrace.wrap(lambda pair: copy_file(pair[0], pair[1], stats, allow_hardlink)), file_pairs))
+    return stats
+
+
+def deploy_file(src, dst, allow_hardlink=False) -> CopyStats:
+    """Copies a built file (e.g. a .pak) to its final location atomically, skipping it if it's already there"""
+    stats = CopyStats()
+    copy_file(src, dst, stats, allow_hardlink, atomic=True)
+    return stats
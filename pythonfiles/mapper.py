@@ -1,18 +1,33 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from typing import Sequence
 
-from .readAnimAsset import *
+try:
+    from .readAnimAsset import *
+except ImportError:  # run as a script from inside pythonfiles
+    from readAnimAsset import *
 import sys
 import json
+import struct
+import hashlib
+import threading
 
 DEFAULT_MAPPING_FILE = "mapping.json"
+# compiled mappings are saved next to their .json file, and rebuilt whenever the .json changes
+COMPILED_MAPPING_EXTENSION = ".bin"
+COMPILED_MAPPING_MAGIC = b"SKMP"
+COMPILED_MAPPING_VERSION = 1
+# magic, version, json size, json mtime, json sha1, bone count
+COMPILED_MAPPING_HEADER = struct.Struct("<4sIQq20sI")
+MAPPING_CACHE_SIZE = 64
+
+# bone_names[bone index] = bone name (None if the mapping skips that index), name_to_index is the reverse
+CompiledMapping = namedtuple('CompiledMapping', 'bone_names name_to_index source_hash')
 
 
 def create_mapping_file(file_name, bone_order: Sequence[BoneData], name_mappings):
+    bone_order = BoneTable.from_bones(bone_order)
     structs = []
-    for index, bi in enumerate(bone_order):
-        bone_index = bi.bone_name_index
-        bone_name = name_mappings[bone_index]
+    for index, bone_name in enumerate(bone_order.bone_names(name_mappings)):
         structs.append(
             {
                 "bone_name": bone_name,
@@ -22,8 +37,12 @@ def create_mapping_file(file_name, bone_order: Sequence[BoneData], name_mappings
         "bone_count": len(bone_order),
         "bones": structs
     }
-    with open(file_name, "w") as f:
+    # write to a temp file first, so nothing (e.g. another build process using the same registry mapping) ever reads
+    # half a mapping file
+    temp_file = f"{file_name}.{os.getpid()}.tmp"
+    with open(temp_file, "w") as f:
         json.dump(json_obj, f, indent=2)
+    os.replace(temp_file, file_name)
 
 
 def read_mapping_file(file_name):
@@ -31,68 +50,154 @@ def read_mapping_file(file_name):
         return json.load(f)
 
 
+def compile_mapping(mapping_data, source_hash=b"") -> CompiledMapping:
+    """Converts the json mapping data into a CompiledMapping"""
+    bone_names = [None] * mapping_data["bone_count"]
+    for item in mapping_data["bones"]:
+        bone_names[item["bone_index"]] = item["bone_name"]
+    return compiled_mapping_from_names(bone_names, source_hash)
+
+
+def compiled_mapping_from_names(bone_names, source_hash=b"") -> CompiledMapping:
+    name_to_index = dict((name, index) for index, name in enumerate(bone_names) if name is not None)
+    return CompiledMapping(bone_names, name_to_index, source_hash)
+
+
+def compiled_mapping_path(file_name):
+    return f"{os.path.splitext(file_name)[0]}{COMPILED_MAPPING_EXTENSION}"
+
+
+def write_compiled_mapping(file_name, mapping: CompiledMapping, source_size, source_mtime):
+    """Saves a compiled mapping: a header with the size, mtime and hash of the json it was built from,
+    followed by every bone name as a length prefixed utf-8 string (length -1 if there is no bone at that index)"""
+    data = bytearray(COMPILED_MAPPING_HEADER.pack(COMPILED_MAPPING_MAGIC, COMPILED_MAPPING_VERSION, source_size,
+                                                  source_mtime, mapping.source_hash, len(mapping.bone_names)))
+    for name in mapping.bone_names:
+        if name is None:
+            data += struct.pack("<i", -1)
+        else:
+            encoded = name.encode("utf-8")
+            data += struct.pack("<i", len(encoded)) + encoded
+    # write to a temp file first, so a build that gets interrupted never leaves half a compiled mapping behind
+    temp_file = f"{file_name}.{os.getpid()}.tmp"
+    with open(temp_file, "wb") as f:
+        f.write(data)
+    os.replace(temp_file, file_name)
+
+
+def read_compiled_mapping(file_name):
+    """Returns (CompiledMapping, json size, json mtime), or None if the file is missing or from another version"""
+    if not os.path.exists(file_name):
+        return None
+    with open(file_name, "rb") as f:
+        data = f.read()
+    if len(data) < COMPILED_MAPPING_HEADER.size:
+        return None
+    (magic, version, source_size, source_mtime, source_hash, bone_count) = COMPILED_MAPPING_HEADER.unpack_from(data)
+    if magic != COMPILED_MAPPING_MAGIC or version != COMPILED_MAPPING_VERSION:
+        return None
+    offset = COMPILED_MAPPING_HEADER.size
+    bone_names = []
+    for i in range(bone_count):
+        (length,) = struct.unpack_from("<i", data, offset)
+        offset += 4
+        if length < 0:
+            bone_names.append(None)
+        else:
+            bone_names.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+    return compiled_mapping_from_names(bone_names, source_hash), source_size, source_mtime
+
+
+def compile_mapping_file(file_name, save_compiled=True) -> CompiledMapping:
+    """Returns the compiled version of a json mapping file, using the compiled sidecar file if it is still valid.
+    The sidecar is trusted if the json's size and mtime match, otherwise the json is hashed to check if it really changed.
+    Without save_compiled, a new sidecar isn't written (for dry runs)"""
+    stat = os.stat(file_name)
+    compiled_file = compiled_mapping_path(file_name)
+    compiled = read_compiled_mapping(compiled_file)
+    if compiled is not None and compiled[1] == stat.st_size and compiled[2] == stat.st_mtime_ns:
+        return compiled[0]
+    with open(file_name, "rb") as f:
+        source = f.read()
+    source_hash = hashlib.sha1(source).digest()
+    if compiled is not None and compiled[0].source_hash == source_hash:
+        mapping = compiled[0]
+    else:
+        mapping = compile_mapping(json.loads(source), source_hash)
+    if save_compiled:
+        write_compiled_mapping(compiled_file, mapping, stat.st_size, stat.st_mtime_ns)
+    return mapping
+
+
+_mapping_cache = OrderedDict()
+_mapping_cache_lock = threading.Lock()
+
+
+def load_mapping(file_name, save_compiled=True) -> CompiledMapping:
+    """Returns the compiled mapping of a json mapping file. Mappings are kept in a small in-memory LRU cache, keyed by
+    path, size and mtime, so skeletons that get fixed again in the same process don't touch the disk"""
+    stat = os.stat(file_name)
+    key = (os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns)
+    with _mapping_cache_lock:
+        if key in _mapping_cache:
+            _mapping_cache.move_to_end(key)
+            return _mapping_cache[key]
+    mapping = compile_mapping_file(file_name, save_compiled)
+    with _mapping_cache_lock:
+        _mapping_cache[key] = mapping
+        while len(_mapping_cache) > MAPPING_CACHE_SIZE:
+            _mapping_cache.popitem(last=False)
+    return mapping
+
+
 # given a mapping order, and an input bone_order & name mapping for the bones, rearrange the bones to fit the mapping_data
 # for context, 'old' refers to the order being modified. in this case the modded data.
-def bone_order_from_mapping(mapping_data, old_bone_order, old_name_mapping) -> (Sequence[BoneData], {int, int}):
-    if len(mapping_data["bones"]) != len(old_bone_order):
-        pass
-        # while len(mapping_data["bones"]) > len(old_bone_order):
-        #     del (old_bone_order[-1])  # delete last index
-
-    new_order_mapping = dict((item["bone_name"], item) for item in mapping_data["bones"])
-    new_bone_order = [BoneData(0, 0)] * mapping_data["bone_count"]
-    extra_bones = []
-    bone_index_order = {}
+def bone_order_from_mapping(mapping_data, old_bone_order, old_name_mapping) -> (BoneTable, array):
+    """Returns the fixed bone order and a dense remap array, where remap[old bone index] = new bone index.
+    mapping_data can be a CompiledMapping or the json mapping data. Runs in a single pass over the bones"""
+    if not isinstance(mapping_data, CompiledMapping):
+        mapping_data = compile_mapping(mapping_data)
+    old_bone_order = BoneTable.from_bones(old_bone_order)
+    old_names = old_bone_order.bone_names(old_name_mapping)
+    old_parents = old_bone_order.parent_indexes
+    name_to_index = mapping_data.name_to_index
+    bone_count = len(mapping_data.bone_names)
 
     # make sure first bone is root bone. if not, you got yourself a problem
-    root_bone_name = old_name_mapping[old_bone_order[0].bone_name_index]
+    root_bone_name = old_names[0]
     if not (root_bone_name == "root"):
         raise Exception("Skeleton used in mod does not have the base name 'Armature'")
 
-    for old_index, boneData in enumerate(old_bone_order):
-        # print(map)
-        bone_name = old_name_mapping[boneData.bone_name_index]
-        new_item = new_order_mapping.get(bone_name)
-        old_parent_index = boneData.parent_index
-        old_parent_name = old_name_mapping[old_bone_order[old_parent_index].bone_name_index]
-        if boneData.parent_index == -1:
+    # bones in the original skeleton go to their original index, custom bones get added after them in their old order.
+    # parents always come before their children, so a bone's parent already has its new index when the bone is reached
+    bone_index_remap = array('i', bytes(INT_SIZE * len(old_bone_order)))
+    new_name_indexes = array('i', bytes(INT_SIZE * bone_count))
+    new_parent_indexes = array('i', bytes(INT_SIZE * bone_count))
+    extra_name_indexes = array('i')
+    extra_parent_indexes = array('i')
+    for old_index, bone_name in enumerate(old_names):
+        old_parent_index = old_parents[old_index]
+        if old_parent_index == -1:
             new_parent_index = -1
+        elif old_parent_index < old_index:
+            new_parent_index = bone_index_remap[old_parent_index]
+        else:  # parent comes after this bone, can only be resolved if it's in the original skeleton
+            new_parent_index = name_to_index.get(old_names[old_parent_index], -2)
+
+        new_index = name_to_index.get(bone_name)
+        if new_index is None:  # bone doesnt exist in original skeleton
+            new_index = bone_count + len(extra_name_indexes)
+            extra_name_indexes.append(old_bone_order.name_indexes[old_index])
+            extra_parent_indexes.append(new_parent_index)
         else:
-            new_parent = new_order_mapping.get(old_parent_name)
-            if new_parent is None: # old_parent_name was a custom bone!
-                new_parent_index = -2
-                for index,extra in enumerate(extra_bones):
-                    temp_old_index = extra[1]
-                    if temp_old_index == old_parent_index:
-                        new_parent_index = len(new_bone_order) + index # parent index is an extra bone
-                        break
-
-            else:
-                new_parent_index = new_parent["bone_index"]
-        new_bone_data = BoneData(boneData.bone_name_index, new_parent_index)
-        if new_item is None:  # bone doesnt exist in original skeleton
-            extra_bones.append((new_bone_data,old_index))
-            continue
-        new_index = new_item["bone_index"]
-        bone_index_order[old_index] = new_index
-        # bone does exist, put it in correct location in array
-        new_bone_order[new_index] = new_bone_data
-
-    for bone,old_bone_index in extra_bones:
-        bone_index = len(new_bone_order)
-        bone_index_order[old_bone_index] = bone_index
-        new_bone_order.append(bone)
-
-    debug_new_name_order = [old_name_mapping[boneData.bone_name_index] for boneData in new_bone_order]
-    name_to_new_index = dict((name,index) for index,name in enumerate(debug_new_name_order))
-    debug_old_name_order = [old_name_mapping[boneData.bone_name_index] for boneData in old_bone_order]
-    fixed_bone_index_order = {}
-
-    for old_index,name in enumerate(debug_old_name_order):
-        new_index = name_to_new_index[name]
-        fixed_bone_index_order[old_index] = new_index
-
-    return new_bone_order, fixed_bone_index_order
+            # bone does exist, put it in correct location in array
+            new_name_indexes[new_index] = old_bone_order.name_indexes[old_index]
+            new_parent_indexes[new_index] = new_parent_index
+        bone_index_remap[old_index] = new_index
+
+    new_bone_order = BoneTable(new_name_indexes + extra_name_indexes, new_parent_indexes + extra_parent_indexes)
+    return new_bone_order, bone_index_remap
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+import os
+import json
+import hashlib
+import threading
+
+try:
+    from . import buildManifest
+    from . import mapper
+    from . import readAnimAsset as ream
+except ImportError:  # run as a script from inside pythonfiles
+    import buildManifest
+    import mapper
+    import readAnimAsset as ream
+
+# One place for the mappings of every original skeleton, shared by all mods.
+# Mods that change the same creature all need the mapping of the same original skeleton. Instead of every mod making its
+# own SKELETON-map.json from its own copy of the original, the original is registered once by its asset path
+# (e.g. /Game/Pal/Model/Character/Skeleton/PinkCat/SK_PinkCat_Skeleton) and the hash of its contents, and every mod
+# with the same original uses the same mapping file. A mod doesn't even need its own copy of the original anymore: the
+# modded skeleton has the same asset path as the original it replaces, so its mapping can be found by that path.
+# The registry is loaded once per build process and kept in memory, so all mods in a build share it.
+
+REGISTRY_VERSION = 1
+REGISTRY_INDEX_NAME = "registry.json"
+MAPPING_SUFFIX = "-map.json"
+# characters of the content hash that go in the mapping file names
+HASH_NAME_LENGTH = 16
+
+
+class MappingRegistry:
+    """The index of the registry folder: {asset path: {content hash: mapping file name}}, plus the fingerprints of the
+    original skeleton files that were registered, so unchanged originals aren't hashed again"""
+
+    def __init__(self, folder, skeletons=None, originals=None, scratch_folder=None):
+        self.folder = os.path.abspath(folder)
+        # new mapping files are created here instead of in folder if it's set, so a dry run doesn't write to the registry
+        self.scratch_folder = scratch_folder
+        self.skeletons = skeletons or {}
+        self.originals = originals or {}
+        self.lock = threading.RLock()
+        self.changed = False
+
+    @classmethod
+    def load(cls, folder, scratch_folder=None):
+        try:
+            with open(os.path.join(folder, REGISTRY_INDEX_NAME), "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(folder, scratch_folder=scratch_folder)
+        if data.get("version") != REGISTRY_VERSION:
+            return cls(folder, scratch_folder=scratch_folder)
+        return cls(folder, data["skeletons"], data["originals"], scratch_folder)
+
+    def save(self):
+        """Saves the index if anything was registered. Entries saved by other build processes in the meantime are
+        merged in, so builds running at the same time don't drop each other's skeletons"""
+        with self.lock:
+            if not self.changed or self.scratch_folder is not None:
+                return
+            saved = MappingRegistry.load(self.folder)
+            for asset_path, versions in saved.skeletons.items():
+                merged = self.skeletons.setdefault(asset_path, {})
+                for content_hash, mapping_name in versions.items():
+                    merged.setdefault(content_hash, mapping_name)
+            originals = dict(saved.originals)
+            originals.update(self.originals)
+            self.originals = originals
+            os.makedirs(self.folder, exist_ok=True)
+            index_file = os.path.join(self.folder, REGISTRY_INDEX_NAME)
+            temp_file = f"{index_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w") as f:
+                json.dump({"version": REGISTRY_VERSION, "skeletons": self.skeletons, "originals": self.originals}, f,
+                          indent=2)
+            os.replace(temp_file, index_file)
+            self.changed = False
+
+    def mapping_path(self, mapping_name):
+        if self.scratch_folder is not None and os.path.exists(os.path.join(self.scratch_folder, mapping_name)):
+            return os.path.join(self.scratch_folder, mapping_name)
+        return os.path.join(self.folder, mapping_name)
+
+    def content_hash(self, uasset, uexp):
+        """Hash of an original skeleton's .uasset and .uexp. Files that didn't change since they were last registered
+        (same size and mtime) aren't read again"""
+        key = os.path.abspath(uasset)
+        previous = self.originals.get(key, {})
+        fingerprints = {
+            "uasset": buildManifest.file_fingerprint(uasset, previous.get("uasset")),
+            "uexp": buildManifest.file_fingerprint(uexp, previous.get("uexp")),
+        }
+        if fingerprints != previous:
+            self.originals[key] = fingerprints
+            self.changed = True
+        return hashlib.sha1((fingerprints["uasset"]["hash"] + fingerprints["uexp"]["hash"]).encode()).hexdigest()
+
+    def register(self, uasset, uexp):
+        """Adds an original skeleton to the registry, creating its mapping file unless the same skeleton (asset path
+        and contents) is already registered. Returns the mapping file, or None if the .uasset can't be read"""
+        asset_path = ream.read_package_path(uasset)
+        if asset_path is None:
+            return None
+        with self.lock:
+            content_hash = self.content_hash(uasset, uexp)
+            versions = self.skeletons.setdefault(asset_path, {})
+            mapping_name = versions.get(content_hash)
+            if mapping_name is not None and os.path.exists(self.mapping_path(mapping_name)):
+                return self.mapping_path(mapping_name)
+            mapping_name = f"{os.path.basename(asset_path)}-{content_hash[:HASH_NAME_LENGTH]}{MAPPING_SUFFIX}"
+            mapping_folder = self.scratch_folder if self.scratch_folder is not None else self.folder
+            os.makedirs(mapping_folder, exist_ok=True)
+            mapper.create_mapping_file(os.path.join(mapping_folder, mapping_name), ream.read_skel_uexp(uexp),
+                                       ream.read_uasset(uasset))
+            # registered last = newest, lookup() prefers it when there are several versions of a skeleton
+            versions.pop(content_hash, None)
+            versions[content_hash] = mapping_name
+            self.changed = True
+            return self.mapping_path(mapping_name)
+
+    def lookup(self, asset_path):
+        """Mapping file of the original skeleton at asset_path (the newest one registered if there are several
+        versions of it), or None"""
+        with self.lock:
+            versions = self.skeletons.get(asset_path)
+            for mapping_name in reversed(list(versions.values()) if versions else []):
+                if os.path.exists(self.mapping_path(mapping_name)):
+                    return self.mapping_path(mapping_name)
+        return None
+
+    def lookup_name(self, skeleton_name):
+        """Like lookup, for when only the skeleton's name is known (e.g. the skeleton was deleted by an earlier build).
+        None if no skeleton or more than one skeleton with that name is registered"""
+        with self.lock:
+            asset_paths = [asset_path for asset_path in self.skeletons
+                           if asset_path.rsplit("/", 1)[-1] == skeleton_name]
+        return self.lookup(asset_paths[0]) if len(asset_paths) == 1 else None
+
+    def resolve(self, asset_path, original_uasset=None, original_uexp=None):
+        """Mapping file for a mod's skeleton: the mapping of the original skeleton the mod has a copy of (registered
+        if it's new), otherwise the mapping registered for the skeleton's asset path. None if there is neither"""
+        if original_uasset and original_uexp:
+            mapping_file = self.register(original_uasset, original_uexp)
+            if mapping_file is not None:
+                return mapping_file
+        return self.lookup(asset_path) if asset_path else None
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def shared_registry(folder):
+    """The registry in folder, loaded the first time a mod in this process needs it and kept for every other mod"""
+    key = os.path.abspath(folder)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = MappingRegistry.load(key)
+        return _registries[key]
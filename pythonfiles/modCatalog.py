@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import pathlib
+
+# A list of every file in a mod folder, made with a single os.scandir walk and indexed by stem, extension and asset role,
+# so the build stages don't each have to walk or list the same folders again.
+# The catalog can be saved to a file: the next build then only stats the folders (not every file) to check it's still
+# valid, since adding, removing or renaming a file changes the mtime of the folder it's in.
+
+CATALOG_VERSION = 1
+ROLE_SKELETON = "skeleton"
+ROLE_MESH = "mesh"
+ROLE_ANIMATION = "animation"
+UASSET = ".uasset"
+UEXP = ".uexp"
+
+
+class ModCatalog:
+    def __init__(self, root, files=(), dirs=None):
+        self.root = os.path.abspath(root)
+        self.paths = {}
+        # relative folder path -> mtime, used to check a saved catalog is still valid
+        self.dirs = dirs if dirs is not None else {}
+        self._by_stem = None
+        self._by_extension = None
+        self._by_role = None
+        self._anim_patterns = {}
+        for file in files:
+            self.add(file)
+
+    @classmethod
+    def scan(cls, root):
+        """Walks root once with os.scandir and returns the catalog of every file in it"""
+        catalog = cls(root)
+        folders = [catalog.root]
+        while folders:
+            folder = folders.pop()
+            try:
+                catalog.dirs[os.path.relpath(folder, catalog.root)] = os.stat(folder).st_mtime_ns
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            folders.append(entry.path)
+                        elif entry.is_file():
+                            catalog.add(entry.path)
+            except FileNotFoundError:
+                pass
+        return catalog
+
+    @classmethod
+    def load(cls, root, catalog_file):
+        """Returns a saved catalog if none of the folders in it changed since it was saved, otherwise None"""
+        try:
+            with open(catalog_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        root = os.path.abspath(root)
+        if data.get("version") != CATALOG_VERSION or data.get("root") != root:
+            return None
+        for folder, mtime in data["dirs"].items():
+            try:
+                if os.stat(os.path.join(root, folder)).st_mtime_ns != mtime:
+                    return None
+            except OSError:
+                return None
+        return cls(root, (os.path.join(root, file) for file in data["files"]), data["dirs"])
+
+    @classmethod
+    def load_or_scan(cls, root, catalog_file=None):
+        """Loads the saved catalog if there is one and it's still valid, otherwise scans the folder"""
+        if catalog_file is not None:
+            catalog = cls.load(root, catalog_file)
+            if catalog is not None:
+                return catalog
+        return cls.scan(root)
+
+    def save(self, catalog_file):
+        """Saves the catalog, with the current mtime of every folder in it"""
+        # every folder that leads to a file, so new sub folders are noticed too
+        folders = {"."}
+        for path in self.paths:
+            folder = os.path.dirname(os.path.relpath(path, self.root))
+            while folder and folder not in folders:
+                folders.add(folder)
+                folder = os.path.dirname(folder)
+        dirs = {}
+        for folder in folders:
+            try:
+                dirs[folder] = os.stat(os.path.join(self.root, folder)).st_mtime_ns
+            except OSError:
+                pass
+        self.dirs = dirs
+        data = {
+            "version": CATALOG_VERSION,
+            "root": self.root,
+            "dirs": dirs,
+            "files": sorted(os.path.relpath(path, self.root) for path in self.paths),
+        }
+        temp_file = f"{catalog_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_file, catalog_file)
+
+    def invalidate(self):
+        self._by_stem = None
+        self._by_extension = None
+        self._by_role = None
+        self._anim_patterns = {}
+
+    def add(self, file):
+        """Adds a file (e.g. one that was just copied into the mod). Adding a file that's already listed does nothing"""
+        path = os.path.abspath(file)
+        if path not in self.paths:
+            self.paths[path] = pathlib.Path(path)
+            self.invalidate()
+
+    def remove(self, file):
+        if self.paths.pop(os.path.abspath(file), None) is not None:
+            self.invalidate()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, file):
+        return os.path.abspath(file) in self.paths
+
+    def files(self):
+        """Every file in the mod, as pathlib.Paths sorted by path"""
+        return [self.paths[path] for path in sorted(self.paths)]
+
+    def build_indexes(self):
+        by_stem = {}
+        by_extension = {}
+        by_role = {ROLE_SKELETON: [], ROLE_MESH: []}
+        for file in self.files():
+            by_stem.setdefault(file.stem, []).append(file)
+            by_extension.setdefault(file.suffix.lower(), []).append(file)
+            role = asset_role(file)
+            if role is not None:
+                by_role[role].append(file)
+        (self._by_stem, self._by_extension, self._by_role) = (by_stem, by_extension, by_role)
+
+    def with_stem(self, stem):
+        if self._by_stem is None:
+            self.build_indexes()
+        return list(self._by_stem.get(stem, ()))
+
+    def with_extension(self, extension):
+        if self._by_extension is None:
+            self.build_indexes()
+        return list(self._by_extension.get(extension.lower(), ()))
+
+    def with_role(self, role):
+        """.uasset files of every skeleton or mesh"""
+        if self._by_role is None:
+            self.build_indexes()
+        return list(self._by_role[role])
+
+    def animations(self, anim_search_pattern):
+        """.uexp files whose name matches the animation search pattern"""
+        if anim_search_pattern not in self._anim_patterns:
+            regex = re.compile(anim_search_pattern)
+            self._anim_patterns[anim_search_pattern] = [file for file in self.with_extension(UEXP)
+                                                        if regex.match(file.name)]
+        return list(self._anim_patterns[anim_search_pattern])
+
+    def pair(self, file):
+        """Returns the (.uasset, .uexp) paths of an asset, "" for a file that isn't in the catalog"""
+        base = os.path.splitext(os.path.abspath(file))[0]
+        uasset = f"{base}{UASSET}"
+        uexp = f"{base}{UEXP}"
+        return (str(self.paths[uasset]) if uasset in self.paths else "",
+                str(self.paths[uexp]) if uexp in self.paths else "")
+
+
+def asset_role(file):
+    """Role of a .uasset file, decided by its name the same way the rest of the tool does. None for other files"""
+    if file.suffix != UASSET:
+        return None
+    if file.name.endswith(f"Skeleton{UASSET}"):
+        return ROLE_SKELETON
+    if file.name.startswith("SK_"):
+        return ROLE_MESH
+    return None
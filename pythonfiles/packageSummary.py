@@ -0,0 +1,226 @@
+import sys
+import struct
+from collections import namedtuple
+
+# Reads the package summary (FPackageFileSummary) at the start of a cooked .uasset file, which holds the offsets and
+# counts of the name, import and export tables. With those, the tables can be read directly instead of searching for them.
+
+PACKAGE_FILE_TAG = 0x9E2A83C1
+PKG_UNVERSIONED_PROPERTIES = 0x00002000
+PKG_FILTER_EDITOR_ONLY = 0x80000000
+
+# object versions that change the layout of the summary/import/export tables
+VER_UE4_ADDED_PACKAGE_SUMMARY_LOCALIZATION_ID = 516
+VER_UE4_NON_OUTER_PACKAGE_IMPORT = 520
+VER_UE4_LATEST = 522
+VER_UE5_OPTIONAL_RESOURCES = 1003
+VER_UE5_REMOVE_OBJECT_EXPORT_PACKAGE_GUID = 1005
+VER_UE5_TRACK_OBJECT_EXPORT_IS_INHERITED = 1006
+VER_UE5_ADD_SOFTOBJECTPATH_LIST = 1008
+# unversioned (cooked) packages don't store their version, assume the layout used by the UE5 games this tool supports
+VER_UE5_UNVERSIONED = VER_UE5_ADD_SOFTOBJECTPATH_LIST
+
+ObjectImport = namedtuple('ObjectImport', 'class_package class_name outer_index object_name')
+ObjectExport = namedtuple('ObjectExport',
+                          'class_index super_index template_index outer_index object_name object_flags serial_size serial_offset')
+
+
+class PackageReader:
+    """Reads little endian values from a byte buffer, keeping track of the current offset"""
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def int32(self):
+        return self.unpack("<i")[0]
+
+    def uint32(self):
+        return self.unpack("<I")[0]
+
+    def int64(self):
+        return self.unpack("<q")[0]
+
+    def skip(self, size):
+        self.offset += size
+
+    def fstring(self):
+        """Unreal FString: int32 length (negative for utf-16) followed by the null terminated characters"""
+        length = self.int32()
+        if length == 0:
+            return ""
+        if length < 0:
+            size = -length * 2
+            value = bytes(self.data[self.offset:self.offset + size - 2]).decode("utf-16-le")
+        else:
+            size = length
+            value = bytes(self.data[self.offset:self.offset + size - 1]).decode("utf-8")
+        if self.offset + size > len(self.data):
+            raise ValueError(f"string at offset {self.offset} runs past the end of the file")
+        self.offset += size
+        return value
+
+
+class PackageSummary:
+    """The package summary of a .uasset file.
+    Only the summary is parsed up front, the name map and import/export tables are decoded the first time they are used"""
+
+    def __init__(self, data):
+        self.data = data
+        reader = PackageReader(data)
+        if len(data) < 32 or reader.uint32() != PACKAGE_FILE_TAG:
+            raise ValueError("not an unreal package, the file doesn't start with the package file tag")
+        self.legacy_file_version = reader.int32()
+        if self.legacy_file_version > -7 or self.legacy_file_version < -8:
+            raise ValueError(f"unsupported legacy file version {self.legacy_file_version}")
+        reader.skip(4)  # legacy ue3 version
+        self.file_version_ue4 = reader.int32()
+        self.file_version_ue5 = reader.int32() if self.legacy_file_version <= -8 else 0
+        self.file_version_licensee = reader.int32()
+        custom_version_count = reader.int32()
+        reader.skip(custom_version_count * 20)  # guid + version
+        self.total_header_size = reader.int32()
+        self.folder_name = reader.fstring()
+        self.package_flags = reader.uint32()
+        self.name_count = reader.int32()
+        self.name_offset = reader.int32()
+
+        self.unversioned = self.file_version_ue4 == 0 and self.package_flags & PKG_UNVERSIONED_PROPERTIES != 0
+        if self.unversioned:
+            self.file_version_ue4 = VER_UE4_LATEST
+            if self.legacy_file_version <= -8:
+                self.file_version_ue5 = VER_UE5_UNVERSIONED
+        self.filter_editor_only = self.package_flags & PKG_FILTER_EDITOR_ONLY != 0
+
+        self.soft_object_paths_count = 0
+        self.soft_object_paths_offset = 0
+        if self.file_version_ue5 >= VER_UE5_ADD_SOFTOBJECTPATH_LIST:
+            self.soft_object_paths_count = reader.int32()
+            self.soft_object_paths_offset = reader.int32()
+        if not self.filter_editor_only and self.file_version_ue4 >= VER_UE4_ADDED_PACKAGE_SUMMARY_LOCALIZATION_ID:
+            reader.fstring()  # localization id
+        self.gatherable_text_data_count = reader.int32()
+        self.gatherable_text_data_offset = reader.int32()
+        self.export_count = reader.int32()
+        self.export_offset = reader.int32()
+        self.import_count = reader.int32()
+        self.import_offset = reader.int32()
+        self.depends_offset = reader.int32()
+
+        for (count, offset) in ((self.name_count, self.name_offset), (self.import_count, self.import_offset),
+                                (self.export_count, self.export_offset)):
+            if count < 0 or offset < 0 or offset > len(data):
+                raise ValueError("package summary has invalid table offsets")
+        self._names = None
+        self._imports = None
+        self._exports = None
+
+    @property
+    def names(self):
+        """The name map, a list of strings indexed by name index"""
+        if self._names is None:
+            reader = PackageReader(self.data, self.name_offset)
+            names = []
+            for i in range(self.name_count):
+                names.append(reader.fstring())
+                reader.skip(4)  # case preserving and non case preserving hashes
+            self._names = names
+        return self._names
+
+    def name(self, reader):
+        """Reads an FName (name index + number) and returns it as a string"""
+        (index, number) = reader.unpack("<ii")
+        name = self.names[index]
+        return name if number == 0 else f"{name}_{number - 1}"
+
+    @property
+    def imports(self):
+        if self._imports is None:
+            reader = PackageReader(self.data, self.import_offset)
+            imports = []
+            for i in range(self.import_count):
+                class_package = self.name(reader)
+                class_name = self.name(reader)
+                outer_index = reader.int32()
+                object_name = self.name(reader)
+                if not self.filter_editor_only and self.file_version_ue4 >= VER_UE4_NON_OUTER_PACKAGE_IMPORT:
+                    reader.skip(8)  # package name
+                if self.file_version_ue5 >= VER_UE5_OPTIONAL_RESOURCES:
+                    reader.skip(4)  # import optional
+                imports.append(ObjectImport(class_package, class_name, outer_index, object_name))
+            self._imports = imports
+        return self._imports
+
+    @property
+    def exports(self):
+        if self._exports is None:
+            reader = PackageReader(self.data, self.export_offset)
+            exports = []
+            for i in range(self.export_count):
+                (class_index, super_index, template_index, outer_index) = reader.unpack("<iiii")
+                object_name = self.name(reader)
+                object_flags = reader.uint32()
+                serial_size = reader.int64()
+                serial_offset = reader.int64()
+                reader.skip(12)  # forced export, not for client, not for server
+                if self.file_version_ue5 < VER_UE5_REMOVE_OBJECT_EXPORT_PACKAGE_GUID:
+                    reader.skip(16)  # package guid
+                if self.file_version_ue5 >= VER_UE5_TRACK_OBJECT_EXPORT_IS_INHERITED:
+                    reader.skip(4)  # is inherited instance
+                reader.skip(12)  # package flags, not always loaded for editor game, is asset
+                if self.file_version_ue5 >= VER_UE5_OPTIONAL_RESOURCES:
+                    reader.skip(4)  # generate public hash
+                reader.skip(20)  # first export dependency + the 4 dependency counts
+                exports.append(ObjectExport(class_index, super_index, template_index, outer_index, object_name,
+                                            object_flags, serial_size, serial_offset))
+            self._exports = exports
+        return self._exports
+
+    def resolve(self, package_index):
+        """Returns the import or export that an FPackageIndex points to (negative = import, positive = export)"""
+        if package_index < 0:
+            return self.imports[-package_index - 1]
+        if package_index > 0:
+            return self.exports[package_index - 1]
+        return None
+
+    def object_path(self, package_index):
+        """Full path of an import/export, e.g. /Game/Pal/Model/Character/Skeleton/PinkCat/SK_PinkCat_Skeleton.SK_PinkCat_Skeleton"""
+        entry = self.resolve(package_index)
+        if entry is None:
+            return ""
+        if entry.outer_index == 0:
+            return entry.object_name
+        outer = self.object_path(entry.outer_index)
+        separator = ":" if self.resolve(self.resolve(entry.outer_index).outer_index) is not None else "."
+        return f"{outer}{separator}{entry.object_name}"
+
+    def imports_of_class(self, class_name):
+        """Package indexes of every import with the given class, e.g. 'Skeleton'"""
+        return [-(i + 1) for i, entry in enumerate(self.imports) if entry.class_name == class_name]
+
+    def export_data_offset(self, export):
+        """Offset of an export's serialized data inside the .uexp file"""
+        return export.serial_offset - self.total_header_size
+
+
+def read_package_summary(file_name) -> PackageSummary:
+    """Reads the package summary of a .uasset file. Raises ValueError if the file can't be parsed"""
+    with open(file_name, "rb") as f:
+        return PackageSummary(f.read())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        quit()
+    summary = read_package_summary(sys.argv[1])
+    print(f"{summary.folder_name}: {summary.name_count} names, {summary.import_count} imports, {summary.export_count} exports")
+    for i in range(summary.import_count):
+        print(f"import {-(i + 1)}: {summary.imports[i].class_name} {summary.object_path(-(i + 1))}")
+    for i in range(summary.export_count):
+        print(f"export {i + 1}: {summary.object_path(i + 1)} ({summary.exports[i].serial_size} bytes)")
@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import namedtuple
+
+# Runs the packer (UnrealPak) for the mods with asyncio, on an event loop in a background thread of its own.
+# Several packers can run at the same time (up to max_jobs, the rest wait for a free slot), their output is printed
+# line by line as it comes in, each line prefixed with the mod's name so the output of different mods can be told apart.
+# A job can have a log of its own (the mod's log on the build pipeline), its lines are written there instead, so they
+# are printed with the rest of that mod's log.
+# A packer that runs longer than the timeout is killed, and the exit code of every packer is returned with its output,
+# so a mod whose packer failed is reported as failed instead of deploying a broken or outdated .pak.
+
+# longest line of packer output that can be read, UnrealPak can print very long paths
+MAX_LINE_LENGTH = 1024 * 1024
+PREFIX_FORMAT = "[{name}] {line}"
+
+# name shown in front of the output (the mod name), the command line as a list of arguments, and a file like object to
+# write the output lines to (None for the runner's stream)
+PackJob = namedtuple('PackJob', 'name command log', defaults=(None,))
+
+
+class PackResult(namedtuple('PackResult', 'name exit_code output seconds error')):
+    """How a packer run ended. exit_code is None if the packer couldn't be started, error says why it failed
+    (timed out, couldn't be started) or is None"""
+    __slots__ = ()
+
+    @property
+    def succeeded(self):
+        return self.error is None and self.exit_code == 0
+
+    def describe(self):
+        if self.error is not None:
+            return f"packer {self.error}"
+        return f"packer exited with code {self.exit_code} after {self.seconds:.1f}s"
+
+
+def packer_command(packer_exe, pak_file, response_file, compress=True):
+    """Command line for UnrealPak, as a list of arguments. A packer that is a python script (like the stub packer in the
+    benchmarks folder) is run with the python running the build"""
+    command = [packer_exe, pak_file, f"-create={response_file}"]
+    if compress:
+        command.append("-compress")
+    if packer_exe.endswith(".py"):
+        command.insert(0, sys.executable)
+    return command
+
+
+class PackerRunner:
+    """Runs packer processes on a background event loop, at most max_jobs (0 = one per cpu core) at the same time.
+    stream is called with every prefixed line of output, None to only collect it"""
+
+    def __init__(self, max_jobs=0, stream=print):
+        self.max_jobs = max_jobs if max_jobs > 0 else os.cpu_count() or 1
+        self.stream = stream
+        self.semaphore = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="packer runner", daemon=True)
+        self.thread.start()
+
+    def submit(self, job, timeout=None):
+        """Starts the packer of a job as soon as there is a free slot. Returns a concurrent.futures.Future of its
+        PackResult, so it can be waited for from any thread. timeout is in seconds, None or 0 for no limit"""
+        return asyncio.run_coroutine_threadsafe(self.run(job, timeout), self.loop)
+
+    def run_all(self, jobs, timeout=None):
+        """Runs every job and returns their PackResults in the same order"""
+        futures = [self.submit(job, timeout) for job in jobs]
+        return [future.result() for future in futures]
+
+    async def run(self, job, timeout=None):
+        if self.semaphore is None:  # made here so it belongs to the runner's loop
+            self.semaphore = asyncio.Semaphore(self.max_jobs)
+        async with self.semaphore:
+            start = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(*job.command, stdout=asyncio.subprocess.PIPE,
+                                                               stderr=asyncio.subprocess.STDOUT, limit=MAX_LINE_LENGTH)
+            except OSError as ex:
+                return PackResult(job.name, None, "", time.perf_counter() - start, f"could not be started ({ex})")
+            lines = []
+            error = None
+            try:
+                await asyncio.wait_for(self.read_output(job, process, lines), timeout or None)
+            except asyncio.TimeoutError:
+                try:
+                    process.kill()
+                except ProcessLookupError:  # exited just now
+                    pass
+                await process.wait()
+                error = f"timed out after {timeout} seconds"
+            return PackResult(job.name, process.returncode, "\n".join(lines), time.perf_counter() - start, error)
+
+    async def read_output(self, job, process, lines):
+        async for raw_line in process.stdout:
+            line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+            lines.append(line)
+            if job.log is not None:
+                job.log.write(PREFIX_FORMAT.format(name=job.name, line=line) + "\n")
+            elif self.stream is not None:
+                self.stream(PREFIX_FORMAT.format(name=job.name, line=line))
+        await process.wait()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def shared_runner(max_jobs=0):
+    """The runner of this process, started the first time it's needed. Every mod built by the process shares it, so
+    no more than max_jobs packers run at the same time no matter how many mods are being packed"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = PackerRunner(max_jobs)
+        return _runner
@@ -0,0 +1,446 @@
+import os
+import sys
+import zlib
+import struct
+import hashlib
+import collections
+import concurrent.futures
+from collections import namedtuple
+
+try:
+    from . import buildTrace
+except ImportError:  # run as a script from inside pythonfiles
+    import buildTrace
+
+# Reads and writes Unreal .pak files (version 11, the version written by UE5's UnrealPak), so mods can be packed
+# without UnrealPak.exe. Files are compressed in blocks, on a pool of threads (zlib releases the GIL while compressing).
+#
+# pak layout: [entry header + file data] for every file, then the index, then the 221 byte footer (FPakInfo).
+# The writer puts every entry in the index's plain entry list and writes the full directory index. It doesn't write
+# the optional path hash index or the bit packed "encoded" entries, the reader understands both kinds of entries.
+
+PAK_MAGIC = 0x5A6F12E1
+PAK_VERSION = 11  # PakFile_Version_Fnv64BugFix
+PAK_MIN_READ_VERSION = 10  # PakFile_Version_PathHashIndex, first version with the current index layout
+DEFAULT_MOUNT_POINT = "../../../"
+DEFAULT_BLOCK_SIZE = 64 * 1024
+MAX_COMPRESSION_METHODS = 5
+COMPRESSION_METHOD_NAME_LEN = 32
+FOOTER_SIZE = 16 + 1 + 4 + 4 + 8 + 8 + 20 + MAX_COMPRESSION_METHODS * COMPRESSION_METHOD_NAME_LEN
+# how much file data can be waiting to be compressed/written at once
+MAX_BYTES_IN_FLIGHT = 64 * 1024 * 1024
+
+COMPRESSION_NONE = "None"
+COMPRESSION_ZLIB = "Zlib"
+COMPRESSION_GZIP = "Gzip"
+SUPPORTED_COMPRESSION = (COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_GZIP)
+
+# offset of the entry header, size of the stored data, size of the original file, compression method name (or None),
+# sha1 of the stored data, list of (start, end) block offsets relative to the entry, flags, compression block size
+PakEntry = namedtuple('PakEntry', 'offset size uncompressed_size compression hash blocks flags block_size')
+
+
+def compress_block(data, compression):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compress(data)
+    if compression == COMPRESSION_GZIP:
+        compressor = zlib.compressobj(wbits=31)
+        return compressor.compress(data) + compressor.flush()
+    raise ValueError(f"Unsupported compression method: {compression}")
+
+
+def decompress_block(data, compression):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    if compression == COMPRESSION_GZIP:
+        return zlib.decompress(data, wbits=31)
+    raise ValueError(f"Unsupported compression method: {compression}")
+
+
+def fstring_bytes(value):
+    """Unreal FString: int32 length including the null terminator, then the characters. Non ascii strings are utf-16"""
+    if value == "":
+        return struct.pack("<i", 0)
+    if value.isascii():
+        encoded = value.encode("ascii") + b"\x00"
+        return struct.pack("<i", len(encoded)) + encoded
+    encoded = value.encode("utf-16-le") + b"\x00\x00"
+    return struct.pack("<i", -(len(encoded) // 2)) + encoded
+
+
+def read_fstring(data, offset):
+    """Returns (string, offset after the string)"""
+    (length,) = struct.unpack_from("<i", data, offset)
+    offset += 4
+    if length == 0:
+        return "", offset
+    if length < 0:
+        size = -length * 2
+        return data[offset:offset + size - 2].decode("utf-16-le"), offset + size
+    return data[offset:offset + length - 1].decode("utf-8"), offset + length
+
+
+def entry_header_size(block_count, compressed):
+    """Size of a serialized FPakEntry: offset, size, uncompressed size, compression index, hash,
+    (block count + blocks if compressed), flags, block size"""
+    return 8 + 8 + 8 + 4 + 20 + (4 + 16 * block_count if compressed else 0) + 1 + 4
+
+
+def entry_bytes(entry: PakEntry, compression_index, offset=None):
+    data = struct.pack("<qqqI", entry.offset if offset is None else offset, entry.size, entry.uncompressed_size,
+                       compression_index)
+    data += entry.hash
+    if compression_index != 0:
+        data += struct.pack("<I", len(entry.blocks))
+        for (start, end) in entry.blocks:
+            data += struct.pack("<qq", start, end)
+    data += struct.pack("<BI", entry.flags, entry.block_size)
+    return data
+
+
+def collect_pak_files(source_dir):
+    """Every file inside source_dir as (absolute path, path inside the pak), sorted so paks are reproducible"""
+    files = []
+    for root, dirs, names in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(names):
+            file_name = os.path.join(root, name)
+            files.append((file_name, os.path.relpath(file_name, source_dir).replace(os.sep, "/")))
+    return files
+
+
+def read_blocks(file_name, block_size):
+    """Yields the blocks of a file one at a time, so a large file is never read into memory all at once"""
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            yield block
+
+
+class PendingEntry:
+    """A file on its way into the pak: its blocks that are read but not written yet (compression futures, or the blocks
+    themselves when not compressing), and the sizes and hash of what has been written of it so far"""
+
+    def __init__(self, file_name, pak_path, block_count):
+        self.file_name = file_name
+        self.pak_path = pak_path
+        self.block_count = block_count
+        # (future or block, uncompressed size of the block)
+        self.blocks = collections.deque()
+        self.read_all = False
+        self.header_offset = None
+        self.uncompressed_size = 0
+        self.stored_sizes = []
+        self.sha = hashlib.sha1()
+
+
+def write_pak(pak_file, source_dir, mount_point=DEFAULT_MOUNT_POINT, compression=COMPRESSION_ZLIB, jobs=0,
+              block_size=DEFAULT_BLOCK_SIZE):
+    """Packs every file inside source_dir into pak_file. Paths in the pak are relative to source_dir, mounted at mount_point.
+    Blocks are compressed on 'jobs' threads (0 = one per cpu core). Returns the list of packed paths"""
+    if compression not in SUPPORTED_COMPRESSION:
+        raise ValueError(f"Unsupported compression method: {compression}. Supported: {', '.join(SUPPORTED_COMPRESSION)}")
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    compressed = compression != COMPRESSION_NONE
+    files = collect_pak_files(source_dir)
+    entries = []
+
+    temp_file = f"{pak_file}.{os.getpid()}.tmp"
+    with open(temp_file, "wb") as pak, concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        # blocks are read and queued for compression ahead of the writer, up to MAX_BYTES_IN_FLIGHT, so the blocks of
+        # a large file and of many small files get compressed in parallel while the output is still written in order.
+        # Only the blocks in flight are held in memory, never a whole file. Each entry's header is written once its
+        # blocks are, in the room left for it in front of them
+        in_flight = collections.deque()
+        bytes_in_flight = 0
+
+        def finish_entry(pending):
+            if len(pending.stored_sizes) != pending.block_count:
+                raise RuntimeError(f"{pending.file_name} changed while it was being packed")
+            stored_size = sum(pending.stored_sizes)
+            use_compression = compressed and stored_size < pending.uncompressed_size
+            if compressed and not use_compression:
+                # compressing didn't make the file smaller, store it as it is instead (read again, block by block)
+                pak.seek(pending.header_offset)
+                pak.truncate()
+                pak.write(bytes(entry_header_size(0, False)))
+                pending.sha = hashlib.sha1()
+                stored_size = 0
+                for block in read_blocks(pending.file_name, block_size):
+                    pak.write(block)
+                    pending.sha.update(block)
+                    stored_size += len(block)
+                    buildTrace.count(bytes_read=len(block), bytes_written=len(block))
+                if stored_size != pending.uncompressed_size:
+                    raise RuntimeError(f"{pending.file_name} changed while it was being packed")
+            block_offsets = []
+            if use_compression:
+                start = entry_header_size(len(pending.stored_sizes), True)
+                for size in pending.stored_sizes:
+                    block_offsets.append((start, start + size))
+                    start += size
+            entry = PakEntry(pending.header_offset, stored_size, pending.uncompressed_size,
+                             compression if use_compression else None, pending.sha.digest(), block_offsets, 0,
+                             min(block_size, pending.uncompressed_size) if use_compression else 0)
+            # the copy of the entry in front of the data always has an offset of 0
+            end = pak.tell()
+            pak.seek(pending.header_offset)
+            pak.write(entry_bytes(entry, 1 if use_compression else 0, offset=0))
+            pak.seek(end)
+            entries.append((pending.pak_path, entry))
+
+        def write_next():
+            """Writes the next block of the oldest file in flight, and finishes that file once all its blocks are
+            written. Returns the uncompressed size of the block that was written (0 if none)"""
+            pending = in_flight[0]
+            if pending.header_offset is None:
+                pending.header_offset = pak.tell()
+                pak.write(bytes(entry_header_size(pending.block_count, compressed)))
+            if len(pending.blocks) > 0:
+                (block, size) = pending.blocks.popleft()
+                stored = block.result() if compressed else block
+                pak.write(stored)
+                pending.sha.update(stored)
+                pending.stored_sizes.append(len(stored))
+                pending.uncompressed_size += size
+                buildTrace.count(bytes_written=len(stored))
+                return size
+            if pending.read_all:
+                finish_entry(in_flight.popleft())
+            return 0
+
+        for (file_name, pak_path) in files:
+            pending = PendingEntry(file_name, pak_path, -(-os.path.getsize(file_name) // block_size))
+            in_flight.append(pending)
+            for block in read_blocks(file_name, block_size):
+                pending.blocks.append((pool.submit(compress_block, block, compression) if compressed else block,
+                                       len(block)))
+                buildTrace.count(bytes_read=len(block))
+                bytes_in_flight += len(block)
+                while bytes_in_flight > MAX_BYTES_IN_FLIGHT:
+                    bytes_in_flight -= write_next()
+            pending.read_all = True
+        while len(in_flight) > 0:
+            write_next()
+
+        index_offset = pak.tell()
+        index = index_bytes(entries, mount_point, compression, index_offset)
+        pak.write(index)
+        pak.write(footer_bytes(index_offset, len(index), hashlib.sha1(index).digest(),
+                               [compression] if compressed else []))
+    os.replace(temp_file, pak_file)
+    return [pak_path for (pak_path, entry) in entries]
+
+
+def index_bytes(entries, mount_point, compression, index_offset):
+    """The primary index (mount point, entry list) followed by the full directory index it points to"""
+    compression_index = 1 if compression != COMPRESSION_NONE else 0
+    entry_list = bytearray(struct.pack("<i", len(entries)))
+    for (pak_path, entry) in entries:
+        entry_list += entry_bytes(entry, compression_index if entry.compression else 0)
+
+    # directory name (with trailing /) -> {file name: entry location}. every parent directory is listed as well
+    directories = {"/": {}}
+    for (index, (pak_path, entry)) in enumerate(entries):
+        (directory, file_name) = pak_path.rsplit("/", 1) if "/" in pak_path else ("", pak_path)
+        directory = f"{directory}/" if directory else "/"
+        parent = directory
+        while parent != "/" and parent not in directories:
+            directories[parent] = {}
+            parent = parent[:parent.rstrip("/").rfind("/") + 1] or "/"
+        # negative locations point into the plain entry list instead of the encoded entries
+        directories[directory][file_name] = -(index + 1)
+    directory_index = bytearray(struct.pack("<i", len(directories)))
+    for directory in sorted(directories):
+        directory_index += fstring_bytes(directory) + struct.pack("<i", len(directories[directory]))
+        for file_name in sorted(directories[directory]):
+            directory_index += fstring_bytes(file_name) + struct.pack("<i", directories[directory][file_name])
+
+    primary = bytearray(fstring_bytes(mount_point))
+    primary += struct.pack("<iQ", len(entries), 0)  # entry count, path hash seed
+    primary += struct.pack("<i", 0)  # no path hash index
+    primary_size = len(primary) + 4 + 8 + 8 + 20 + 4 + len(entry_list)  # the full directory index is after this
+    primary += struct.pack("<iqq", 1, index_offset + primary_size, len(directory_index))
+    primary += hashlib.sha1(directory_index).digest()
+    primary += struct.pack("<i", 0)  # no encoded entries
+    primary += entry_list
+    return bytes(primary + directory_index)
+
+
+def footer_bytes(index_offset, index_size, index_hash, compression_methods):
+    footer = bytes(16) + struct.pack("<BIiqq", 0, PAK_MAGIC, PAK_VERSION, index_offset, index_size) + index_hash
+    for i in range(MAX_COMPRESSION_METHODS):
+        name = compression_methods[i].encode("ascii") if i < len(compression_methods) else b""
+        footer += name.ljust(COMPRESSION_METHOD_NAME_LEN, b"\x00")
+    return footer
+
+
+class PakReader:
+    """Reads the index of a .pak file, and the files inside of it"""
+
+    def __init__(self, pak_file):
+        self.pak_file = pak_file
+        with open(pak_file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < FOOTER_SIZE:
+                raise ValueError(f"{pak_file} is too small to be a pak file")
+            f.seek(-FOOTER_SIZE, os.SEEK_END)
+            footer = f.read(FOOTER_SIZE)
+            (encrypted_index, magic, self.version, index_offset, index_size) = struct.unpack_from("<BIiqq", footer, 16)
+            if magic != PAK_MAGIC:
+                raise ValueError(f"{pak_file} is not a pak file")
+            if self.version < PAK_MIN_READ_VERSION or encrypted_index:
+                raise ValueError(f"Unsupported pak file (version {self.version}, encrypted index: {bool(encrypted_index)})")
+            names_start = 16 + 1 + 4 + 4 + 8 + 8 + 20
+            self.compression_methods = [None]
+            for i in range(MAX_COMPRESSION_METHODS):
+                name = footer[names_start + i * COMPRESSION_METHOD_NAME_LEN:names_start + (i + 1) * COMPRESSION_METHOD_NAME_LEN]
+                self.compression_methods.append(name.rstrip(b"\x00").decode("ascii") or None)
+            f.seek(index_offset)
+            index = f.read(index_size)
+            self.read_index(f, index)
+
+    def read_index(self, f, index):
+        (self.mount_point, offset) = read_fstring(index, 0)
+        (entry_count, path_hash_seed, has_path_hash_index) = struct.unpack_from("<iQi", index, offset)
+        offset += 16
+        if has_path_hash_index:
+            offset += 8 + 8 + 20
+        (has_directory_index,) = struct.unpack_from("<i", index, offset)
+        offset += 4
+        if not has_directory_index:
+            raise ValueError("Pak files without a full directory index are not supported")
+        (directory_offset, directory_size) = struct.unpack_from("<qq", index, offset)
+        offset += 8 + 8 + 20
+        (encoded_size,) = struct.unpack_from("<i", index, offset)
+        offset += 4
+        encoded_entries = index[offset:offset + encoded_size]
+        offset += encoded_size
+        (file_count,) = struct.unpack_from("<i", index, offset)
+        offset += 4
+        plain_entries = []
+        for i in range(file_count):
+            (entry, offset) = self.read_entry(index, offset)
+            plain_entries.append(entry)
+
+        f.seek(directory_offset)
+        directory_index = f.read(directory_size)
+        self.entries = {}
+        (directory_count,) = struct.unpack_from("<i", directory_index, 0)
+        offset = 4
+        for i in range(directory_count):
+            (directory, offset) = read_fstring(directory_index, offset)
+            (count,) = struct.unpack_from("<i", directory_index, offset)
+            offset += 4
+            for j in range(count):
+                (file_name, offset) = read_fstring(directory_index, offset)
+                (location,) = struct.unpack_from("<i", directory_index, offset)
+                offset += 4
+                path = f"{directory}{file_name}".lstrip("/")
+                if location < 0:
+                    self.entries[path] = plain_entries[-location - 1]
+                else:
+                    self.entries[path] = self.decode_entry(encoded_entries, location)
+
+    def read_entry(self, data, offset):
+        """Reads a serialized FPakEntry, returns (PakEntry, offset after it)"""
+        (entry_offset, size, uncompressed_size, compression_index) = struct.unpack_from("<qqqI", data, offset)
+        offset += 28
+        entry_hash = data[offset:offset + 20]
+        offset += 20
+        blocks = []
+        if compression_index != 0:
+            (block_count,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            for i in range(block_count):
+                blocks.append(struct.unpack_from("<qq", data, offset))
+                offset += 16
+        (flags, block_size) = struct.unpack_from("<BI", data, offset)
+        offset += 5
+        return PakEntry(entry_offset, size, uncompressed_size, self.compression_methods[compression_index], entry_hash,
+                        blocks, flags, block_size), offset
+
+    def decode_entry(self, data, offset):
+        """Decodes one of UnrealPak's bit packed entries"""
+        (bits,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        block_size = (bits & 0x3f) << 11
+        if bits & 0x3f == 0x3f:
+            (block_size,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+        values = []
+        for flag_bit in (31, 30, 29):
+            if flag_bit == 29 and (bits >> 23) & 0x3f == 0:
+                values.append(values[1])  # uncompressed, size is the uncompressed size
+                continue
+            if bits & (1 << flag_bit):
+                values.append(struct.unpack_from("<I", data, offset)[0])
+                offset += 4
+            else:
+                values.append(struct.unpack_from("<Q", data, offset)[0])
+                offset += 8
+        (entry_offset, uncompressed_size, size) = values
+        compression_index = (bits >> 23) & 0x3f
+        encrypted = bool(bits & (1 << 22))
+        block_count = (bits >> 6) & 0xffff
+        blocks = []
+        if block_count > 0:
+            start = entry_header_size(block_count, compression_index != 0)
+            if block_count == 1 and not encrypted:
+                blocks.append((start, start + size))
+            else:
+                for i in range(block_count):
+                    (block_length,) = struct.unpack_from("<I", data, offset)
+                    offset += 4
+                    blocks.append((start, start + block_length))
+                    start += (block_length + 15) & ~15 if encrypted else block_length
+        return PakEntry(entry_offset, size, uncompressed_size, self.compression_methods[compression_index], None,
+                        blocks, 1 if encrypted else 0, block_size if block_count > 0 else 0)
+
+    def files(self):
+        return sorted(self.entries)
+
+    def read_file(self, path):
+        entry = self.entries[path]
+        if entry.flags & 1:
+            raise ValueError(f"{path} is encrypted")
+        with open(self.pak_file, "rb") as f:
+            if entry.compression is None:
+                f.seek(entry.offset + entry_header_size(0, False))
+                return f.read(entry.size)
+            data = bytearray()
+            for (start, end) in entry.blocks:
+                f.seek(entry.offset + start)
+                data += decompress_block(f.read(end - start), entry.compression)
+            return bytes(data[:entry.uncompressed_size])
+
+    def extract(self, output_dir):
+        for path in self.files():
+            output_file = os.path.join(output_dir, path)
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            with open(output_file, "wb") as f:
+                f.write(self.read_file(path))
+
+
+if __name__ == "__main__":
+    usage = ("usage: pakFile.py create <pak file> <folder> [compression]\n"
+             "       pakFile.py list <pak file>\n"
+             "       pakFile.py extract <pak file> <output folder>")
+    if len(sys.argv) < 3:
+        print(usage)
+        sys.exit(1)
+    command = sys.argv[1]
+    if command == "create" and len(sys.argv) >= 4:
+        packed = write_pak(sys.argv[2], sys.argv[3], compression=sys.argv[4] if len(sys.argv) > 4 else COMPRESSION_ZLIB)
+        print(f"Packed {len(packed)} files into {sys.argv[2]}")
+    elif command == "list":
+        reader = PakReader(sys.argv[2])
+        print(f"mount point: {reader.mount_point}")
+        for path in reader.files():
+            entry = reader.entries[path]
+            print(f"{path} ({entry.uncompressed_size} bytes, {entry.compression or 'uncompressed'})")
+    elif command == "extract" and len(sys.argv) >= 4:
+        PakReader(sys.argv[2]).extract(sys.argv[3])
+    else:
+        print(usage)
+        sys.exit(1)
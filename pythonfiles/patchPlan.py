@@ -0,0 +1,297 @@
+import os
+import json
+import hashlib
+from collections import namedtuple
+
+try:
+    from . import buildManifest
+    from . import buildTrace
+except ImportError:  # run as a script from inside pythonfiles
+    import buildManifest
+    import buildTrace
+
+# The bone fix is done in two steps: first every byte that needs to change in the mod's skeletons and animations is
+# worked out (the patch plan), then the plan is applied. Nothing is written until the whole plan exists, so a file that
+# can't be fixed stops the build before any file was touched. Every file is then checked to still hold the expected
+# bytes, and only once all of them do is each written with its patches sorted and merged into as few writes as possible.
+# A plan can be printed instead of applied (--dry-run), and the patches of each file are cached so unchanged files
+# don't have to be searched again next time.
+# Every applied patch is also kept in a journal with the bytes it overwrote, so the fix can be undone (and redone) by
+# writing just those byte ranges again, instead of copying every file from the cook folder again.
+
+PLAN_CACHE_VERSION = 1
+JOURNAL_VERSION = 1
+# state of a file in the journal
+JOURNAL_APPLYING = "applying"
+JOURNAL_APPLIED = "applied"
+JOURNAL_REVERTED = "reverted"
+
+# offset in the file, bytes that are there now, bytes to write
+Patch = namedtuple('Patch', 'offset old new')
+
+
+class PatchConflictError(Exception):
+    """Two patches of the same file overlap"""
+
+
+class PatchMismatchError(Exception):
+    """A file no longer has the bytes the plan expected, so the plan was made for a different version of it"""
+
+
+def coalesce_patches(patches):
+    """Sorts patches by offset and merges patches that touch each other into one. Raises PatchConflictError if two
+    patches overlap"""
+    merged = []
+    for patch in sorted(patches, key=lambda patch: patch.offset):
+        if merged:
+            last = merged[-1]
+            end = last.offset + len(last.new)
+            if patch.offset < end:
+                raise PatchConflictError(f"patches at offset {last.offset} and {patch.offset} overlap")
+            if patch.offset == end:
+                merged[-1] = Patch(last.offset, last.old + patch.old, last.new + patch.new)
+                continue
+        merged.append(patch)
+    return merged
+
+
+def pread(fd, size, offset):
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)  # windows
+    return os.read(fd, size)
+
+
+def pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        return os.pwrite(fd, data, offset)
+    os.lseek(fd, offset, os.SEEK_SET)  # windows
+    return os.write(fd, data)
+
+
+class PatchPlan:
+    """Every byte edit for a set of files, {file: [Patch]}"""
+
+    def __init__(self):
+        self.files = {}
+
+    def add(self, file_name, offset, old, new):
+        """Adds a patch, patches that don't change anything are left out"""
+        old = bytes(old)
+        new = bytes(new)
+        if len(old) != len(new):
+            raise ValueError("a patch has to replace bytes with the same number of bytes")
+        patches = self.files.setdefault(str(file_name), [])
+        if old != new:
+            patches.append(Patch(offset, old, new))
+
+    def add_patches(self, file_name, patches):
+        for patch in patches:
+            self.add(file_name, patch.offset, patch.old, patch.new)
+
+    def __len__(self):
+        return sum(len(patches) for patches in self.files.values())
+
+    def patched_bytes(self):
+        return sum(len(patch.new) for patches in self.files.values() for patch in patches)
+
+    def apply(self, journal=None):
+        """Writes the whole plan. Every file is first checked to still hold the old bytes of its patches, and only if
+        all of them do is anything written, so a mismatch in any file leaves every file untouched. Each file is then
+        written with its sorted, merged patches.
+        With a PatchJournal, the patches are saved to it before anything is written"""
+        files = dict((file_name, coalesce_patches(patches)) for file_name, patches in self.files.items())
+        files = dict((file_name, patches) for file_name, patches in files.items() if patches)
+        for file_name, patches in files.items():
+            with buildTrace.span("check_patches", file=os.path.basename(file_name)):
+                fd = os.open(file_name, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+                try:
+                    for patch in patches:
+                        if pread(fd, len(patch.old), patch.offset) != patch.old:
+                            raise PatchMismatchError(f"{file_name} changed since the bone fix was planned "
+                                                     f"(offset {patch.offset})")
+                    buildTrace.count(bytes_read=sum(len(patch.old) for patch in patches))
+                finally:
+                    os.close(fd)
+        if journal is not None:
+            journal.begin(files)
+        for file_name, patches in files.items():
+            with buildTrace.span("apply_patches", file=os.path.basename(file_name)):
+                fd = os.open(file_name, os.O_RDWR | getattr(os, "O_BINARY", 0))
+                try:
+                    for patch in patches:
+                        pwrite(fd, patch.new, patch.offset)
+                    buildTrace.count(bytes_written=sum(len(patch.new) for patch in patches))
+                finally:
+                    os.close(fd)
+            if journal is not None:
+                journal.set_state(file_name, JOURNAL_APPLIED)
+        if journal is not None:
+            journal.save()
+
+    def describe(self, root=None):
+        """Readable list of the planned edits, for --dry-run"""
+        lines = []
+        for file_name, patches in sorted(self.files.items()):
+            patches = coalesce_patches(patches)
+            shown = os.path.relpath(file_name, root) if root else file_name
+            size = sum(len(patch.new) for patch in patches)
+            lines.append(f"{shown}: {len(patches)} writes, {size} bytes"
+                         + ("" if patches else " (already in the right order)"))
+            for patch in patches:
+                lines.append(f"    offset {patch.offset:>8}: {len(patch.new):>6} bytes  "
+                             f"{preview(patch.old)} -> {preview(patch.new)}")
+        lines.append(f"{len(self.files)} files, {len(self)} patches, {self.patched_bytes()} bytes to write")
+        return "\n".join(lines)
+
+
+def preview(data, size=16):
+    return data[:size].hex() + ("..." if len(data) > size else "")
+
+
+def patch_key(*parts):
+    """Cache key for the patches of a file: a hash of everything (besides the file itself) that decides the patches,
+    such as the remap it's patched with"""
+    sha = hashlib.sha1()
+    for part in parts:
+        sha.update(bytes(part) if not isinstance(part, str) else part.encode("utf-8"))
+        sha.update(b"\x00")
+    return sha.hexdigest()
+
+
+class PlanCache:
+    """Remembers the patches planned for each file, keyed by the file's fingerprint and a patch_key.
+    If a file and its key are the same next time, its patches are reused without reading the file"""
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self.used = {}
+
+    @classmethod
+    def load(cls, cache_file):
+        try:
+            with open(cache_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if data.get("version") != PLAN_CACHE_VERSION:
+            return cls()
+        return cls(data["files"])
+
+    def save(self, cache_file):
+        """Saves the entries of every file that still exists, files that left the mod are dropped"""
+        entries = dict((file, entry) for file, entry in self.entries.items() if os.path.exists(file))
+        entries.update(self.used)
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump({"version": PLAN_CACHE_VERSION, "files": entries}, f)
+        os.replace(temp_file, cache_file)
+
+    def lookup(self, file_name, key):
+        """Returns (patches, extra data) for the file if the cache is still valid for it, otherwise None"""
+        entry = self.entries.get(str(file_name))
+        if entry is None or entry["key"] != key:
+            return None
+        fingerprint = buildManifest.file_fingerprint(file_name, entry["fingerprint"])
+        if fingerprint["hash"] != entry["fingerprint"]["hash"]:
+            return None
+        self.used[str(file_name)] = dict(entry, fingerprint=fingerprint)
+        patches = [Patch(offset, bytes.fromhex(old), bytes.fromhex(new)) for (offset, old, new) in entry["patches"]]
+        return patches, entry.get("extra")
+
+    def store(self, file_name, key, patches, extra=None):
+        """Remembers the patches planned for a file in its current (unpatched) state"""
+        self.used[str(file_name)] = {
+            "key": key,
+            "fingerprint": buildManifest.file_fingerprint(file_name),
+            "patches": [(patch.offset, patch.old.hex(), patch.new.hex()) for patch in patches],
+            "extra": extra,
+        }
+
+
+class PatchJournal:
+    """The patches applied to the files of a folder with the bytes they overwrote, so they can be reverted and
+    reapplied later. Files are keyed by their path relative to the folder.
+    Patches are saved before they are written (state "applying"), so a build that was interrupted while writing can
+    still be reverted: every byte range is checked on its own, ranges that were written are restored and ranges that
+    weren't are left alone"""
+
+    def __init__(self, journal_file, root, files=None):
+        self.journal_file = journal_file
+        self.root = os.path.abspath(root)
+        # relative path -> {"state", "patches": [[offset, old hex, new hex]]}
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, journal_file, root):
+        try:
+            with open(journal_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(journal_file, root)
+        if data.get("version") != JOURNAL_VERSION:
+            return cls(journal_file, root)
+        return cls(journal_file, root, data["files"])
+
+    def save(self):
+        temp_file = f"{self.journal_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump({"version": JOURNAL_VERSION, "files": self.files}, f)
+        os.replace(temp_file, self.journal_file)
+
+    def key(self, file_name):
+        return os.path.relpath(os.path.abspath(file_name), self.root).replace(os.sep, "/")
+
+    def begin(self, files):
+        """Records the patches about to be written, {file: [Patch]}, replacing what was recorded for those files before
+        (a file that is fixed again was pulled from the cook folder again), and saves the journal"""
+        for file_name, patches in files.items():
+            self.files[self.key(file_name)] = {
+                "state": JOURNAL_APPLYING,
+                "patches": [(patch.offset, patch.old.hex(), patch.new.hex()) for patch in patches],
+            }
+        self.save()
+
+    def set_state(self, file_name, state):
+        self.files[self.key(file_name)]["state"] = state
+
+    def patches(self, key):
+        return [Patch(offset, bytes.fromhex(old), bytes.fromhex(new))
+                for (offset, old, new) in self.files[key]["patches"]]
+
+    def rewrite(self, reapply=False):
+        """Reverts every recorded file to the bytes it had before its fix, or with reapply, writes the fix again.
+        Only the recorded byte ranges are read and written. A file is only touched if every range holds either the
+        bytes before or after the fix, otherwise it was changed by something else and is left alone.
+        Returns (files rewritten, bytes written, [(file, error)])"""
+        (rewritten, written, errors) = (0, 0, [])
+        for key in sorted(self.files):
+            file_name = os.path.join(self.root, key)
+            if not os.path.isfile(file_name):
+                errors.append((key, "file not found"))
+                continue
+            with buildTrace.span("rewrite_journal", file=os.path.basename(key)):
+                fd = os.open(file_name, os.O_RDWR | getattr(os, "O_BINARY", 0))
+                try:
+                    writes = []
+                    for patch in self.patches(key):
+                        (current, wanted) = (patch.new, patch.old) if not reapply else (patch.old, patch.new)
+                        data = pread(fd, len(wanted), patch.offset)
+                        if data == current:
+                            writes.append((wanted, patch.offset))
+                        elif data != wanted:
+                            errors.append((key, f"changed since it was fixed (offset {patch.offset})"))
+                            writes = None
+                            break
+                    for (data, offset) in writes or ():
+                        pwrite(fd, data, offset)
+                    size = sum(len(data) for (data, offset) in writes or ())
+                    buildTrace.count(bytes_written=size)
+                finally:
+                    os.close(fd)
+            if writes is not None:
+                self.set_state(file_name, JOURNAL_APPLIED if reapply else JOURNAL_REVERTED)
+                rewritten += 1 if writes else 0
+                written += size
+        self.save()
+        return rewritten, written, errors
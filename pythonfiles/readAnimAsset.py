@@ -1,19 +1,144 @@
 import os
 import sys
 import mmap
+import struct
+from array import array
 from collections import namedtuple
 from typing import Literal, Sequence
 import json
 
+try:
+    from .packageSummary import read_package_summary
+    from . import buildTrace
+    from .patchPlan import Patch, PatchPlan
+    from . import animSequence
+except ImportError:  # run as a script from inside pythonfiles
+    from packageSummary import read_package_summary
+    import buildTrace
+    from patchPlan import Patch, PatchPlan
+    import animSequence
+
 # little or big endian
 ENDIAN: Literal["little", "big"] = "little"
 BoneData = namedtuple('BoneData', 'bone_name_index parent_index')
+# size of an int32 in the uexp data. the bone tables are arrays of these
+INT_SIZE = 4
+
+
+class BoneTable:
+    """The bones of a skeleton, stored as two parallel int32 arrays of name indexes and parent indexes.
+    Works like a sequence of BoneData (indexing/iterating creates them on the fly), but code that handles
+    a lot of bones should use the arrays and accessors directly"""
+    __slots__ = ("name_indexes", "parent_indexes")
+
+    def __init__(self, name_indexes=(), parent_indexes=()):
+        self.name_indexes = name_indexes if isinstance(name_indexes, array) else array('i', name_indexes)
+        self.parent_indexes = parent_indexes if isinstance(parent_indexes, array) else array('i', parent_indexes)
+        if len(self.name_indexes) != len(self.parent_indexes):
+            raise ValueError("bone table needs the same number of name indexes and parent indexes")
+
+    @classmethod
+    def from_bones(cls, bones):
+        """Creates a table from any sequence of BoneData (returns the same table if it already is one)"""
+        if isinstance(bones, BoneTable):
+            return bones
+        return cls([bone.bone_name_index for bone in bones], [bone.parent_index for bone in bones])
+
+    def __len__(self):
+        return len(self.name_indexes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return BoneTable(self.name_indexes[index], self.parent_indexes[index])
+        return BoneData(self.name_indexes[index], self.parent_indexes[index])
+
+    def __iter__(self):
+        return map(BoneData, self.name_indexes, self.parent_indexes)
+
+    def __eq__(self, other):
+        if isinstance(other, BoneTable):
+            return self.name_indexes == other.name_indexes and self.parent_indexes == other.parent_indexes
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"BoneTable({len(self)} bones)"
+
+    def append(self, bone: BoneData):
+        self.name_indexes.append(bone.bone_name_index)
+        self.parent_indexes.append(bone.parent_index)
+
+    def bone_names(self, name_mappings):
+        """List of every bone's name, in bone order"""
+        return [name_mappings[name_index] for name_index in self.name_indexes]
+
+    def name_to_index(self, name_mappings):
+        """Dictionary of bone name to bone index"""
+        return dict((name_mappings[name_index], index) for index, name_index in enumerate(self.name_indexes))
+
+    def ancestors(self, index):
+        """Yields the indexes of every parent of a bone, from its direct parent up to the root bone"""
+        parent = self.parent_indexes[index]
+        while parent >= 0:
+            yield parent
+            parent = self.parent_indexes[parent]
+
+    def reordered(self, permutation):
+        """Returns a new table where bone i is bone permutation[i] of this table, with the parent indexes updated
+        to point at the parents' new positions"""
+        new_positions = array('i', bytes(INT_SIZE * len(permutation)))
+        for new_index, old_index in enumerate(permutation):
+            new_positions[old_index] = new_index
+        name_indexes = array('i', (self.name_indexes[old_index] for old_index in permutation))
+        parent_indexes = array('i', (-1 if self.parent_indexes[old_index] < 0
+                                     else new_positions[self.parent_indexes[old_index]] for old_index in permutation))
+        return BoneTable(name_indexes, parent_indexes)
 
 
 # Get the index name pairings of the skeleton form the header .uasset file. needed in order to remap the indexes to fit the original order
 def read_uasset(file_name):
     """Reads a .uasset file in order to return a dictionary of [int,str] name mappings,
     which in this case are used to determine bone names"""
+    try:
+        # the package summary has the name table offset and count, so no need to search the file for it
+        with buildTrace.span("read_uasset", file=os.path.basename(file_name)):
+            summary = read_package_summary(file_name)
+            buildTrace.count(bytes_read=len(summary.data))
+            return dict(enumerate(summary.names))
+    except (ValueError, IndexError, struct.error) as ex:
+        print(f"WARNING: Unable to read package summary of {file_name} ({ex}), searching for the name table instead")
+        return read_uasset_names_by_search(file_name)
+
+
+def read_package_path(file_name):
+    """Returns the package path of a .uasset, e.g. /Game/Pal/Model/Character/Skeleton/PinkCat/SK_PinkCat_Skeleton.
+    None if the package summary can't be read"""
+    try:
+        return read_package_summary(file_name).folder_name
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+
+
+def read_skeleton_reference(file_name):
+    """Returns the package path of the skeleton that an asset (animation, mesh) uses, found through the Skeleton
+    import in its .uasset's import table. None if the file can't be read or doesn't import a skeleton.
+    Class defaults (Default__Skeleton in /Script/Engine) are skipped, only skeletons in a /Game/ package count"""
+    try:
+        summary = read_package_summary(file_name)
+        buildTrace.count(bytes_read=len(summary.data))
+        for package_index in summary.imports_of_class("Skeleton"):
+            skeleton = summary.resolve(package_index)
+            if skeleton.outer_index == 0 or skeleton.object_name.startswith("Default__"):
+                continue
+            package_path = summary.object_path(skeleton.outer_index)
+            if package_path.startswith("/Game/"):
+                return package_path
+    except (OSError, ValueError, IndexError, struct.error):
+        pass
+    return None
+
+
+def read_uasset_names_by_search(file_name):
+    """Fallback for read_uasset, finds the name table by searching for the bytes around it"""
     name_mappings = {}  # maps index to bone name
 
     with open(file_name, "rb") as f:
@@ -39,11 +164,10 @@ def read_uasset(file_name):
 
 
 # read the skeleton data stored in the .uexp file (assuming its skeleton data)
-def read_skel_uexp(file_name) -> Sequence[BoneData]:
+def read_skel_uexp(file_name) -> "BoneTable":
     """Returns a sequence of bones that contains their name indexes and the array index of their parent bone.
     Getting the name of the bone requires the associate name index using the name_mappings from the .uasset file"""
-    bone_order = []  # order of bones by name index, and parent
-    with open(file_name, "rb") as f:
+    with buildTrace.span("read_skel_uexp", file=os.path.basename(file_name)), open(file_name, "rb") as f:
         with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
             root_bone_index = mm.find(
                 b'\xff\xff\xff\xff')  # root bone always has -1 for parent, making it easy to find in an AOB search
@@ -51,48 +175,99 @@ def read_skel_uexp(file_name) -> Sequence[BoneData]:
             bone_count = int.from_bytes(mm[start_index - 4:start_index], ENDIAN)
             # print(f"Number of bones: {bone_count}")
 
-            for i in range(bone_count):
-                bone_name_index = int.from_bytes(mm[start_index:start_index + 4], ENDIAN)
-                parent_index = int.from_bytes(mm[start_index + 8:start_index + 12], ENDIAN, signed=True)
-                bone_order.append(BoneData(bone_name_index, parent_index))
-                start_index += 12  # size of struct
-    return bone_order
+            # the bone table is an array of 12 byte structs (name index, name number, parent index), decode it in one go
+            with memoryview(mm) as view:
+                table = int_array_from_bytes(view[start_index:start_index + bone_count * 3 * INT_SIZE])
+            buildTrace.count(mmaps=1, bytes_read=bone_count * 3 * INT_SIZE)
+    return BoneTable(table[0::3], table[2::3])
 
 
-def write_anim_uexp_bone_index_order(file_name, bone_index_remap: {int, int}):
-    """Writes to a target animation file and updates the animation file's bone index order"""
-    if bone_index_remap is None: return
-    with open(file_name, "r+b") as f:
-        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
-            # since you can basically guarantee every sekeleton is in order at least for the first 3 bones, this dumb AOB search should work
-            # if someone sees this and knows a more reliable way to parse .uexp data, please let me know or create a GitHub issue!
-            bone_map_start = mm.find(b'\x00\x00\x00\x00\x01\x00\x00\x00\x02\x00\x00\x00')
-            if bone_map_start == -1:
-                print(
-                    f"The hacky solution for finding an animation's bone order failed for file {file_name}\nPlease let the creator of this tool know.")
-                return
-            anim_bone_count = int.from_bytes(mm[bone_map_start - 4:bone_map_start], ENDIAN)
-            data_offset = bone_map_start
-            for index in range(anim_bone_count):
-                new_index = bone_index_remap[index]
-                mm[data_offset:data_offset + 4] = int.to_bytes(new_index, 4, ENDIAN)
-                data_offset += 4
+def dense_bone_index_remap(bone_index_remap) -> array:
+    """Converts an {old index: new index} remap into a dense int32 array, where array[old index] = new index.
+    Converting once per skeleton means every animation can be remapped with a single slice instead of a dict lookup per bone"""
+    if isinstance(bone_index_remap, array):
+        return bone_index_remap
+    return array('i', (bone_index_remap[index] for index in range(len(bone_index_remap))))
 
 
-def write_skel_uexp_bone_order(file_name, bone_order: Sequence[BoneData]):
-    """Writes to a target skeleton .uexp file and updates the bone order data"""
-    if bone_order is None: return
+def int_array_to_bytes(values: array) -> bytes:
+    """Returns the raw bytes of an int32 array in the uexp's byte order"""
+    if sys.byteorder != ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def int_array_from_bytes(data) -> array:
+    """Reads raw uexp bytes into an int32 array"""
+    values = array('i')
+    values.frombytes(data)
+    if sys.byteorder != ENDIAN:
+        values.byteswap()
+    return values
+
+
+def plan_anim_uexp_bone_index_order(file_name, bone_index_remap: {int, int}, layout_cache=None):
+    """Returns the Patch that updates an animation file's bone index order, without writing anything.
+    With an animSequence.AnimLayoutCache, the track table is read from where it was found before in the same contents.
+    Returns None if the bone order could not be found in the file"""
+    if bone_index_remap is None: return None
+    remap = dense_bone_index_remap(bone_index_remap)
+    with buildTrace.span("plan_animation", file=os.path.basename(file_name)), open(file_name, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            table = animSequence.read_track_table(mm, len(remap), layout_cache, file_name)
+            if table is None:
+                return None
+            if table.count > len(remap):
+                raise KeyError(len(remap))  # animation has more bones than the skeleton remap knows about
+            # the whole table is one patch, track index i gets the remapped index of bone i
+            old = mm[table.offset:table.offset + table.count * INT_SIZE]
+            buildTrace.count(mmaps=1, bytes_read=len(old))
+    return Patch(table.offset, old, int_array_to_bytes(remap[:table.count]))
+
+
+def write_anim_uexp_bone_index_order(file_name, bone_index_remap: {int, int}) -> bool:
+    """Writes to a target animation file and updates the animation file's bone index order.
+    The remap can be a dict or an array from dense_bone_index_remap (faster when fixing many animations).
+    The file is mapped once and the whole table is written with one slice, builds go through
+    plan_anim_uexp_bone_index_order and a PatchPlan instead. Returns False if the bone order could not be found in the file"""
+    if bone_index_remap is None: return False
+    remap = dense_bone_index_remap(bone_index_remap)
     with open(file_name, "r+b") as f:
         with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
+            table = animSequence.read_track_table(mm, len(remap), file_name=file_name)
+            if table is None:
+                return False
+            if table.count > len(remap):
+                raise KeyError(len(remap))  # animation has more bones than the skeleton remap knows about
+            # track index i gets the remapped index of bone i
+            mm[table.offset:table.offset + table.count * INT_SIZE] = int_array_to_bytes(remap[:table.count])
+            buildTrace.count(mmaps=1, bytes_written=table.count * INT_SIZE)
+    return True
+
+
+def plan_skel_uexp_bone_order(file_name, bone_order: Sequence[BoneData]):
+    """Returns the Patches that update the bone order data of a skeleton .uexp file, without writing anything"""
+    if bone_order is None: return []
+    bone_order = BoneTable.from_bones(bone_order)
+    name_indexes = bone_order.name_indexes
+    parent_indexes = bone_order.parent_indexes
+    patches = []
+    with buildTrace.span("plan_skeleton", file=os.path.basename(file_name)), open(file_name, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
             bone_count = len(bone_order)
+            # both bone tables are arrays of 12 byte structs (3 int32s). each table is read once, the name index and
+            # parent/bone index columns are replaced using strided slices, and the whole table becomes one patch
+            table_size = bone_count * 3 * INT_SIZE
 
             root_bone_index = mm.find(b'\xff\xff\xff\xff')
             start_index = root_bone_index - 8
             data_start_index = root_bone_index - 12
-            for bone in bone_order:
-                mm[start_index:start_index + 4] = int.to_bytes(bone.bone_name_index, 4, ENDIAN)
-                mm[start_index + 8:start_index + 12] = int.to_bytes(bone.parent_index, 4, ENDIAN, signed=True)
-                start_index += 12
+            old = mm[start_index:start_index + table_size]
+            table = int_array_from_bytes(old)
+            table[0::3] = name_indexes
+            table[2::3] = parent_indexes
+            patches.append(Patch(start_index, old, int_array_to_bytes(table)))
 
             # now also update order at the end of the .uexp file
             # end location is  (# bones * (3 + 12 + 80 + 12) + header_end_index + 16 ) bytes
@@ -101,10 +276,21 @@ def write_skel_uexp_bone_order(file_name, bone_order: Sequence[BoneData]):
             # start index is at bone count index
             start_index += 4
 
-            for (index,bone) in enumerate(bone_order):
-                mm[start_index:start_index + 4] = int.to_bytes(bone.bone_name_index, 4, ENDIAN)
-                mm[start_index + 8: start_index + 12] = int.to_bytes(index, 4, ENDIAN)
-                start_index += 12
+            old = mm[start_index:start_index + table_size]
+            table = int_array_from_bytes(old)
+            table[0::3] = name_indexes
+            table[2::3] = array('i', range(bone_count))
+            patches.append(Patch(start_index, old, int_array_to_bytes(table)))
+            buildTrace.count(mmaps=1, bytes_read=table_size * 2)
+    return patches
+
+
+def write_skel_uexp_bone_order(file_name, bone_order: Sequence[BoneData]):
+    """Writes to a target skeleton .uexp file and updates the bone order data"""
+    if bone_order is None: return
+    plan = PatchPlan()
+    plan.add_patches(file_name, plan_skel_uexp_bone_order(file_name, bone_order))
+    plan.apply()
 
 
 def read_skel_assets_from_dir(working_dir, skel_asset_name=''):
@@ -0,0 +1,233 @@
+import os
+import sys
+import mmap
+import struct
+from array import array
+from collections import namedtuple
+
+try:
+    from . import buildTrace
+    from . import mapper
+    from .packageSummary import PackageReader
+    from .patchPlan import Patch
+    from .readAnimAsset import ENDIAN, INT_SIZE, int_array_from_bytes, int_array_to_bytes
+except ImportError:  # run as a script from inside pythonfiles
+    import buildTrace
+    import mapper
+    from packageSummary import PackageReader
+    from patchPlan import Patch
+    from readAnimAsset import ENDIAN, INT_SIZE, int_array_from_bytes, int_array_to_bytes
+
+# Reads and fixes the bone order of a cooked skeletal mesh (.uexp of an SK_ asset).
+# A mesh has its own copy of the skeleton's bones (the reference skeleton), and its render data refers to those bones
+# by index: each LOD lists the bones it needs (required bones, active bone indexes) and each section has a bone map.
+# The vertex influences (skin weights) index into their section's bone map rather than into the reference skeleton,
+# so remapping the bone maps remaps every vertex influence without touching the (large) vertex buffers.
+
+# size of a reference pose transform: rotation quaternion, translation and scale as doubles
+BONE_POSE_SIZE = 10 * 8
+# size of a cloth mapping entry (FMeshToMeshVertData) in a section's cloth mapping data
+CLOTH_VERTEX_SIZE = 64
+BONE_INDEX_SIZE = 2
+
+# offset and number of uint16 bone indexes of a table in the render data
+BoneIndexTable = namedtuple('BoneIndexTable', 'offset count')
+
+
+class MeshFormatError(ValueError):
+    """The mesh's .uexp doesn't have the layout this reader knows about, so it can't be fixed safely"""
+
+
+class MeshLayout:
+    """Where the bone data of a skeletal mesh .uexp is"""
+
+    def __init__(self, bone_count, bones_offset, pose_offset, name_map_offset):
+        self.bone_count = bone_count
+        self.bones_offset = bones_offset
+        self.pose_offset = pose_offset
+        self.name_map_offset = name_map_offset
+        # bone index tables whose order doesn't matter and are kept sorted (required bones, active bone indexes)
+        self.sorted_tables = []
+        # bone maps of the render sections, vertex influences index into these so their order has to stay
+        self.bone_maps = []
+
+
+def bone_indexes_from_bytes(data) -> array:
+    indexes = array('H', bytes(data))
+    if sys.byteorder != ENDIAN:
+        indexes.byteswap()
+    return indexes
+
+
+def bone_indexes_to_bytes(indexes: array) -> bytes:
+    if sys.byteorder != ENDIAN:
+        indexes = array('H', indexes)
+        indexes.byteswap()
+    return indexes.tobytes()
+
+
+def read_bone_index_table(reader, bone_count):
+    count = reader.int32()
+    if count < 0 or count > 0xffff:
+        raise MeshFormatError(f"invalid bone index table size {count} at offset {reader.offset - 4}")
+    table = BoneIndexTable(reader.offset, count)
+    indexes = bone_indexes_from_bytes(reader.data[reader.offset:reader.offset + count * BONE_INDEX_SIZE])
+    if len(indexes) != count or (count > 0 and max(indexes) >= bone_count):
+        raise MeshFormatError(f"bone index table at offset {table.offset} refers to bones the mesh doesn't have")
+    reader.skip(count * BONE_INDEX_SIZE)
+    return table
+
+
+def read_render_section(reader, layout):
+    """Reads a render section (FSkelMeshRenderSection), keeping the location of its bone map"""
+    reader.skip(2 + 2 + 4 + 4 + 4 + 1 + 4 + 4 + 4)  # strip flags, material, base index, triangles, tangent and shadow flags, base vertex
+    for _ in range(reader.int32()):  # cloth mapping data of each LOD
+        cloth_vertex_count = reader.int32()
+        if cloth_vertex_count < 0:
+            raise MeshFormatError(f"invalid cloth mapping data at offset {reader.offset - 4}")
+        reader.skip(cloth_vertex_count * CLOTH_VERTEX_SIZE)
+    layout.bone_maps.append(read_bone_index_table(reader, layout.bone_count))
+    (vertex_count, max_bone_influences) = reader.unpack("<ii")
+    if vertex_count < 0 or not 0 < max_bone_influences <= 12:
+        raise MeshFormatError(f"invalid render section at offset {reader.offset - 8}")
+    reader.skip(2 + 16 + 4)  # cloth asset index, clothing data (guid, asset LOD)
+    reader.skip(reader.int32() * INT_SIZE)  # duplicated vertices
+    reader.skip(reader.int32() * 2 * INT_SIZE)  # duplicated vertex index/length pairs
+    if reader.uint32() > 1:
+        raise MeshFormatError(f"invalid render section at offset {reader.offset - 4}")
+
+
+def read_reference_skeleton(data, count_offset):
+    """Returns the layout of the reference skeleton if its bone count is at count_offset, otherwise None"""
+    if count_offset < 0:
+        return None
+    bone_count = int.from_bytes(data[count_offset:count_offset + INT_SIZE], ENDIAN, signed=True)
+    bones_offset = count_offset + INT_SIZE
+    pose_count_offset = bones_offset + bone_count * 3 * INT_SIZE
+    if bone_count <= 0 or pose_count_offset + INT_SIZE > len(data):
+        return None
+    parents = int_array_from_bytes(data[bones_offset:pose_count_offset])[2::3]
+    if parents[0] != -1 or any(not 0 <= parent < index for index, parent in enumerate(parents) if index > 0):
+        return None
+    # the bones are followed by their reference pose and the name to index map, both with one entry per bone
+    name_map_count_offset = pose_count_offset + INT_SIZE + bone_count * BONE_POSE_SIZE
+    if name_map_count_offset + INT_SIZE > len(data) \
+            or int.from_bytes(data[pose_count_offset:pose_count_offset + INT_SIZE], ENDIAN) != bone_count \
+            or int.from_bytes(data[name_map_count_offset:name_map_count_offset + INT_SIZE], ENDIAN) != bone_count:
+        return None
+    return MeshLayout(bone_count, bones_offset, pose_count_offset + INT_SIZE, name_map_count_offset + INT_SIZE)
+
+
+def read_mesh_layout(data) -> MeshLayout:
+    """Finds the reference skeleton and the bone index tables of the render data in a skeletal mesh .uexp"""
+    # the root bone is the first bone with -1 as parent. -1 can also show up in the properties before the reference
+    # skeleton, so every match is checked until one is followed by a valid reference skeleton
+    layout = None
+    root_parent = data.find(b'\xff\xff\xff\xff')
+    while root_parent != -1 and layout is None:
+        layout = read_reference_skeleton(data, root_parent - 12)
+        root_parent = data.find(b'\xff\xff\xff\xff', root_parent + 1)
+    if layout is None:
+        raise MeshFormatError("reference skeleton not found")
+
+    reader = PackageReader(data, layout.name_map_offset + layout.bone_count * 3 * INT_SIZE)
+    if reader.uint32() != 1:
+        raise MeshFormatError("mesh has no cooked render data")
+    lod_count = reader.int32()
+    if lod_count != 1:
+        # the render data of the first LOD can't be skipped over to get to the next one
+        raise MeshFormatError(f"meshes with {lod_count} LODs aren't supported, only meshes with a single LOD")
+    reader.skip(2)  # strip flags
+    (cooked_out, inlined) = reader.unpack("<II")
+    layout.sorted_tables.append(read_bone_index_table(reader, layout.bone_count))  # required bones
+    if cooked_out or not inlined:
+        raise MeshFormatError("mesh render data is stored outside of the .uexp")
+    section_count = reader.int32()
+    if not 0 <= section_count <= 0xffff:
+        raise MeshFormatError(f"invalid render section count {section_count}")
+    for _ in range(section_count):
+        read_render_section(reader, layout)
+    layout.sorted_tables.append(read_bone_index_table(reader, layout.bone_count))  # active bone indexes
+    return layout
+
+
+def mesh_bone_remap(bone_names, mapping_data) -> array:
+    """Returns remap[old bone index] = new bone index for the bones of a mesh. Bones of the original skeleton go in the
+    order of the mapping and custom bones after them in their old order, the same as mapper.bone_order_from_mapping.
+    The mesh can have fewer bones than the skeleton, so the new indexes are packed together afterwards"""
+    if not isinstance(mapping_data, mapper.CompiledMapping):
+        mapping_data = mapper.compile_mapping(mapping_data)
+    original_count = len(mapping_data.bone_names)
+    name_to_index = mapping_data.name_to_index
+    slots = [name_to_index.get(name, original_count + index) for index, name in enumerate(bone_names)]
+    new_order = sorted(range(len(bone_names)), key=slots.__getitem__)
+    remap = array('i', bytes(INT_SIZE * len(new_order)))
+    for new_index, old_index in enumerate(new_order):
+        remap[old_index] = new_index
+    return remap
+
+
+def translate_indexes(indexes: array, remap: array) -> array:
+    """remap[index] for every index of the table, looked up by the array module in C instead of a python loop"""
+    return array(indexes.typecode, map(remap.__getitem__, indexes))
+
+
+def bone_index_table_patch(data, table, remap, keep_sorted):
+    old = bytes(data[table.offset:table.offset + table.count * BONE_INDEX_SIZE])
+    indexes = translate_indexes(bone_indexes_from_bytes(old), remap)
+    if keep_sorted:
+        indexes = array('H', sorted(indexes))
+    return Patch(table.offset, old, bone_indexes_to_bytes(indexes))
+
+
+def plan_mesh_bone_order(file_name, name_mappings, mapping_data):
+    """Returns the Patches that put the bones of a skeletal mesh .uexp in the order of the mapping, without writing
+    anything. name_mappings are the names of the mesh's .uasset. Raises MeshFormatError if the mesh can't be fixed"""
+    with buildTrace.span("plan_mesh", file=os.path.basename(file_name)), open(file_name, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            buildTrace.count(mmaps=1)
+            try:
+                layout = read_mesh_layout(data)
+            except (struct.error, IndexError) as ex:  # ran past the end of the file
+                raise MeshFormatError(f"unexpected end of the mesh data ({ex})")
+            bone_count = layout.bone_count
+            bones_size = bone_count * 3 * INT_SIZE
+            old_bones = data[layout.bones_offset:layout.bones_offset + bones_size]
+            table = int_array_from_bytes(old_bones)
+            (name_indexes, name_numbers, parents) = (table[0::3], table[1::3], table[2::3])
+            try:
+                bone_names = [name_mappings[name_index] for name_index in name_indexes]
+            except (KeyError, IndexError):
+                raise MeshFormatError("the mesh's bone names aren't in its .uasset")
+            remap = mesh_bone_remap(bone_names, mapping_data)
+            new_order = array('i', bytes(INT_SIZE * bone_count))
+            for old_index, new_index in enumerate(remap):
+                new_order[new_index] = old_index
+
+            new_table = array('i', bytes(bones_size))
+            new_table[0::3] = array('i', map(name_indexes.__getitem__, new_order))
+            new_table[1::3] = array('i', map(name_numbers.__getitem__, new_order))
+            new_table[2::3] = array('i', (-1 if parents[old_index] == -1 else remap[parents[old_index]]
+                                          for old_index in new_order))
+            if any(not parent < index for index, parent in enumerate(new_table[2::3])):
+                raise MeshFormatError("the new bone order puts a bone before its parent")
+            patches = [Patch(layout.bones_offset, old_bones, int_array_to_bytes(new_table))]
+
+            old_pose = data[layout.pose_offset:layout.pose_offset + bone_count * BONE_POSE_SIZE]
+            with memoryview(old_pose) as pose:
+                new_pose = b''.join(pose[old_index * BONE_POSE_SIZE:(old_index + 1) * BONE_POSE_SIZE]
+                                    for old_index in new_order)
+            patches.append(Patch(layout.pose_offset, old_pose, new_pose))
+
+            # the name to index map is rewritten in bone order, just like the skeleton's
+            old_name_map = data[layout.name_map_offset:layout.name_map_offset + bones_size]
+            new_name_map = array('i', new_table)
+            new_name_map[2::3] = array('i', range(bone_count))
+            patches.append(Patch(layout.name_map_offset, old_name_map, int_array_to_bytes(new_name_map)))
+
+            for bone_map in layout.bone_maps:
+                patches.append(bone_index_table_patch(data, bone_map, remap, keep_sorted=False))
+            for sorted_table in layout.sorted_tables:
+                patches.append(bone_index_table_patch(data, sorted_table, remap, keep_sorted=True))
+            buildTrace.count(bytes_read=sum(len(patch.old) for patch in patches))
+    return patches
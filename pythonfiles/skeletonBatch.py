@@ -0,0 +1,205 @@
+"""Batch version of mapper.py and skeletonReplacer.py, for processing a whole folder of exported skeletons at once.
+Never asks for input, so it can be used from scripts.
+
+usage:
+  python pythonfiles/skeletonBatch.py map INPUT... --output OUTPUT_FOLDER
+      creates a SKELETON-map.json for every skeleton .uasset/.uexp pair found in the inputs
+  python pythonfiles/skeletonBatch.py fix INPUT... (--mapping MAP.json | --mapping-dir FOLDER) (--output OUTPUT_FOLDER | --in-place)
+      fixes the bone order of every skeleton found in the inputs, using the mapping with the same skeleton name
+
+INPUT can be a .uasset/.uexp file, a folder (searched recursively for files matching --pattern) or a glob.
+Files found in a folder keep their path relative to that folder in the output folder.
+Exit code: 0 if every skeleton succeeded, 1 if any failed, 2 if there was nothing to do.
+"""
+import os
+import sys
+import json
+import glob
+import shutil
+import fnmatch
+import argparse
+import traceback
+import concurrent.futures
+from collections import namedtuple
+
+try:
+    from . import readAnimAsset as ream
+    from . import mapper
+except ImportError:  # run as a script from inside pythonfiles
+    import readAnimAsset as ream
+    import mapper
+
+DEFAULT_PATTERN = "*Skeleton.uasset"
+MAPPING_SUFFIX = "-map.json"
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_NOTHING_TO_DO = 2
+
+# uasset/uexp of a skeleton, and the path of its output relative to the output folder (without extension)
+SkeletonJob = namedtuple('SkeletonJob', 'uasset uexp relative_path')
+
+
+def find_skeletons(inputs, pattern=DEFAULT_PATTERN):
+    """Returns a SkeletonJob for every skeleton .uasset/.uexp pair in the inputs (files, folders or globs)"""
+    jobs = {}
+
+    def add(uasset, root=None):
+        uasset = os.path.abspath(uasset)
+        base = os.path.splitext(uasset)[0]
+        relative = os.path.relpath(base, root) if root else os.path.basename(base)
+        jobs.setdefault(uasset, SkeletonJob(uasset, f"{base}.uexp", relative))
+
+    for item in inputs:
+        paths = [item] if os.path.exists(item) else sorted(glob.glob(item, recursive=True))
+        for path in paths:
+            if os.path.isdir(path):
+                for folder, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        if fnmatch.fnmatch(name, pattern) and name.endswith(".uasset"):
+                            add(os.path.join(folder, name), path)
+            elif path.endswith((".uasset", ".uexp")):
+                add(f"{os.path.splitext(path)[0]}.uasset")
+    return list(jobs.values())
+
+
+def find_mappings(mapping_dir):
+    """Returns {skeleton name: mapping file} for every SKELETON-map.json in a folder (searched recursively)"""
+    mappings = {}
+    for folder, dirs, files in os.walk(mapping_dir):
+        for name in files:
+            if name.endswith(MAPPING_SUFFIX):
+                mappings.setdefault(name[:-len(MAPPING_SUFFIX)], os.path.join(folder, name))
+    return mappings
+
+
+def read_skeleton(job):
+    if not os.path.isfile(job.uasset) or not os.path.isfile(job.uexp):
+        raise FileNotFoundError(f"missing .uasset or .uexp for {os.path.splitext(job.uasset)[0]}")
+    return ream.read_uasset(job.uasset), ream.read_skel_uexp(job.uexp)
+
+
+def map_skeleton(job, output_dir):
+    """Creates the mapping file of one skeleton, returns the result record"""
+    (name_mappings, bone_order) = read_skeleton(job)
+    output = os.path.join(output_dir, f"{job.relative_path}{MAPPING_SUFFIX}")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    mapper.create_mapping_file(output, bone_order, name_mappings)
+    return {"output": output, "bones": len(bone_order)}
+
+
+def fix_skeleton(job, mapping_file, output_dir):
+    """Fixes the bone order of one skeleton, written to the output folder (or in place if output_dir is None)"""
+    if mapping_file is None:
+        raise FileNotFoundError(f"no mapping file for {os.path.basename(os.path.splitext(job.uasset)[0])}")
+    (name_mappings, bone_order) = read_skeleton(job)
+    mapping = mapper.load_mapping(mapping_file)
+    (new_bones, bone_index_remap) = mapper.bone_order_from_mapping(mapping, bone_order, name_mappings)
+    if len(new_bones) > len(bone_order):
+        raise ValueError(f"fixed bone list ({len(new_bones)} bones) is larger than the skeleton ({len(bone_order)} bones)")
+    uexp = job.uexp
+    if output_dir is not None:
+        output = os.path.join(output_dir, job.relative_path)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        shutil.copyfile(job.uasset, f"{output}.uasset")
+        shutil.copyfile(job.uexp, f"{output}.uexp")
+        uexp = f"{output}.uexp"
+    ream.write_skel_uexp_bone_order(uexp, new_bones)
+    return {"output": uexp, "mapping": mapping_file, "bones": len(new_bones)}
+
+
+def run_job(command, job, mapping_file, output_dir):
+    """Worker entry point, never raises so one bad skeleton doesn't stop the batch"""
+    result = {"uasset": job.uasset, "uexp": job.uexp}
+    try:
+        if command == "map":
+            result.update(map_skeleton(job, output_dir))
+        else:
+            result.update(fix_skeleton(job, mapping_file, output_dir))
+        result["status"] = STATUS_OK
+    except Exception as ex:
+        result["status"] = STATUS_FAILED
+        result["error"] = f"{type(ex).__name__}: {ex}"
+        result["traceback"] = traceback.format_exc()
+    return result
+
+
+def run_batch(command, jobs, output_dir, mapping_file=None, mapping_dir=None, workers=0):
+    """Runs every job on a pool of 'workers' processes (0 = one per cpu core). Returns the results in job order"""
+    mappings = find_mappings(mapping_dir) if mapping_dir else {}
+
+    def job_mapping(job):
+        return mapping_file or mappings.get(os.path.basename(os.path.splitext(job.uasset)[0]))
+
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, max(len(jobs), 1))
+    if workers == 1:
+        return [run_job(command, job, job_mapping(job), output_dir) for job in jobs]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, command, job, job_mapping(job), output_dir) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def batch_summary(command, results):
+    failed = [result for result in results if result["status"] != STATUS_OK]
+    return {
+        "command": command,
+        "processed": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Creates mappings for, or fixes the bone order of, many skeletons at once")
+    parser.add_argument("command", choices=("map", "fix"))
+    parser.add_argument("inputs", nargs="+", help=".uasset/.uexp files, folders or globs")
+    parser.add_argument("--output", "-o", help="folder to write mappings/fixed skeletons to")
+    parser.add_argument("--in-place", action="store_true", help="fix: overwrite the input .uexp files")
+    parser.add_argument("--mapping", help="fix: mapping file to use for every skeleton")
+    parser.add_argument("--mapping-dir", help="fix: folder with SKELETON-map.json files, matched by skeleton name")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN,
+                        help=f"file name pattern of skeleton .uasset files in input folders (default: {DEFAULT_PATTERN})")
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="number of worker processes (0 = one per cpu core)")
+    parser.add_argument("--summary", help="write the JSON summary to this file ('-' for stdout)")
+    parser.add_argument("--quiet", "-q", action="store_true", help="only print failures")
+    args = parser.parse_args(argv)
+
+    if args.command == "map" and not args.output:
+        parser.error("map needs --output")
+    if args.command == "fix":
+        if not args.mapping and not args.mapping_dir:
+            parser.error("fix needs --mapping or --mapping-dir")
+        if bool(args.output) == args.in_place:
+            parser.error("fix needs either --output or --in-place")
+
+    jobs = find_skeletons(args.inputs, args.pattern)
+    if len(jobs) == 0:
+        print("No skeleton .uasset/.uexp pairs found", file=sys.stderr)
+        return EXIT_NOTHING_TO_DO
+    output_dir = os.path.abspath(args.output) if args.output else None
+    results = run_batch(args.command, jobs, output_dir, args.mapping, args.mapping_dir, args.jobs)
+    summary = batch_summary(args.command, results)
+
+    log = sys.stderr if args.summary == "-" else sys.stdout
+    for result in results:
+        if result["status"] != STATUS_OK:
+            print(f"FAILED {result['uasset']}: {result['error']}", file=log)
+        elif not args.quiet:
+            print(f"{result['output']} ({result['bones']} bones)", file=log)
+    print(f"{summary['succeeded']} succeeded, {summary['failed']} failed", file=log)
+    if args.summary == "-":
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    elif args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+    return EXIT_OK if summary["failed"] == 0 else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""Index of every original skeleton in a folder of game files exported with FModel, saved in a SQLite database.
+Each skeleton's asset path and bones (name and parent, in bone order) are stored once, and bone names are indexed, so the
+original skeleton of a modded skeleton can be found by the bone names they share without reading any files again.
+ModBuilder.py uses it to create a mod's mapping automatically when its mapping folder has no copy of the original skeleton
+(see "skeleton_library" in config.json).
+
+usage:
+  python pythonfiles/skeletonLibrary.py index EXPORT_FOLDER... [--library skeleton-library.db] [--jobs N]
+      adds (or updates) every skeleton .uasset/.uexp pair in the folders. Unchanged files are skipped
+  python pythonfiles/skeletonLibrary.py match SKELETON.uasset [--library skeleton-library.db]
+      prints the original skeleton that best matches a (modded) skeleton
+"""
+import os
+import sys
+import sqlite3
+import argparse
+import traceback
+import concurrent.futures
+from collections import namedtuple
+
+try:
+    from . import readAnimAsset as ream
+    from . import mapper
+    from . import skeletonBatch
+except ImportError:  # run as a script from inside pythonfiles
+    import readAnimAsset as ream
+    import mapper
+    import skeletonBatch
+
+LIBRARY_VERSION = 1
+DEFAULT_LIBRARY_FILE = "skeleton-library.db"
+# share of the original skeleton's bones the modded skeleton needs to have for it to count as a match
+DEFAULT_MIN_COVERAGE = 0.9
+# skeletons sent to a worker process at once
+INDEX_CHUNK_SIZE = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS skeletons (
+    id INTEGER PRIMARY KEY,
+    uasset TEXT NOT NULL UNIQUE,
+    uexp TEXT NOT NULL,
+    asset_path TEXT,
+    bone_count INTEGER NOT NULL,
+    uasset_size INTEGER NOT NULL,
+    uasset_mtime INTEGER NOT NULL,
+    uexp_size INTEGER NOT NULL,
+    uexp_mtime INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bones (
+    skeleton_id INTEGER NOT NULL REFERENCES skeletons(id) ON DELETE CASCADE,
+    bone_index INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    parent_index INTEGER NOT NULL,
+    PRIMARY KEY (skeleton_id, bone_index)
+);
+CREATE INDEX IF NOT EXISTS bones_by_name ON bones(name, skeleton_id);
+"""
+
+# an indexed skeleton that shares 'shared' bone names with the skeleton it was matched against
+SkeletonMatch = namedtuple('SkeletonMatch', 'skeleton_id asset_path uasset uexp bone_count shared')
+
+
+def file_stamp(file_name):
+    stat = os.stat(file_name)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_skeleton(job):
+    """Worker process entry point: reads one skeleton, returns (job, asset path, [(bone name, parent index)], file
+    stamps, error). Never raises, so one broken file doesn't stop the others"""
+    try:
+        stamps = file_stamp(job.uasset) + file_stamp(job.uexp)
+        bones = ream.read_skel_uexp(job.uexp)
+        names = bones.bone_names(ream.read_uasset(job.uasset))
+        return job, ream.read_package_path(job.uasset), list(zip(names, bones.parent_indexes)), stamps, None
+    except Exception as ex:
+        return job, None, None, None, f"{type(ex).__name__}: {ex}"
+
+
+def read_skeletons(jobs, workers=0):
+    """Reads the skeletons on a pool of 'workers' processes (0 = one per cpu core), yielding the results of
+    read_skeleton as they come in"""
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, max(len(jobs), 1))
+    if workers == 1:
+        yield from map(read_skeleton, jobs)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(read_skeleton, jobs, chunksize=INDEX_CHUNK_SIZE)
+
+
+class SkeletonLibrary:
+    """The SQLite skeleton index. Use as a context manager to close the database afterwards"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    @classmethod
+    def open(cls, library_file=DEFAULT_LIBRARY_FILE, read_only=False):
+        if read_only:
+            connection = sqlite3.connect(f"file:{os.path.abspath(library_file)}?mode=ro", uri=True)
+        else:
+            connection = sqlite3.connect(library_file)
+            connection.executescript(SCHEMA)
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, LIBRARY_VERSION):
+                connection.close()
+                raise ValueError(f"{library_file} was made by a different version of this tool, delete it and index again")
+            connection.execute(f"PRAGMA user_version = {LIBRARY_VERSION}")
+        connection.execute("PRAGMA foreign_keys = ON")
+        return cls(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.connection.close()
+        return False
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM skeletons").fetchone()[0]
+
+    def index(self, inputs, pattern=skeletonBatch.DEFAULT_PATTERN, workers=0):
+        """Adds every skeleton found in the inputs (folders, files or globs, see skeletonBatch.find_skeletons), reading
+        only the ones that are new or changed since they were last indexed. Skeletons that were indexed from these
+        folders but are gone now are removed. Returns (skeletons read, skeletons unchanged, [(uasset, error)])"""
+        jobs = skeletonBatch.find_skeletons(inputs, pattern)
+        indexed = dict((uasset, (skeleton_id, stamps)) for (skeleton_id, uasset, *stamps) in self.connection.execute(
+            "SELECT id, uasset, uasset_size, uasset_mtime, uexp_size, uexp_mtime FROM skeletons"))
+        changed_jobs = []
+        for job in jobs:
+            previous = indexed.get(job.uasset)
+            try:
+                if previous is not None and tuple(previous[1]) == file_stamp(job.uasset) + file_stamp(job.uexp):
+                    continue
+            except OSError:
+                pass
+            changed_jobs.append(job)
+        errors = []
+        with self.connection:  # one transaction, so an interrupted index leaves the library as it was
+            found = set(job.uasset for job in jobs)
+            roots = [os.path.abspath(item) for item in inputs if os.path.isdir(item)]
+            for uasset, (skeleton_id, stamps) in indexed.items():
+                if uasset not in found and any(uasset.startswith(os.path.join(root, "")) for root in roots):
+                    self.connection.execute("DELETE FROM skeletons WHERE id = ?", (skeleton_id,))
+            for (job, asset_path, bones, stamps, error) in read_skeletons(changed_jobs, workers):
+                if error is not None:
+                    errors.append((job.uasset, error))
+                    continue
+                self.connection.execute("DELETE FROM skeletons WHERE uasset = ?", (job.uasset,))
+                skeleton_id = self.connection.execute(
+                    "INSERT INTO skeletons (uasset, uexp, asset_path, bone_count, uasset_size, uasset_mtime, "
+                    "uexp_size, uexp_mtime) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job.uasset, job.uexp, asset_path, len(bones)) + stamps).lastrowid
+                self.connection.executemany(
+                    "INSERT INTO bones (skeleton_id, bone_index, name, parent_index) VALUES (?, ?, ?, ?)",
+                    ((skeleton_id, index, name, parent) for index, (name, parent) in enumerate(bones)))
+        return len(changed_jobs) - len(errors), len(jobs) - len(changed_jobs), errors
+
+    def best_match(self, bone_names, asset_path=None, min_coverage=DEFAULT_MIN_COVERAGE):
+        """Returns the SkeletonMatch of the indexed skeleton that is most like a skeleton with these bones, or None.
+        Skeletons are ranked by how many bone names they share relative to both skeletons' bones together, so an
+        original with a few more bones loses against one that is exactly the modded skeleton minus its custom bones.
+        Ties go to the skeleton with the same asset path. At least min_coverage of the original's bones have to be in
+        bone_names"""
+        names = set(bone_names)
+        if not names:
+            return None
+        cursor = self.connection.cursor()
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS query_bones (name TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM query_bones")
+        cursor.executemany("INSERT INTO query_bones (name) VALUES (?)", ((name,) for name in names))
+        row = cursor.execute(
+            "SELECT s.id, s.asset_path, s.uasset, s.uexp, s.bone_count, COUNT(*) AS shared "
+            "FROM query_bones q JOIN bones b ON b.name = q.name JOIN skeletons s ON s.id = b.skeleton_id "
+            "GROUP BY s.id HAVING shared >= ? * s.bone_count "
+            "ORDER BY shared * 1.0 / (s.bone_count + ? - shared) DESC, s.asset_path IS ? DESC, s.bone_count ASC "
+            "LIMIT 1", (min_coverage, len(names), asset_path)).fetchone()
+        cursor.execute("DELETE FROM query_bones")
+        return SkeletonMatch(*row) if row is not None else None
+
+    def bones(self, skeleton_id):
+        """[(bone name, parent index)] of an indexed skeleton, in bone order"""
+        return list(self.connection.execute(
+            "SELECT name, parent_index FROM bones WHERE skeleton_id = ? ORDER BY bone_index", (skeleton_id,)))
+
+    def write_mapping(self, skeleton_id, mapping_file):
+        """Creates the mapping file of an indexed skeleton, the same file mapper.create_mapping_file makes from its
+        .uasset/.uexp"""
+        bones = self.bones(skeleton_id)
+        bone_order = [ream.BoneData(index, parent) for index, (name, parent) in enumerate(bones)]
+        mapper.create_mapping_file(mapping_file, bone_order, dict((index, name) for index, (name, parent) in enumerate(bones)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Indexes original skeletons exported with FModel, and finds the "
+                                                 "original of a modded skeleton")
+    parser.add_argument("command", choices=("index", "match"))
+    parser.add_argument("inputs", nargs="+", help="index: export folders, .uasset files or globs. match: a skeleton .uasset")
+    parser.add_argument("--library", default=DEFAULT_LIBRARY_FILE, help=f"SQLite file (default: {DEFAULT_LIBRARY_FILE})")
+    parser.add_argument("--pattern", default=skeletonBatch.DEFAULT_PATTERN,
+                        help=f"file name pattern of skeleton .uasset files (default: {skeletonBatch.DEFAULT_PATTERN})")
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="number of worker processes (0 = one per cpu core)")
+    args = parser.parse_args(argv)
+
+    if args.command == "index":
+        with SkeletonLibrary.open(args.library) as library:
+            (read, unchanged, errors) = library.index(args.inputs, args.pattern, args.jobs)
+            for (uasset, error) in errors:
+                print(f"FAILED {uasset}: {error}")
+            print(f"Indexed {read} skeletons ({unchanged} unchanged, {len(errors)} failed), "
+                  f"{len(library)} skeletons in {args.library}")
+        return 0 if not errors else 1
+    if not os.path.exists(args.library):
+        print(f"No skeleton library at {args.library}, create it with the index command first")
+        return 1
+    uasset = args.inputs[0]
+    try:
+        bone_names = ream.read_skel_uexp(f"{os.path.splitext(uasset)[0]}.uexp").bone_names(ream.read_uasset(uasset))
+    except Exception:
+        print(f"Could not read the skeleton {uasset}\n{traceback.format_exc()}")
+        return 1
+    with SkeletonLibrary.open(args.library, read_only=True) as library:
+        match = library.best_match(bone_names, ream.read_package_path(uasset))
+    if match is None:
+        print(f"No original skeleton in {args.library} matches {uasset}")
+        return 1
+    print(f"{match.asset_path} ({match.uasset}): {match.shared} of its {match.bone_count} bones are in the "
+          f"{len(bone_names)} bones of {os.path.basename(uasset)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
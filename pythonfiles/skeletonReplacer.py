@@ -1,6 +1,11 @@
 import sys
-import readAnimAsset as ream
-import mapper
+
+try:
+    from . import readAnimAsset as ream
+    from . import mapper
+except ImportError:  # run as a script from inside pythonfiles
+    import readAnimAsset as ream
+    import mapper
 if __name__ == "__main__":
     if len(sys.argv) < 4:
         print("not enough args")
@@ -25,8 +30,8 @@ if __name__ == "__main__":
     name_mappings = ream.read_uasset(uasset_file)
     bone_order = ream.read_skel_uexp(uexp_file)
 
-    mapping = mapper.read_mapping_file(mapping_file)
-    new_bones = mapper.bone_order_from_mapping(mapping, bone_order, name_mappings)
+    mapping = mapper.load_mapping(mapping_file)
+    (new_bones, bone_index_remap) = mapper.bone_order_from_mapping(mapping, bone_order, name_mappings)
     if not new_bones:
         quit()
 
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# Watches folders for changed files. Uses inotify on linux, and falls back to comparing
+# snapshots of the folders (size + mtime of every file) everywhere else.
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+INOTIFY_EVENT = struct.Struct("iIII")  # watch descriptor, mask, cookie, name length
+
+
+def snapshot_tree(root):
+    """Returns {file path: (size, mtime)} for every file under root"""
+    snapshot = {}
+    folders = [root]
+    while folders:
+        folder = folders.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            folders.append(entry.path)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                    except OSError:
+                        pass  # file was removed while scanning
+        except OSError:
+            pass
+    return snapshot
+
+
+class PollingWatcher:
+    """Finds changes by rescanning the watched folders every 'interval' seconds"""
+
+    def __init__(self, roots, interval=1.0):
+        self.roots = [root for root in roots if os.path.isdir(root)]
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        for root in self.roots:
+            snapshot.update(snapshot_tree(root))
+        return snapshot
+
+    def poll(self, timeout):
+        """Waits up to timeout seconds for changes, returns the set of changed (added/modified/removed) files"""
+        end = time.monotonic() + timeout
+        while True:
+            snapshot = self.take_snapshot()
+            changed = set(path for path, state in snapshot.items() if self.snapshot.get(path) != state)
+            changed.update(path for path in self.snapshot if path not in snapshot)
+            self.snapshot = snapshot
+            remaining = end - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Gets change events from the linux kernel, watching every sub folder of the roots"""
+
+    def __init__(self, roots):
+        libc_name = ctypes.util.find_library("c")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        for root in roots:
+            self.add_tree(root)
+
+    def add_watch(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), INOTIFY_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise OSError(error, "Out of inotify watches, raise fs.inotify.max_user_watches")
+            return
+        self.watches[wd] = folder
+
+    def add_tree(self, root):
+        if not os.path.isdir(root):
+            return
+        self.add_watch(root)
+        for folder, dirs, files in os.walk(root):
+            for name in dirs:
+                self.add_watch(os.path.join(folder, name))
+
+    def poll(self, timeout):
+        changed = set()
+        (readable, _, _) = select.select([self.fd], [], [], max(timeout, 0))
+        if not readable:
+            return changed
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                (wd, mask, cookie, length) = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\x00"))
+                offset += length
+                folder = self.watches.get(wd)
+                if folder is None:
+                    continue
+                path = os.path.join(folder, name) if name else folder
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # files might have been written to the new folder before it was watched
+                        self.add_tree(path)
+                        changed.update(snapshot_tree(path))
+                    continue
+                if mask & IN_DELETE_SELF:
+                    del self.watches[wd]
+                    continue
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(roots, interval=1.0):
+    """Returns an inotify watcher on linux, or a polling watcher if inotify isn't available"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError) as ex:
+            print(f"Unable to use inotify ({ex}), checking for changes every {interval} seconds instead")
+    return PollingWatcher(roots, interval)
+
+
+def wait_for_changes(watcher, debounce=2.0, timeout=None):
+    """Waits for a change, then keeps collecting changes until nothing has changed for 'debounce' seconds,
+    so a burst of files written by a cook is handled as a single change. Returns the set of changed files
+    (empty if timeout seconds passed without any change)"""
+    start = time.monotonic()
+    changed = set()
+    while not changed:
+        remaining = 1.0 if timeout is None else timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return changed
+        changed = watcher.poll(min(remaining, 1.0))
+    while True:
+        more = watcher.poll(debounce)
+        if not more:
+            return changed
+        changed.update(more)